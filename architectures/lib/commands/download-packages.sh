@@ -34,6 +34,11 @@ _tpaexec_command() {
                 shift
                 OPTS+=('-e' "download_dir=$download_dir")
                 ;;
+            --download-cache-dir)
+                download_cache_dir=${1:?"path to package cache directory not provided"}
+                shift
+                OPTS+=('-e' "download_cache_dir=$download_cache_dir")
+                ;;
             --exclude-packages)
                 package_names=${1:?"package name not specified"}
                 shift
@@ -90,6 +95,11 @@ e.g., local-repo/Debian/10 or local-repo/RedHat/8.
 Use '--download-dir /path/to/base/directory' to use a base directory
 other than $(pwd)/local-repo.
 
+Packages are also kept in a cache that is shared between clusters
+(default: ~/.cache/tpa/packages), so that packages downloaded for one
+cluster are copied rather than downloaded again for another. Use
+'--download-cache-dir /path/to/cache' to use a different directory.
+
 Use '--exclude-packages pkg1,pkg2,pkg3,…' to remove packages from the
 list of packages to download.
 HELP
@@ -0,0 +1,689 @@
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+# roles/init derives many facts from the cluster configuration, and it used
+# to do so with long chains of set_fact tasks. On large clusters, the cost of
+# dispatching each of those tasks to every host adds up, so this action
+# computes the same facts in a single task and returns them as `facts`:
+#
+#   - tpa_init_facts:
+#       stage: postgres
+#     register: _init_facts
+#
+#   - action: set_fact
+#     args: "{{ _init_facts.facts }}"
+#
+# The facts are set by a separate set_fact task so that they have the same
+# precedence as before (only set_fact can set facts that override inventory
+# variables). Each stage must produce exactly the same values, including
+# their types, as the tasks it replaces; lib/tests/test_init_facts.py runs
+# both against the same inventory and compares the results.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import ast
+import posixpath
+import re
+
+from ansible.errors import AnsibleActionFail, AnsibleUndefinedVariable
+from ansible.module_utils.common.text.converters import to_text
+from ansible.plugins.action import ActionBase
+from ansible.plugins.filter.core import to_bool
+from ansible.plugins.filter.mathstuff import union
+from ansible.plugins.test.core import version_compare
+from jinja2.filters import do_int
+
+_MISSING = object()
+
+
+def templated(value):
+    """
+    Returns the value that set_fact would set for "{{ value }}". Because
+    jinja2_native is not enabled, anything but a list, dict, or boolean is
+    turned into a string, and strings that look like lists, dicts, or
+    booleans are turned back into them.
+    """
+    if isinstance(value, (list, dict, bool)):
+        return value
+    out = to_text(value)
+    if out.startswith(("{", "[")) or out in ("True", "False"):
+        try:
+            return ast.literal_eval(out)
+        except (TypeError, ValueError, SyntaxError, MemoryError):
+            pass
+    return out
+
+
+def maxconn(max_connections):
+    """Returns 90% of the given max_connections (as a haproxy_maxconn)."""
+    return do_int(do_int(max_connections) * 0.90)
+
+
+def base_max_worker_processes(role, num_postgres_instances):
+    """
+    Returns the minimal number of workers for an instance with the given role:
+    one per PostgreSQL instance + one per database on that instance + two per
+    BDR enabled database + two per peer in the BDR group for each database.
+    """
+    n = num_postgres_instances
+    return (n + 1 * 8 + 2 * 2 + 2 * (n - 1) if "bdr" in role else 0) + 2 * n
+
+
+class Facts:
+    """
+    The variables of one host, as task_vars with the facts we have set so far
+    layered on top of them.
+    """
+
+    def __init__(self, templar, task_vars):
+        self.facts = {}
+        self.vars = dict(task_vars)
+        self.templar = templar
+        self.templar.available_variables = self.vars
+
+    def defined(self, name):
+        return name in self.vars
+
+    def get(self, name, default=_MISSING):
+        if name in self.facts:
+            return self.facts[name]
+        if name in self.vars:
+            return self.templar.template(self.vars[name])
+        if default is _MISSING:
+            raise AnsibleUndefinedVariable("'%s' is undefined" % name)
+        return default
+
+    def raw(self, name):
+        return self.vars[name]
+
+    def template(self, expr):
+        return self.templar.template(expr)
+
+    def set(self, **facts):
+        for name, value in facts.items():
+            self.facts[name] = value
+            self.vars[name] = value
+
+    def union(self, a, b):
+        return union(self.templar.environment, a, b)
+
+    def group(self, name):
+        return self.vars["groups"].get(name, [])
+
+
+def hostvars_facts(f):
+    """Sets the facts that roles/init/tasks/hostvars.yml needs at the start."""
+    f.set(target_environment=templated(f.get("target_environment", {})))
+
+    # The list 'ip_addresses' is a list of text strings which are the keys
+    # in the host vars whose values are ip addresses.
+    ip_addresses = []
+    for k in ("private_ip", "public_ip", "ip_address"):
+        if f.defined(k):
+            ip_addresses = f.union(ip_addresses, [k])
+    f.set(ip_addresses=ip_addresses)
+
+    if not f.defined("ip_address"):
+        if f.defined("private_ip"):
+            f.set(ip_address=templated(f.get("private_ip")))
+        else:
+            f.set(ip_address=templated(f.get("public_ip")))
+
+    f.set(hostname_aliases=templated(f.get("hostname_aliases", {})))
+
+    # For backwards compatibility, we translate postgresql_flavour to
+    # postgres_flavour, and 2q to pgextended.
+    if not f.defined("postgres_flavour") and f.defined("postgresql_flavour"):
+        f.set(postgres_flavour=templated(f.get("postgresql_flavour")))
+    if f.defined("postgres_flavour") and f.get("postgres_flavour") == "2q":
+        f.set(postgres_flavour="pgextended")
+
+    if not f.defined("failover_manager") and to_bool(f.get("enable_harp", False)):
+        f.set(failover_manager="harp")
+
+
+def postgres_basics_facts(f):
+    """
+    Sets the facts that roles/init/tasks/postgres.yml needs before it
+    looks at the data directory: postgres_flavour and the families it
+    belongs to, and the locations of the data and WAL directories.
+    """
+    flavour = templated(
+        f.get("postgres_flavour")
+        if f.defined("postgres_flavour")
+        else f.get("default_postgres_flavour")
+    )
+    f.set(
+        postgres_flavour=flavour,
+        postgres_family=(
+            flavour if flavour in ("edbpge", "epas") else "postgresql"
+        ),
+        postgres_family_extended=(
+            "pgextended" if flavour in ("pgextended", "edbpge") else flavour
+        ),
+    )
+
+    f.set(
+        postgres_data_dir=templated(
+            f.get("postgres_data_dir")
+            if f.defined("postgres_data_dir")
+            else f.get("default_postgres_data_dir")
+        )
+    )
+
+    wal_volumes = [
+        v for v in f.get("volumes") if v.get("volume_for") == "postgres_wal"
+    ]
+    if wal_volumes:
+        f.set(
+            default_postgres_wal_dir=templated(
+                "%s/pg_wal" % to_text(wal_volumes[0].get("mountpoint"))
+            )
+        )
+
+    f.set(
+        postgres_wal_dir=templated(
+            f.get("postgres_wal_dir")
+            if f.defined("postgres_wal_dir")
+            else f.get("default_postgres_wal_dir")
+        )
+    )
+
+
+def postgres_facts(f):
+    """
+    Sets the facts that roles/init/tasks/postgres.yml derives after it has
+    included bdr.yml (databases, haproxy and pgbouncer settings, DSNs,
+    extensions, and the defaults for memory and worker settings).
+    """
+    role = f.get("role")
+    inventory_hostname = f.get("inventory_hostname")
+    hostvars = f.raw("hostvars")
+    play_hosts = f.get("ansible_play_hosts", [])
+
+    def version(v, op):
+        return version_compare(f.get("postgres_version"), v, op)
+
+    def add_database(entry):
+        f.set(postgres_databases=f.union(f.get("postgres_databases"), [entry]))
+
+    def has_database(name):
+        return any(d.get("name") == name for d in f.get("postgres_databases"))
+
+    if "bdr" in role and not has_database(f.get("bdr_database")):
+        add_database(
+            {
+                "name": templated(f.get("bdr_database")),
+                "owner": templated(f.get("postgres_user")),
+                "extensions": [{"name": "bdr", "cascade": version("9.6", ">=")}],
+            }
+        )
+
+    # Add the database for pgbouncer_auth on all postgres nodes that are part
+    # of the main cluster (not the pemserver backend) when pgbouncer or harp
+    # is in use.
+    if (
+        "pem-server" not in role
+        and "postgres" in role
+        and (f.group("role_pgbouncer") or f.get("failover_manager") == "harp")
+        and f.get("pgbouncer_auth_database")
+        not in [d.get("name") for d in f.get("postgres_databases")]
+    ):
+        add_database(
+            {
+                "name": templated(f.get("pgbouncer_auth_database")),
+                "owner": templated(f.get("pgbouncer_auth_user")),
+            }
+        )
+
+    f.set(
+        haproxy_maxconn=templated(
+            f.get("haproxy_maxconn")
+            if f.defined("haproxy_maxconn")
+            else maxconn(f.get("max_connections"))
+        )
+    )
+
+    if f.defined("haproxy_backends") and not f.defined("haproxy_backend_servers"):
+        f.set(haproxy_backend_servers=templated(f.get("haproxy_backends")))
+
+    if not f.defined("haproxy_stats_socket"):
+        rhel8 = (
+            f.get("ansible_distribution") == "RedHat"
+            and do_int(f.get("ansible_distribution_major_version")) == 8
+        )
+        f.set(
+            haproxy_stats_socket=templated(
+                "/var/run/haproxy.sock"
+                if rhel8
+                else f.get("default_haproxy_stats_socket")
+            )
+        )
+
+    # If pgbouncer_backend points to a particular instance, we respect any
+    # custom haproxy_port or postgres_port setting for that instance.
+    backend = f.get("pgbouncer_backend")
+    if backend in hostvars:
+        backend_vars = hostvars[backend]
+        for k in ("haproxy_port", "postgres_port"):
+            if k in backend_vars:
+                f.set(pgbouncer_backend_port=templated(backend_vars[k]))
+                break
+
+    # On harp-proxy+pgbouncer instances, we configure pgbouncer to connect to
+    # harp-proxy.
+    if (
+        "pgbouncer" in role
+        and "harp-proxy" in role
+        and backend == f.get("default_pgbouncer_backend")
+    ):
+        if f.get("harp_proxy_mode") == "pgbouncer":
+            raise AnsibleActionFail(
+                "On a pgbouncer instance, harp_proxy_mode must not be "
+                "'pgbouncer' (try 'builtin')"
+            )
+        if do_int(f.get("harp_proxy_port")) == do_int(f.get("pgbouncer_port")):
+            f.set(harp_proxy_port=templated(do_int(f.get("harp_proxy_port")) + 1))
+        f.set(
+            pgbouncer_backend_port=templated(f.get("harp_proxy_port")),
+            harp_listen_address=templated(backend),
+        )
+
+    if "pgbouncer" in role:
+        f.set(
+            pgbouncer_max_client_conn=templated(
+                f.get("pgbouncer_max_client_conn")
+                if f.defined("pgbouncer_max_client_conn")
+                else _pgbouncer_max_client_conn(f, hostvars, play_hosts)
+            )
+        )
+
+    # Transform pgbouncer_databases into a new list where each item's
+    # 'options' is guaranteed to have host/port/auth_user set, and any 'dsn'
+    # has auth_user appended to it.
+    auth_user = f.get("pgbouncer_auth_user")
+    items = (
+        f.get("pgbouncer_databases")
+        if f.defined("pgbouncer_databases")
+        else f.get("default_pgbouncer_databases")
+    )
+    for item in items:
+        options = {"host": backend, "port": f.get("pgbouncer_backend_port")}
+        options.update(item.get("options", {}))
+        options.update({"auth_user": auth_user})
+        entry = {"name": item["name"], "options": options}
+        if "dsn" in item:
+            entry["dsn"] = "%s auth_user=%s" % (item.get("dsn"), auth_user)
+        f.set(
+            _pgbouncer_databases=templated(
+                f.union(f.get("_pgbouncer_databases", []), [entry])
+            )
+        )
+    f.set(pgbouncer_databases=templated(f.get("_pgbouncer_databases")))
+
+    f.set(
+        postgres_conf_dir=templated(
+            f.get("postgres_conf_dir", "") or f.get("postgres_data_dir")
+        ),
+        repmgr_conf_file=templated("%s/repmgr.conf" % to_text(f.get("repmgr_conf_dir"))),
+    )
+
+    # We must create postgres_wal_dir when it's not in its default location
+    # inside PGDATA only, to avoid making initdb and pg_basebackup unhappy.
+    f.set(
+        pg_wal_dir_outside_pgdata=(
+            posixpath.dirname(to_text(f.get("postgres_wal_dir")))
+            != f.get("postgres_data_dir")
+        )
+    )
+
+    if "postgres" in role and f.get("postgres_installation_method") == "src":
+        f.set(
+            postgres_bin_dir=templated(
+                "%s/bin" % to_text(f.get("postgres_install_dir"))
+            )
+        )
+
+    build_path = (
+        f.get("build_path")
+        if f.defined("build_path")
+        else f.get("default_build_path")
+    )
+    f.set(build_path=templated(":".join(to_text(p) for p in build_path)))
+
+    # These are all evaluated before any of them is set.
+    bdr_client_dsn_attributes = f.get("bdr_client_dsn_attributes", "")
+    attributes = {
+        k: f.get(k, "")
+        for k in (
+            "postgres_client_dsn_attributes",
+            "replica_client_dsn_attributes",
+            "barman_client_dsn_attributes",
+            "repmgr_client_dsn_attributes",
+            "bdr_client_dsn_attributes",
+            "harp_dcs_client_dsn_attributes",
+        )
+    }
+    attributes["streaming_barman_client_dsn_attributes"] = f.get(
+        "streaming_barman_client_dsn_attributes",
+        f.get("barman_client_dsn_attributes", ""),
+    )
+    for k in (
+        "pgd_proxy_dsn_attributes",
+        "bdr_connection_manager_dsn_attributes",
+        "pgd_cli_dsn_attributes",
+    ):
+        attributes[k] = f.get(k, bdr_client_dsn_attributes)
+    f.set(**{k: templated(v) for k, v in attributes.items()})
+
+    def t(name):
+        return to_text(f.get(name))
+
+    node = "host=%s port=%s" % (inventory_hostname, t("postgres_port"))
+    dsns = {
+        "dsn": "port=%s" % t("postgres_port"),
+        "postgres_dsn": "port=%s dbname=postgres" % t("postgres_port"),
+        "node_dsn": node,
+        "repmgr_node_dsn": "host=%s port=%s dbname=repmgr user=repmgr %s"
+        % (
+            to_text(f.get("repmgr_hostname", inventory_hostname)),
+            t("postgres_port"),
+            t("repmgr_client_dsn_attributes"),
+        ),
+        "replication_node_dsn": "%s dbname=postgres user=%s %s"
+        % (node, t("replication_user"), t("replica_client_dsn_attributes")),
+        "bdr_node_dsn": "%s dbname=%s user=%s %s"
+        % (node, t("bdr_database"), t("postgres_user"), t("bdr_client_dsn_attributes")),
+        "bdr_node_route_dsn": "%s dbname=%s user=%s %s"
+        % (node, t("bdr_database"), t("pgd_proxy_user"), t("pgd_proxy_dsn_attributes")),
+        "bdr_connection_manager_route_dsn": "%s dbname=%s user=%s %s"
+        % (
+            node,
+            t("bdr_database"),
+            t("postgres_user"),
+            t("bdr_connection_manager_dsn_attributes"),
+        ),
+        "bdr_node_local_dsn": "host=%s port=%s dbname=%s user=%s"
+        % (
+            to_text(next(iter(f.get("unix_socket_directories")))),
+            t("postgres_port"),
+            t("bdr_database"),
+            t("harp_manager_user"),
+        ),
+        "pgbouncer_node_dsn": "host=%s port=%s"
+        % (inventory_hostname, t("pgbouncer_port")),
+        "harp_dcs_node_dsn": "%s user=%s %s"
+        % (node, t("postgres_user"), t("harp_dcs_client_dsn_attributes")),
+        "pgd_cli_dsn": "%s dbname=%s user=%s %s"
+        % (node, t("bdr_database"), t("postgres_user"), t("pgd_cli_dsn_attributes")),
+    }
+    f.set(**{k: templated(v) for k, v in dsns.items()})
+
+    if "bdr" in role and not f.defined("max_prepared_transactions"):
+        f.set(max_prepared_transactions=16)
+
+    # Find any backed-up instance that is the upstream_primary, or a replica
+    # thereof.
+    if "postgres" in role:
+        f.set(
+            upstream_backedup=templated(
+                f.template(
+                    "{{ groups[cluster_tag]|instance_with_backup_of("
+                    "upstream_primary, inventory_hostname, hostvars) }}"
+                )
+            )
+        )
+
+    # If this is a PEM server instance, we need a database dedicated to PEM.
+    if "pem-server" in role and not has_database(f.get("pem_database")):
+        add_database(
+            {
+                "name": templated(f.get("pem_database")),
+                "owner": templated(f.get("postgres_user")),
+                "extensions": [{"name": "sslutils"}],
+                "languages": [{"name": "plpgsql"}],
+            }
+        )
+
+    f.set(
+        pemagent_extensions=templated(
+            f.get("pemagent_extensions")
+            if f.defined("pemagent_extensions")
+            else f.get("default_pemagent_extensions")
+        )
+    )
+
+    if f.defined("postgres_extensions"):
+        postgres_extensions = f.get("postgres_extensions")
+    else:
+        needs_pglogical = any(
+            x.get("type") == "pglogical"
+            for x in f.union(f.get("publications"), f.get("subscriptions"))
+        )
+        needs_pemagent_extensions = "pem-agent" in role and "postgres" in role
+        postgres_extensions = f.union(
+            f.union(
+                f.union(
+                    f.get("default_postgres_extensions"),
+                    f.get("extra_postgres_extensions", []),
+                ),
+                ["pglogical"] if needs_pglogical else [],
+            ),
+            f.get("pemagent_extensions") if needs_pemagent_extensions else [],
+        )
+    f.set(postgres_extensions=templated(postgres_extensions))
+
+    if "postgis" in f.get("postgres_extensions"):
+        postgis_version = (
+            f.get("postgis_version")
+            if f.defined("postgis_version")
+            else f.get("default_postgis_version")
+        )
+        for item in f.get("supported_postgis_versions"):
+            if re.match(item + ".*", postgis_version):
+                f.set(postgis_version_maj_min=item.split("."))
+
+    for (v, extension) in (("9.6", "pg_visibility"), ("15", "bluefin")):
+        if version(v, "<"):
+            f.set(
+                postgres_extensions=[
+                    e for e in f.get("postgres_extensions") if e != extension
+                ]
+            )
+
+    f.set(
+        postgres_extensions_dictionary=templated(
+            f.get("default_postgres_extensions_dictionary")
+        )
+    )
+
+    f.set(
+        platypus_port=templated(f.get("platypus_port", 6400)),
+        platypus_database=templated(
+            f.get("platypus_database")
+            if f.defined("platypus_database")
+            else (f.get("bdr_database") if "bdr" in role else "postgres")
+        ),
+    )
+
+    for k in ("shared_buffers", "effective_cache_size"):
+        if not f.get("%s_mb" % k):
+            mb = round(f.get("ansible_memtotal_mb") * f.get("%s_ratio" % k), 0)
+            f.set(**{"%s_mb" % k: int(mb)})
+
+    # Many of our estimates are based on the number of postgres instances in
+    # the cluster.
+    num_postgres_instances = len(f.group("role_postgres"))
+    twice_postgres_instances = num_postgres_instances * 2
+    f.set(
+        num_postgres_instances=num_postgres_instances,
+        twice_postgres_instances=twice_postgres_instances,
+    )
+    f.set(
+        max_wal_senders=templated(
+            f.get("max_wal_senders", twice_postgres_instances)
+        ),
+        max_replication_slots=templated(
+            f.get("max_replication_slots", twice_postgres_instances + 3)
+        ),
+    )
+
+    default_max_worker_processes = f.get("default_max_worker_processes")
+    f.set(
+        base_max_worker_processes=templated(
+            f.get("max_worker_processes")
+            if f.defined("max_worker_processes")
+            else base_max_worker_processes(role, num_postgres_instances)
+        )
+    )
+    f.set(
+        max_worker_processes=templated(
+            f.get("max_worker_processes")
+            if f.defined("max_worker_processes")
+            else max(
+                do_int(f.get("base_max_worker_processes")),
+                default_max_worker_processes,
+            )
+        )
+    )
+
+    if (
+        f.defined("backup")
+        and f.get("backup") in f.group("role_barman")
+        and not f.defined("archive_command")
+        and f.defined("barman_archiver")
+        and to_bool(f.get("barman_archiver")) is True
+    ):
+        f.set(archive_command=templated(f.get("default_barman_archive_command")))
+
+    # Raise max_worker_processes on replicas if the upstream needs more.
+    if "replica" in role and f.defined("upstream_primary"):
+        upstream = f.get("upstream_primary")
+        if upstream == inventory_hostname:
+            upstream_mwp = f.get("max_worker_processes")
+        elif upstream in play_hosts:
+            # The upstream is computing its max_worker_processes right now,
+            # so we have to work out what it will be.
+            upstream_vars = hostvars[upstream]
+            if "max_worker_processes" in upstream_vars:
+                upstream_mwp = upstream_vars["max_worker_processes"]
+            else:
+                upstream_mwp = max(
+                    base_max_worker_processes(
+                        upstream_vars["role"], num_postgres_instances
+                    ),
+                    upstream_vars.get(
+                        "default_max_worker_processes", default_max_worker_processes
+                    ),
+                )
+        else:
+            upstream_mwp = hostvars[upstream].get("max_worker_processes")
+        upstream_mwp = templated(upstream_mwp)
+        if do_int(upstream_mwp) > do_int(f.get("max_worker_processes")):
+            f.set(max_worker_processes=templated(upstream_mwp))
+
+    # We must install and configure harp on proxies and postgres instances
+    # that are eligible to be first_bdr_primary.
+    f.set(
+        initialise_harp=templated(
+            "harp-proxy" in role
+            or (
+                inventory_hostname in f.get("first_bdr_primary_candidates", [])
+                and f.get("failover_manager") == "harp"
+            )
+        )
+    )
+
+    if f.get("failover_manager") == "efm" and (
+        "downloader" in role
+        or (
+            ("efm-witness" in role or "postgres" in role)
+            and "pem-server" not in role
+        )
+    ):
+        f.set(role=f.union(role, ["efm"]))
+
+
+def _pgbouncer_max_client_conn(f, hostvars, play_hosts):
+    """
+    Returns 90% of max_connections for the backend Postgres server, or, if
+    pgbouncer points to haproxy running on the same host, the minimum
+    haproxy_maxconn of the haproxy_backend_servers.
+    """
+    role = f.get("role")
+    inventory_hostname = f.get("inventory_hostname")
+    backend = f.get("pgbouncer_backend")
+
+    if "harp-proxy" in role:
+        _backend = f.get("first_bdr_primary")
+    elif backend in ["127.0.0.1", "localhost", inventory_hostname]:
+        _backend = inventory_hostname
+    else:
+        _backend = backend
+    _backend = templated(_backend)
+
+    backend_maxconn = None
+    if _backend in hostvars:
+        backend_maxconn = hostvars[_backend].get("max_connections")
+    backend_maxconn = templated(backend_maxconn)
+
+    backend_is_haproxy = (
+        "haproxy" in role
+        and _backend == inventory_hostname
+        and f.get("pgbouncer_backend_port") == f.get("haproxy_port")
+    )
+
+    # The haproxy_maxconn of other hosts in the play is being set right now,
+    # so we have to work out what it will be.
+    maxconns = []
+    for h in f.get("haproxy_backend_servers", []):
+        if h == inventory_hostname:
+            maxconns.append(f.get("haproxy_maxconn"))
+        elif h in play_hosts:
+            h_vars = hostvars[h]
+            maxconns.append(
+                templated(
+                    h_vars["haproxy_maxconn"]
+                    if "haproxy_maxconn" in h_vars
+                    else maxconn(h_vars["max_connections"])
+                )
+            )
+        elif h in hostvars and "haproxy_maxconn" in hostvars[h]:
+            maxconns.append(hostvars[h]["haproxy_maxconn"])
+    haproxy_backend_maxconn = templated(min(maxconns)) if maxconns else False
+
+    return (backend_is_haproxy and haproxy_backend_maxconn) or (
+        maxconn(backend_maxconn) or f.get("default_pgbouncer_max_client_conn")
+    )
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+    _VALID_ARGS = frozenset(("stage",))
+
+    STAGES = {
+        "hostvars": hostvars_facts,
+        "postgres_basics": postgres_basics_facts,
+        "postgres": postgres_facts,
+    }
+
+    def run(self, tmp=None, task_vars=None):
+        if task_vars is None:
+            task_vars = dict()
+
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        stage = self._task.args.get("stage")
+        if stage not in self.STAGES:
+            raise AnsibleActionFail(
+                "stage must be one of: %s" % ", ".join(sorted(self.STAGES))
+            )
+
+        f = Facts(self._templar, task_vars)
+        self.STAGES[stage](f)
+
+        result["changed"] = False
+        result["facts"] = f.facts
+        return result
@@ -0,0 +1,183 @@
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+# We store a randomly-generated password for every secret that the cluster
+# needs in an encrypted file under inventory/group_vars/«cluster_tag»/secrets/
+# on the controller, where Ansible will find it on subsequent runs. This
+# action generates any of the given secrets that don't exist yet, encrypts
+# them with the cluster's vault password, and writes them all in one task:
+#
+#   - tpa_secrets:
+#       names: [postgres_password, repmgr_password]
+#     run_once: true
+#     no_log: true
+#     register: _secrets
+#
+#   - action: set_fact
+#     args: "{{ _secrets.secrets }}"
+#     run_once: true
+#     no_log: true
+#
+# It returns the values of any secrets that are not already defined (which
+# is to say, those that were just written, or written by another run after
+# the inventory was loaded) as `secrets`, so that they can be used right
+# away in the same run.
+#
+# The encryption key is the vault password that ansible-playbook was invoked
+# with, or if there isn't one, the output of «vault_password_file» (which is
+# run in the cluster directory, like use-vault).
+#
+# Each file is written to a temporary file and linked into place only if the
+# secret doesn't exist, so if two runs try to generate the same secret, both
+# will end up using whichever one was written first.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import subprocess
+import tempfile
+import textwrap
+
+from ansible.errors import AnsibleActionFail
+from ansible.module_utils.common.text.converters import to_bytes, to_text
+from ansible.parsing.vault import (
+    AnsibleVaultError,
+    VaultLib,
+    VaultSecret,
+    match_encrypt_secret,
+)
+from ansible.parsing.yaml.loader import AnsibleLoader
+from ansible.plugins.action import ActionBase
+
+from tpaexec.password import generate_password
+
+
+def secret_file_contents(name, ciphertext):
+    """
+    Returns the YAML for a file that sets the given name to the given vault
+    ciphertext, in the same format as `ansible-vault encrypt_string --name`.
+    """
+    return "%s: !vault |\n%s\n" % (
+        name,
+        textwrap.indent(to_text(ciphertext).strip(), " " * 10),
+    )
+
+
+def write_secret(path, contents):
+    """
+    Atomically creates a file with the given contents at the given path, and
+    returns True, or returns False if the file already exists.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    (fd, tmp) = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(contents)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return False
+    finally:
+        os.unlink(tmp)
+    return True
+
+
+def read_secret(path, name, vault_secrets):
+    """
+    Returns the decrypted value of the given name from the given secret file.
+    """
+    with open(path) as f:
+        data = AnsibleLoader(f, file_name=path, vault_secrets=vault_secrets)
+        return to_text(data.get_single_data()[name])
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+    _VALID_ARGS = frozenset(("names", "vault_password_file"))
+
+    def vault_secrets(self, cluster_dir):
+        """
+        Returns the vault secrets that ansible-playbook was invoked with, or
+        else the output of the given vault_password_file, if any.
+        """
+        secrets = self._loader._vault.secrets
+        if secrets:
+            return secrets
+
+        vault_password_file = self._task.args.get("vault_password_file")
+        if not vault_password_file:
+            raise AnsibleActionFail("no vault password available to encrypt secrets")
+        try:
+            password = subprocess.run(
+                [vault_password_file],
+                cwd=cluster_dir,
+                stdout=subprocess.PIPE,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise AnsibleActionFail(
+                "could not get vault password from %s: %s" % (vault_password_file, e)
+            )
+        if not password:
+            raise AnsibleActionFail(
+                "empty vault password from %s" % vault_password_file
+            )
+        return [("default", VaultSecret(to_bytes(password)))]
+
+    def run(self, tmp=None, task_vars=None):
+        if task_vars is None:
+            task_vars = dict()
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp  # tmp no longer has any effect
+
+        names = self._task.args.get("names") or []
+        if isinstance(names, str):
+            names = [names]
+        names = list(dict.fromkeys(names))
+
+        cluster_dir = task_vars["cluster_dir"]
+        secrets_dir = os.path.join(
+            cluster_dir, "inventory", "group_vars", task_vars["cluster_tag"], "secrets"
+        )
+        paths = {n: os.path.join(secrets_dir, "%s.yml" % n) for n in names}
+
+        # We need the vault password only if there's something to do.
+        needed = [
+            n for n in names if n not in task_vars or not os.path.exists(paths[n])
+        ]
+        if not needed:
+            return dict(result, changed=False, generated=[], secrets={})
+        if self._play_context.check_mode:
+            return dict(result, changed=False, skipped=True, generated=[], secrets={})
+
+        try:
+            vault_secrets = self.vault_secrets(cluster_dir)
+            (vault_id, secret) = match_encrypt_secret(vault_secrets)
+            vault = VaultLib(vault_secrets)
+
+            generated = []
+            secrets = {}
+            for name in needed:
+                path = paths[name]
+                if not os.path.exists(path):
+                    password = generate_password()
+                    ciphertext = vault.encrypt(
+                        password, secret=secret, vault_id=vault_id
+                    )
+                    if write_secret(path, secret_file_contents(name, ciphertext)):
+                        generated.append(name)
+                        if name not in task_vars:
+                            secrets[name] = password
+                        continue
+                if name not in task_vars:
+                    secrets[name] = read_secret(path, name, vault_secrets)
+        except (AnsibleVaultError, OSError, KeyError) as e:
+            raise AnsibleActionFail("could not generate secrets: %s" % e)
+
+        return dict(
+            result, changed=bool(generated), generated=generated, secrets=secrets
+        )
@@ -4,11 +4,40 @@
 # a remote host's availability. the upstream action plugin wait_for_connection
 # uses ping module to ensure end to end connectivity to a remote host, we change
 # this to use a raw `echo` command that includes a timestamp as return output.
+#
+# Running the raw test costs a complete ssh connection setup, and it can't
+# succeed before sshd is running, so we first wait until the ssh port accepts
+# connections and sends an SSH banner, which is much cheaper to check. Between
+# attempts, we wait for exponentially increasing (jittered) intervals, from
+# «sleep» up to «max_sleep» seconds. If the port can't be reached directly,
+# we fall back to trying the raw test anyway after 3×max_sleep seconds.
+#
+# We use `ssh -G` to find the address and port that ssh would connect to,
+# taking ssh_config into account. Hosts that ssh would reach through a jump
+# host (ProxyJump or ProxyCommand), or whose settings we can't determine,
+# are never probed directly.
+#
+# Given a list of «hosts», the action instead waits on the controller for the
+# ssh port of every host to be ready, checking all of them concurrently. It
+# returns as soon as all hosts are ready, with the time each one took. The
+# timeout defaults to 3×max_sleep seconds in this case, because this step is
+# only an optimisation:
+#
+#   - wait_for_ssh:
+#       hosts: "{{ ansible_play_hosts }}"
+#     run_once: true
+#
+# The raw test that follows for each host will then usually succeed at once.
 
 from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
+import random
+import shlex
+import socket
+import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from ansible.plugins.action import ActionBase
 
@@ -24,17 +53,109 @@ class TimedOutException(Exception):
     pass
 
 
+def backoff(initial, maximum, factor=2):
+    """
+    Yields an endless sequence of intervals that start at the given initial
+    value and grow by the given factor up to the given maximum, each reduced
+    by up to half at random (so that many hosts don't retry in lockstep).
+    """
+    interval = initial
+    while True:
+        yield random.uniform(interval / 2, interval)
+        interval = min(interval * factor, maximum)
+
+
+def ssh_banner(host, port, timeout):
+    """
+    Connects to the given host and port, and returns the SSH protocol banner
+    sent by the server, or raises an exception if there isn't one.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as s:
+        data = s.recv(256)
+    for line in data.splitlines():
+        if line.startswith(b"SSH-"):
+            return line.decode("ascii", "replace")
+    raise ConnectionError("no SSH banner from %s:%s" % (host, port))
+
+
+def ssh_settings(host, port=None, user=None, args=None):
+    """
+    Returns a dict of the settings that ssh would use to connect to the given
+    host (as printed by `ssh -G`, with lowercase names), or None if they can't
+    be determined.
+    """
+    cmd = ["ssh", "-G"] + list(args or [])
+    if port:
+        cmd += ["-o", "Port=%s" % port]
+    if user:
+        cmd += ["-o", "User=%s" % user]
+    cmd.append(host)
+    try:
+        p = subprocess.run(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except Exception:
+        return None
+    if p.returncode != 0:
+        return None
+
+    settings = {}
+    for line in p.stdout.splitlines():
+        (name, _, value) = line.partition(" ")
+        settings.setdefault(name.lower(), value)
+    return settings
+
+
+def wait_for_banner(host, port, timeout, connect_timeout, sleep, max_sleep):
+    """
+    Waits until the given host and port returns an SSH banner, and returns a
+    dict with the banner, the number of attempts, and the time taken, or an
+    error message if the timeout expired first.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    intervals = backoff(sleep, max_sleep)
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            banner = ssh_banner(host, port, connect_timeout)
+            return dict(
+                banner=banner,
+                attempts=attempts,
+                elapsed=round(time.monotonic() - start, 2),
+            )
+        except Exception as e:
+            error = e
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return dict(
+                failed=True,
+                msg="timed out waiting for ssh on %s:%s: %s" % (host, port, error),
+                attempts=attempts,
+                elapsed=round(time.monotonic() - start, 2),
+            )
+        time.sleep(min(next(intervals), remaining))
+
+
 class ActionModule(ActionBase):
     TRANSFERS_FILES = False
     DEFAULT_CONNECT_TIMEOUT = 5
     DEFAULT_DELAY = 0
     DEFAULT_SLEEP = 1
+    DEFAULT_MAX_SLEEP = 10
     DEFAULT_TIMEOUT = 600
+    DEFAULT_WORKERS = 50
 
     def do_until_success_or_timeout(
-        self, what, timeout, connect_timeout, what_desc, sleep=1
+        self, what, timeout, connect_timeout, what_desc, sleep=1, max_sleep=None
     ):
         max_end_time = datetime.utcnow() + timedelta(seconds=timeout)
+        intervals = backoff(sleep, max_sleep or sleep)
         e = None
         while datetime.utcnow() < max_end_time:
             try:
@@ -44,14 +165,46 @@ class ActionModule(ActionBase):
                 return
             except Exception as e:
                 error = e  # PY3 compatibility to store exception for use outside of this block
+                interval = next(intervals)
                 if what_desc:
                     display.debug(
-                        "wait_for_ssh: %s fail (expected), retrying in %d seconds..."
-                        % (what_desc, sleep)
+                        "wait_for_ssh: %s fail (expected), retrying in %.1f seconds..."
+                        % (what_desc, interval)
                     )
-                time.sleep(sleep)
+                time.sleep(interval)
         raise TimedOutException("timed out waiting for %s: %s" % (what_desc, error))
 
+    def ssh_address(self, host_vars, hostname):
+        """
+        Returns the (host, port) that ssh would connect to for the given host
+        variables, or None if we can't tell, or ssh would connect through a
+        jump host (or the host doesn't use ssh).
+        """
+        if host_vars.get("ansible_connection", "ssh") != "ssh":
+            return None
+        try:
+            (host, port, user, ssh_args) = self._templar.template(
+                [
+                    host_vars.get("ansible_host") or hostname,
+                    host_vars.get("ansible_port"),
+                    host_vars.get("ansible_user"),
+                    "%s %s"
+                    % (
+                        host_vars.get("ansible_ssh_common_args", ""),
+                        host_vars.get("ansible_ssh_extra_args", ""),
+                    ),
+                ]
+            )
+            settings = ssh_settings(host, port, user, shlex.split(ssh_args))
+            if settings is None:
+                return None
+            for proxy in ("proxyjump", "proxycommand"):
+                if settings.get(proxy, "none") != "none":
+                    return None
+            return (settings["hostname"], int(settings["port"]))
+        except Exception:
+            return None
+
     def run(self, tmp=None, task_vars=None):
         if task_vars is None:
             task_vars = dict()
@@ -59,15 +212,48 @@ class ActionModule(ActionBase):
             self._task.args.get("connect_timeout", self.DEFAULT_CONNECT_TIMEOUT)
         )
         delay = int(self._task.args.get("delay", self.DEFAULT_DELAY))
-        sleep = int(self._task.args.get("sleep", self.DEFAULT_SLEEP))
-        timeout = int(self._task.args.get("timeout", self.DEFAULT_TIMEOUT))
+        sleep = float(self._task.args.get("sleep", self.DEFAULT_SLEEP))
+        max_sleep = float(self._task.args.get("max_sleep", self.DEFAULT_MAX_SLEEP))
+        max_sleep = max(max_sleep, sleep)
+        hosts = self._task.args.get("hosts")
+        timeout = int(
+            self._task.args.get(
+                "timeout",
+                self.DEFAULT_TIMEOUT if hosts is None else 3 * max_sleep,
+            )
+        )
         if self._play_context.check_mode:
             display.vvv("wait_for_ssh: skipping for check_mode")
             return dict(skipped=True)
         result = super(ActionModule, self).run(tmp, task_vars)
         del tmp  # tmp no longer has any effect
 
+        start = datetime.now()
+        if delay:
+            time.sleep(delay)
+
+        if hosts is not None:
+            result.update(
+                self.wait_for_hosts(
+                    hosts, task_vars, timeout, connect_timeout, sleep, max_sleep
+                )
+            )
+            result["elapsed"] = (datetime.now() - start).seconds
+            return result
+
+        # Until the port answers, we don't try the raw test, unless we've
+        # waited long enough to suspect that it's not directly reachable.
+        address = self.ssh_address(task_vars, task_vars.get("inventory_hostname"))
+        probe_until = time.monotonic() + min(3 * max_sleep, timeout / 2)
+
         def raw_test(connect_timeout):
+            if address and "banner" not in result:
+                try:
+                    result["banner"] = ssh_banner(*address, connect_timeout)
+                except Exception:
+                    if time.monotonic() < probe_until:
+                        raise
+
             display.vvv("wait_for_ssh: attempting raw test")
 
             pong = "pong %s" % (int(time.time()))
@@ -75,12 +261,14 @@ class ActionModule(ActionBase):
             if pong not in raw_result["stdout_lines"]:
                 raise Exception("raw test failed")
 
-        start = datetime.now()
-        if delay:
-            time.sleep(delay)
         try:
             self.do_until_success_or_timeout(
-                raw_test, timeout, connect_timeout, what_desc="raw test", sleep=sleep
+                raw_test,
+                timeout,
+                connect_timeout,
+                what_desc="raw test",
+                sleep=sleep,
+                max_sleep=max_sleep,
             )
         except TimedOutException as e:
             result["failed"] = True
@@ -89,3 +277,55 @@ class ActionModule(ActionBase):
         result["elapsed"] = elapsed.seconds
 
         return result
+
+    def wait_for_hosts(
+        self, hosts, task_vars, timeout, connect_timeout, sleep, max_sleep
+    ):
+        """
+        Waits concurrently until the ssh port of each of the given hosts
+        returns an SSH banner, and returns the result for each host.
+        """
+        hostvars = task_vars.get("hostvars", {})
+        addresses = {}
+        skipped = []
+        for h in hosts:
+            address = self.ssh_address(hostvars.get(h, {}), h)
+            if address is None:
+                skipped.append(h)
+            else:
+                addresses[h] = address
+
+        workers = int(self._task.args.get("workers", self.DEFAULT_WORKERS))
+        workers = max(min(workers, len(addresses)), 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                h: pool.submit(
+                    wait_for_banner,
+                    host,
+                    port,
+                    timeout,
+                    connect_timeout,
+                    sleep,
+                    max_sleep,
+                )
+                for h, (host, port) in addresses.items()
+            }
+            results = {h: f.result() for h, f in futures.items()}
+
+        for h, r in results.items():
+            display.vv("wait_for_ssh: %s: %s" % (h, r.get("msg", r.get("banner"))))
+
+        failed = sorted(h for h, r in results.items() if r.get("failed"))
+        ready = {h: r["elapsed"] for h, r in results.items() if not r.get("failed")}
+        result = dict(hosts=results, skipped_hosts=skipped, failed_hosts=failed)
+        if failed:
+            result["failed"] = True
+            result["msg"] = "timed out waiting for ssh on %s" % ", ".join(failed)
+        elif ready:
+            slowest = max(ready, key=ready.get)
+            result["msg"] = "ssh is available on %d hosts (slowest: %s, %.1fs)" % (
+                len(ready),
+                slowest,
+                ready[slowest],
+            )
+        return result
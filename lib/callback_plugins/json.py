@@ -28,6 +28,57 @@ DOCUMENTATION = """
           - key: show_custom_stats
             section: defaults
         type: bool
+      stream:
+        name: Stream results as NDJSON
+        description:
+          - Instead of collecting all results and writing them as one JSON
+            document at the end of the run, write one compact JSON object per
+            line for each event (play_start, task_start, result, and stats)
+            as it happens.
+        default: False
+        env:
+          - name: ANSIBLE_JSON_STREAM
+        ini:
+          - key: stream
+            section: callback_json
+        type: bool
+      flush_interval:
+        name: Flush interval
+        description:
+          - In streaming mode, the maximum number of seconds for which output
+            is buffered before it is flushed (0 flushes after every event).
+        default: 1.0
+        env:
+          - name: ANSIBLE_JSON_FLUSH_INTERVAL
+        ini:
+          - key: flush_interval
+            section: callback_json
+        type: float
+      max_value_size:
+        name: Maximum size of dropped keys
+        description:
+          - If set, the keys of host results named in drop_keys are removed
+            when their value is larger than this many characters, and the
+            result's dropped_keys records the size of each removed value.
+        default: 0
+        env:
+          - name: ANSIBLE_JSON_MAX_VALUE_SIZE
+        ini:
+          - key: max_value_size
+            section: callback_json
+        type: int
+      drop_keys:
+        name: Keys that may be dropped
+        description:
+          - The keys of host results that are removed if they exceed
+            max_value_size.
+        default: [diff, stdout, stdout_lines, stderr, stderr_lines]
+        env:
+          - name: ANSIBLE_JSON_DROP_KEYS
+        ini:
+          - key: drop_keys
+            section: callback_json
+        type: list
     notes:
       - When using a strategy such as free, host_pinned, or a custom strategy, host results will
         be added to new task results in ``.plays[].tasks[]``. As such, there will exist duplicate
@@ -37,8 +88,8 @@ DOCUMENTATION = """
 
 import datetime
 import json
-
-from functools import partial
+import sys
+import time
 
 from ansible.inventory.host import Host
 from ansible.module_utils._text import to_text
@@ -53,6 +104,15 @@ def current_time():
     return "%sZ" % datetime.datetime.utcnow().isoformat()
 
 
+def value_size(value):
+    """Returns the approximate length of the given value as JSON."""
+    if isinstance(value, dict):
+        return sum(len(to_text(k)) + value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(value_size(v) for v in value) + len(value)
+    return len(to_text(value))
+
+
 class CallbackModule(CallbackBase):
     CALLBACK_VERSION = 2.0
     CALLBACK_TYPE = "stdout"
@@ -63,6 +123,22 @@ class CallbackModule(CallbackBase):
         self.results = []
         self._task_map = {}
         self._is_lockstep = False
+        self._stream = sys.stdout
+        self._last_flush = time.monotonic()
+
+    def _streaming(self):
+        return self.get_option("stream")
+
+    def _emit(self, event, **kwargs):
+        """Writes the given event as one line of JSON (in streaming mode)."""
+        line = json.dumps(
+            dict(event=event, **kwargs), cls=AnsibleJSONEncoder, separators=(",", ":")
+        )
+        self._stream.write(line + "\n")
+        now = time.monotonic()
+        if now - self._last_flush >= self.get_option("flush_interval"):
+            self._stream.flush()
+            self._last_flush = now
 
     def _new_play(self, play):
         self._is_lockstep = play.strategy in LOCKSTEP_CALLBACKS
@@ -90,25 +166,39 @@ class CallbackModule(CallbackBase):
         return self._task_map.get(key, self.results[-1]["tasks"][-1])
 
     def v2_playbook_on_play_start(self, play):
-        self.results.append(self._new_play(play))
+        new_play = self._new_play(play)
+        if self._streaming():
+            self._emit("play_start", play=new_play["play"])
+            return
+        self.results.append(new_play)
 
     def v2_runner_on_start(self, host, task):
         if self._is_lockstep:
             return
-        key = (host.get_name(), task._uuid)
         task_result = self._new_task(task)
+        if self._streaming():
+            self._emit("task_start", task=task_result["task"], host=host.get_name())
+            return
+        key = (host.get_name(), task._uuid)
         self._task_map[key] = task_result
         self.results[-1]["tasks"].append(task_result)
 
     def v2_playbook_on_task_start(self, task, is_conditional):
         if not self._is_lockstep:
             return
-        self.results[-1]["tasks"].append(self._new_task(task))
+        self._start_task(task)
 
     def v2_playbook_on_handler_task_start(self, task):
         if not self._is_lockstep:
             return
-        self.results[-1]["tasks"].append(self._new_task(task))
+        self._start_task(task)
+
+    def _start_task(self, task):
+        task_result = self._new_task(task)
+        if self._streaming():
+            self._emit("task_start", task=task_result["task"])
+            return
+        self.results[-1]["tasks"].append(task_result)
 
     def _convert_host_to_name(self, key):
         if isinstance(key, (Host,)):
@@ -136,6 +226,16 @@ class CallbackModule(CallbackBase):
             )
             global_custom_stats.update(custom_stats.pop("_run", {}))
 
+        if self._streaming():
+            self._emit(
+                "stats",
+                stats=summary,
+                custom_stats=custom_stats,
+                global_custom_stats=global_custom_stats,
+            )
+            self._stream.flush()
+            return
+
         output = {
             "plays": self.results,
             "stats": summary,
@@ -147,8 +247,23 @@ class CallbackModule(CallbackBase):
             json.dumps(output, cls=AnsibleJSONEncoder, indent=4, sort_keys=True)
         )
 
+    def _drop_large_values(self, result):
+        """Removes any drop_keys from the result that exceed max_value_size."""
+        max_size = self.get_option("max_value_size")
+        if not max_size:
+            return
+        dropped = {}
+        for k in self.get_option("drop_keys"):
+            if k in result:
+                size = value_size(result[k])
+                if size > max_size:
+                    del result[k]
+                    dropped[k] = size
+        if dropped:
+            result["dropped_keys"] = dropped
+
     def _record_task_result(self, on_info, result, **kwargs):
-        """This function is used as a partial to add failed/skipped info in a single method"""
+        """Records (or, in streaming mode, writes) a host's result for a task"""
         host = result._host
         task = result._task
 
@@ -157,11 +272,22 @@ class CallbackModule(CallbackBase):
         result_copy["action"] = task.action
         if result_copy.get("failed", False) and kwargs.get("ignore_errors", False):
             result_copy["failed"] = "ignored"
+        self._drop_large_values(result_copy)
+
+        end_time = current_time()
+        if self._streaming():
+            self._emit(
+                "result",
+                host=host.name,
+                task={"name": task.get_name(), "id": to_text(task._uuid)},
+                end=end_time,
+                result=result_copy,
+            )
+            return
 
         task_result = self._find_result_task(host, task)
 
         task_result["hosts"][host.name] = result_copy
-        end_time = current_time()
         task_result["task"]["duration"]["end"] = end_time
         self.results[-1]["play"]["duration"]["end"] = end_time
 
@@ -169,20 +295,14 @@ class CallbackModule(CallbackBase):
             key = (host.get_name(), task._uuid)
             del self._task_map[key]
 
-    def __getattribute__(self, name):
-        """Return ``_record_task_result`` partial with a dict containing skipped/failed if necessary"""
-        if name not in (
-            "v2_runner_on_ok",
-            "v2_runner_on_failed",
-            "v2_runner_on_unreachable",
-            "v2_runner_on_skipped",
-        ):
-            return object.__getattribute__(self, name)
+    def v2_runner_on_ok(self, result, **kwargs):
+        self._record_task_result({}, result, **kwargs)
 
-        on = name.rsplit("_", 1)[1]
+    def v2_runner_on_failed(self, result, **kwargs):
+        self._record_task_result({"failed": True}, result, **kwargs)
 
-        on_info = {}
-        if on in ("failed", "skipped"):
-            on_info[on] = True
+    def v2_runner_on_unreachable(self, result, **kwargs):
+        self._record_task_result({}, result, **kwargs)
 
-        return partial(self._record_task_result, on_info)
+    def v2_runner_on_skipped(self, result, **kwargs):
+        self._record_task_result({"skipped": True}, result, **kwargs)
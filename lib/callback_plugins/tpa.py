@@ -31,12 +31,16 @@ DOCUMENTATION = """
 
 """
 
-import inspect
+import sys
 
 from ansible import constants as C
 from ansible.plugins.callback.default import CallbackModule as CallbackModule_default
 from ansible.utils.color import stringc
 
+# The strategy calls us via TaskQueueManager.send_callback, so its frame is
+# only a few levels up; we stop looking well before the top of the stack.
+_MAX_STRATEGY_FRAME_DEPTH = 8
+
 
 class CallbackModule(CallbackModule_default):
     CALLBACK_VERSION = 2.0
@@ -91,17 +95,11 @@ class CallbackModule(CallbackModule_default):
                 self._uuid_stack.pop()
 
             # to establish the expected next task, we look at our caller's iterator
-            stack = inspect.stack()  # list of FrameInfo
-            try:
-                strategy_frame = stack[3].frame
-                iterator = strategy_frame.f_locals["iterator"]
-
-                next_task = iterator.all_tasks[iterator.cur_task]  #
+            iterator = self._strategy_iterator()
+            if iterator is not None:
+                next_task = iterator.all_tasks[iterator.cur_task]
                 if next_task is not None:
                     self._next_task_uuid = next_task._uuid
-            finally:
-                del strategy_frame
-                del iterator
 
             self._ok = 0
             self._changed = 0
@@ -110,6 +108,27 @@ class CallbackModule(CallbackModule_default):
 
             self._show_task_lead_line()
 
+    def _strategy_iterator(self):
+        """
+        Returns the PlayIterator that the strategy which started the current
+        task is using, by walking up the (few) frames between us and it.
+
+        We used to call inspect.stack() here, but that builds a FrameInfo for
+        every frame on the stack (and reads its source context) on every task.
+        """
+        frame = sys._getframe(1)
+        try:
+            for _ in range(_MAX_STRATEGY_FRAME_DEPTH):
+                frame = frame.f_back
+                if frame is None:
+                    break
+                iterator = frame.f_locals.get("iterator")
+                if iterator is not None and hasattr(iterator, "all_tasks"):
+                    return iterator
+        finally:
+            del frame
+        return None
+
     def v2_playbook_on_play_start(self, play):
         if self._use_standard_plugin:
             self._super.v2_playbook_on_play_start(play)
@@ -4,8 +4,6 @@
 #
 """AWS platform specific filters."""
 
-import copy
-
 from filter_plugins.instances import export_vars
 
 from ansible.errors import AnsibleFilterError
@@ -367,11 +365,10 @@ def expand_ec2_instance_image(old_instances, ec2_region_amis):
     """Filter to set the image for each instance, if not already specified."""
     instances = []
 
-    for old_instance in old_instances:
-        instance = copy.deepcopy(old_instance)
-
+    # We copy only the instances that we change, and nothing below them.
+    for instance in old_instances:
         if "image" not in instance:
-            instance["image"] = ec2_region_amis[instance["region"]]
+            instance = dict(instance, image=ec2_region_amis[instance["region"]])
 
         instances.append(instance)
 
@@ -388,7 +385,55 @@ def expand_ec2_instance_volumes(old_instances, ec2_ami_properties):
     * sets delete_on_termination to true if it's not implied by attach_existing or explicitly set to be false.
 
     """
+    return [
+        dict(instance, volumes=ec2_instance_volumes(instance, ec2_ami_properties))
+        for instance in old_instances
+    ]
+
+
+def expand_ec2_instances(
+    old_instances, ec2_region_amis, ec2_ami_properties, cluster_name, ec2_volumes=None
+):
+    """
+    Returns the result of expand_ec2_instance_image|expand_ec2_instance_volumes
+    |match_existing_volumes, but processes each instance only once.
+
+    Args:
+        old_instances: List of instances
+        ec2_region_amis: Map from region to the default image in that region
+        ec2_ami_properties: Map from image to its properties
+        cluster_name: Name of the cluster
+        ec2_volumes: List of existing ec2 volumes found
+
+    """
+    ec2_volumes = ec2_volumes or {}
     instances = []
+
+    for old_instance in old_instances:
+        instance = dict(old_instance)
+        if "image" not in instance:
+            instance["image"] = ec2_region_amis[instance["region"]]
+
+        # The volumes are new copies, so we can set volume_id in place.
+        volumes = ec2_instance_volumes(instance, ec2_ami_properties)
+        for volume in volumes:
+            volume_id = existing_volume_id(instance, volume, cluster_name, ec2_volumes)
+            if volume_id is not None:
+                volume["volume_id"] = volume_id
+
+        instance["volumes"] = volumes
+        instances.append(instance)
+
+    return instances
+
+
+def ec2_instance_volumes(instance, ec2_ami_properties):
+    """
+    Returns a list of copies of the given instance's volumes, transformed as
+    described for expand_ec2_instance_volumes.
+    """
+    volumes = []
+    ephemeral_count = 0
     EBS_KEYS = [
         "ebs",
         "encrypted",
@@ -399,73 +444,69 @@ def expand_ec2_instance_volumes(old_instances, ec2_ami_properties):
         "kms_key_id",
     ]
 
-    for old_instance in old_instances:
-        ephemeral_count = 0
-        instance = copy.deepcopy(old_instance)
-        volumes = []
-        for vol in instance.get("volumes", []):
-            volume = copy.deepcopy(vol)
-            _vars = volume.get("vars", {})
-            # we want to format our volume to match the new module
-            # ec2_instance. We either want an ebs volume or a store volume
-            # priorize ebs over ephemeral volume
-            if any(ebs_key in volume for ebs_key in EBS_KEYS):
-                ebs = volume.get("ebs", {})
-                volume_type = volume.pop("volume_type", "gp2")
-                ebs["encrypted"] = volume.pop("encrypted", False)
-                ebs["volume_type"] = volume_type
-                ebs["volume_size"] = volume.pop("volume_size")
-                ebs["delete_on_termination"] = volume.pop(
-                    "delete_on_termination", not volume.get("attach_existing", False)
-                )
-                if "iops" in volume and "iops" not in ebs:
-                    ebs["iops"] = volume.pop("iops")
-                if "kms_key_id" in volume and "kms_key_id" not in ebs:
-                    ebs["kms_key_id"] = volume.pop("kms_key_id")
-                volume.update({"ebs": ebs})
-                # remove ephemeral since this would not be taken into account
-                # by module since ebs options are defined.
-                if "ephemeral" in volume:
-                    volume.pop("ephemeral")
-            elif "ephemeral" in volume:
-                if instance and instance.get("type") not in EPHEMERAL_STORAGE:
-                    raise AnsibleFilterError(
-                        f"ephemeral storage unavailable for {instance['type']}")
-
-                max_ephemeral_storage = EPHEMERAL_STORAGE.get(instance["type"])
-                ephemeral_count += 1
-                if ephemeral_count > max_ephemeral_storage:
-                    error_msg = (
-                        f"cannot configure more than {max_ephemeral_storage} ephemeral storage "
-                        f"for instance {instance['type']}, at least {ephemeral_count} found.")
-                    raise AnsibleFilterError(error_msg)
-
-                volume["virtual_name"] = volume.pop("ephemeral")
-
-            if not (volume_type or "virtual_name" in volume):
+    for vol in instance.get("volumes", []):
+        # Shallow copies suffice, because we change only the top-level keys
+        # of each volume, and of its (also copied) ebs settings.
+        volume = dict(vol)
+        volume_type = None
+        _vars = volume.get("vars", {})
+        # we want to format our volume to match the new module
+        # ec2_instance. We either want an ebs volume or a store volume
+        # priorize ebs over ephemeral volume
+        if any(ebs_key in volume for ebs_key in EBS_KEYS):
+            ebs = dict(volume.get("ebs", {}))
+            volume_type = volume.pop("volume_type", "gp2")
+            ebs["encrypted"] = volume.pop("encrypted", False)
+            ebs["volume_type"] = volume_type
+            ebs["volume_size"] = volume.pop("volume_size")
+            ebs["delete_on_termination"] = volume.pop(
+                "delete_on_termination", not volume.get("attach_existing", False)
+            )
+            if "iops" in volume and "iops" not in ebs:
+                ebs["iops"] = volume.pop("iops")
+            if "kms_key_id" in volume and "kms_key_id" not in ebs:
+                ebs["kms_key_id"] = volume.pop("kms_key_id")
+            volume.update({"ebs": ebs})
+            # remove ephemeral since this would not be taken into account
+            # by module since ebs options are defined.
+            if "ephemeral" in volume:
+                volume.pop("ephemeral")
+        elif "ephemeral" in volume:
+            if instance and instance.get("type") not in EPHEMERAL_STORAGE:
                 raise AnsibleFilterError(
-                    f"volume_type/ephemeral not specified for volume {volume['device_name']}"
-                )
+                    f"ephemeral storage unavailable for {instance['type']}")
 
-            if volume["device_name"] == "root":
-                volume["device_name"] = ec2_ami_properties[instance["image"]][
-                    "root_device_name"
-                ]
-                if "mountpoint" in _vars or "volume_for" in _vars:
-                    raise AnsibleFilterError(
-                        "root volume cannot have mountpoint/volume_for set"
-                    )
-            volumes.append(volume)
+            max_ephemeral_storage = EPHEMERAL_STORAGE.get(instance["type"])
+            ephemeral_count += 1
+            if ephemeral_count > max_ephemeral_storage:
+                error_msg = (
+                    f"cannot configure more than {max_ephemeral_storage} ephemeral storage "
+                    f"for instance {instance['type']}, at least {ephemeral_count} found.")
+                raise AnsibleFilterError(error_msg)
 
-        instance["volumes"] = volumes
-        instances.append(instance)
+            volume["virtual_name"] = volume.pop("ephemeral")
 
-    return instances
+        if not (volume_type or "virtual_name" in volume):
+            raise AnsibleFilterError(
+                f"volume_type/ephemeral not specified for volume {volume['device_name']}"
+            )
+
+        if volume["device_name"] == "root":
+            volume["device_name"] = ec2_ami_properties[instance["image"]][
+                "root_device_name"
+            ]
+            if "mountpoint" in _vars or "volume_for" in _vars:
+                raise AnsibleFilterError(
+                    "root volume cannot have mountpoint/volume_for set"
+                )
+        volumes.append(volume)
+
+    return volumes
 
 def _detect_if_ips_are_private_only(aws_item):
     #default is True, meaning we must receive a public IP from amazon
     #unless user decides to not get one
-    assign_public_ip = aws_item["item"].get("assign_public_ip", True)
+    assign_public_ip = aws_item.get("assign_public_ip", True)
     return assign_public_ip == False
 
 def extract_instance_vars(ec2_jobs_results):
@@ -477,12 +518,12 @@ def extract_instance_vars(ec2_jobs_results):
         public_ip = netiface.get("association", {}).get("public_ip", "")
         instance = {
               "ip_address": netiface.get("private_ip_address") if private_ip_only else public_ip,
-              "Name": item['item'].get("Name"),
-              "node": item['item'].get("node"),
-              "add_to_inventory": not item['item'].get("provision_only"),
+              "Name": item.get("Name"),
+              "node": item.get("node"),
+              "add_to_inventory": not item.get("provision_only"),
               "platform": "aws",
               "public_ip" : public_ip,
-              "vars": export_vars(item["item"]),
+              "vars": export_vars(item),
               }
         instances.append(instance)
     return instances
@@ -501,41 +542,57 @@ def match_existing_volumes(old_instances, cluster_name, ec2_volumes=None):
     instances = []
     ec2_volumes = ec2_volumes or {}
     for instance in old_instances:
+        volumes = []
         for volume in instance.get("volumes", []):
-            if not volume.get("attach_existing", False):
-                continue
-
-            name = ":".join(
-                [
-                    instance["region"],
-                    cluster_name,
-                    str(instance["node"]),
-                    volume["device_name"],
-                ]
-            )
-            if name in ec2_volumes:
-                ec2_volume = ec2_volumes[name]
-
-                if (
-                    volume["ebs"]["volume_size"] != ec2_volume["size"]
-                    or volume.get("iops", ec2_volume["iops"]) != ec2_volume["iops"]
-                    or volume.get("volume_type", ec2_volume["type"])
-                    != ec2_volume["type"]
-                ):
-                    continue
+            volume_id = existing_volume_id(instance, volume, cluster_name, ec2_volumes)
+            if volume_id is not None:
+                volume = dict(volume, volume_id=volume_id)
+            volumes.append(volume)
 
-                volume["volume_id"] = ec2_volume["id"]
+        if volumes != instance.get("volumes", []):
+            instance = dict(instance, volumes=volumes)
 
         instances.append(instance)
 
     return instances
 
 
+def existing_volume_id(instance, volume, cluster_name, ec2_volumes):
+    """
+    Returns the id of the existing volume that the given instance's volume
+    should be attached to, or None if there isn't one.
+    """
+    if not volume.get("attach_existing", False):
+        return None
+
+    name = ":".join(
+        [
+            instance["region"],
+            cluster_name,
+            str(instance["node"]),
+            volume["device_name"],
+        ]
+    )
+    if name not in ec2_volumes:
+        return None
+
+    ec2_volume = ec2_volumes[name]
+    if (
+        volume["ebs"]["volume_size"] != ec2_volume["size"]
+        or volume.get("iops", ec2_volume["iops"]) != ec2_volume["iops"]
+        or volume.get("volume_type", ec2_volume["type"]) != ec2_volume["type"]
+    ):
+        return None
+
+    return ec2_volume["id"]
+
+
 class FilterModule:
     def filters(self):
         return {
             "expand_ec2_instance_image": expand_ec2_instance_image,
             "expand_ec2_instance_volumes": expand_ec2_instance_volumes,
+            "expand_ec2_instances": expand_ec2_instances,
             "extract_instance_vars": extract_instance_vars,
             "match_existing_volumes": match_existing_volumes,
         }
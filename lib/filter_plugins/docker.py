@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+#
+"""Docker platform specific filters."""
+
+from ansible.errors import AnsibleFilterError
+
+
+def docker_container_results(container_info_results, docker_networks=None):
+    """
+    Takes the results of docker_container_info for each instance and
+    returns each inspected container with its instance, and the instance's
+    private_ip, added as 'item'.
+
+    The private_ip is the container's IPAddress if it has one, or else its
+    address on the first of the docker_networks.
+    """
+    network = (docker_networks or [{}])[0].get("name")
+
+    results = []
+    for r in container_info_results:
+        container = r["container"]
+        instance = r["item"]
+
+        n = container["NetworkSettings"]
+        private_ip = n.get("IPAddress")
+        if not private_ip:
+            try:
+                private_ip = n["Networks"][network]["IPAddress"]
+            except (KeyError, TypeError):
+                raise AnsibleFilterError(
+                    "Docker container %s has no IP address on network %s"
+                    % (instance["Name"], network)
+                )
+
+        results.append(dict(container, item=dict(instance, private_ip=private_ip)))
+
+    return results
+
+
+class FilterModule:
+    def filters(self):
+        return {
+            "docker_container_results": docker_container_results,
+        }
@@ -4,11 +4,13 @@
 
 import copy
 import csv
+import fnmatch
 import re
 import sys
 import shlex
 import os.path
 from collections.abc import Mapping, MutableMapping
+from urllib.parse import unquote
 
 from jinja2.runtime import StrictUndefined
 from ansible.errors import AnsibleFilterError
@@ -49,8 +51,30 @@ def doublequote(str):
     return '"%s"' % str.replace('"', '"')
 
 
-# Given a hostname and hostvars, returns the name of the earliest ancestor that
-# doesn't have an upstream defined.
+# Given a list of hostnames and hostvars, returns a dict that maps each primary
+# or replica instance (or any other instance with an upstream) to a dict of just
+# the settings that determine the physical replication topology («role»,
+# «upstream», «backup», and «region»). roles/init computes this once per play as
+# «replication_topology», and it can be passed to upstream_root,
+# instance_with_backup_of, and physical_replication_group instead of hostvars,
+# so that they don't need to look at (and template) the vars of every host each
+# time they are called.
+
+
+def replication_topology(hosts, hostvars):
+    topology = {}
+    for h in hosts:
+        v = hostvars[h]
+        role = v.get("role") or []
+        if "primary" in role or "replica" in role or v.get("upstream"):
+            topology[h] = dict(
+                (k, v[k]) for k in ("role", "upstream", "backup", "region") if k in v
+            )
+    return topology
+
+
+# Given a hostname and hostvars (or replication_topology), returns the name of
+# the earliest ancestor that doesn't have an upstream defined.
 
 
 def upstream_root(h, hostvars):
@@ -60,7 +84,7 @@ def upstream_root(h, hostvars):
 
 
 # Given a list of hostnames and the names of a primary instance and some other
-# instance (and a copy of hostvars), returns the name of an instance that has
+# instance (and a copy of hostvars, or replication_topology), returns the name of an instance that has
 # «backup: xxx» defined and is descended from the primary. It will prefer the
 # first backed-up instance in the same region as "somehost", otherwise return
 # the first backed-up instance. Returns None if no instances match.
@@ -71,15 +95,14 @@ def instance_with_backup_of(hosts, primary, somehost, hostvars):
 
     for h in hosts:
         if (
-            hostvars[h].get("backup", "") != ""
+            hostvars.get(h, {}).get("backup", "") != ""
             and upstream_root(h, hostvars) == primary
         ):
             candidates.append(h)
 
+    region = hostvars.get(somehost, {}).get("region", "right")
     for backedup in candidates:
-        if hostvars[backedup].get("region", "left") == hostvars[somehost].get(
-            "region", "right"
-        ):
+        if hostvars[backedup].get("region", "left") == region:
             return backedup
     if candidates:
         return candidates[0]
@@ -152,6 +175,84 @@ def packages_for(packages, os, version=None):
     return ret
 
 
+# Given a list of package names (with or without "=version" specifications,
+# which may contain wildcards) and the "Package:" and "Version:" lines that
+# `apt-cache show -a` prints for the versioned packages, this function
+# replaces each versioned specification with the last matching version that
+# is available, and returns the resulting list along with the names of the
+# versioned packages. Specifications that don't match any available version
+# are left unchanged (so that the download will fail clearly).
+
+
+def resolve_package_versions(package_list, apt_cache_lines):
+    versions = {}
+    name = None
+    for line in apt_cache_lines:
+        (field, _, value) = line.partition(":")
+        if field == "Package":
+            name = value.strip()
+        elif field == "Version" and name is not None:
+            versions.setdefault(name, []).append(value.strip())
+
+    packages = []
+    versioned = []
+    for spec in package_list:
+        if "=" not in spec:
+            packages.append(spec)
+            continue
+        (name, pattern) = spec.split("=", 1)
+        matches = [
+            v
+            for v in versions.get(name, [])
+            if fnmatch.fnmatch(v, pattern) or fnmatch.fnmatch(v, "*:" + pattern)
+        ]
+        packages.append("%s=%s" % (name, matches[-1]) if matches else spec)
+        versioned.append(name)
+
+    return {"packages": packages, "versioned": versioned}
+
+
+# Given the output of `apt-get download --print-uris`, which contains lines
+# of the form "'uri' filename size ALGO:checksum", this function returns a
+# list of hashes with the filename, the checksum (as "algo:hex", using the
+# hashlib name of the algorithm), and a package=version spec that `apt-get
+# download` will accept, for each package. apt prints the strongest hash
+# that the repository provides, which may be SHA512, SHA256, SHA1, or
+# MD5Sum; the sha256 is included only if that's what we got. Packages with
+# a checksum we don't recognise are included without one.
+
+_apt_hash_algorithms = {
+    "SHA512": "sha512",
+    "SHA256": "sha256",
+    "SHA1": "sha1",
+    "MD5Sum": "md5",
+}
+
+
+def apt_download_uris(lines):
+    ret = []
+
+    for line in lines:
+        words = line.split()
+        if len(words) != 4 or not words[0].startswith("'"):
+            continue
+        filename = words[1]
+        (name, version) = filename.split("_")[:2]
+        package = {
+            "filename": filename,
+            "spec": "%s=%s" % (name, unquote(version)),
+        }
+        (algorithm, _, checksum) = words[3].partition(":")
+        algorithm = _apt_hash_algorithms.get(algorithm)
+        if algorithm and checksum:
+            package["checksum"] = "%s:%s" % (algorithm, checksum.lower())
+            if algorithm == "sha256":
+                package["sha256"] = checksum.lower()
+        ret.append(package)
+
+    return ret
+
+
 # Given a hash that maps group names to lists of group members (such as the
 # global variable "groups"), a group name, and a list of groups to exclude, this
 # function returns the members of the named group that are not members of any of
@@ -338,11 +439,12 @@ def ternary_format(val, expr, true_string, false_string, **kwargs):
     return s.format(value=val, **kwargs)
 
 
-# Given the name of an instance (and hostvars), returns a list of names of
-# instances that are related by physical replication, starting with the primary
-# (cf. upstream_root above), followed by replicas/descendants (and including the
-# instance itself) based on their upstream setting. Returns an empty list if the
-# instance is not part of such a replication group.
+# Given the name of an instance (and hostvars, or replication_topology), returns
+# a list of names of instances that are related by physical replication,
+# starting with the primary (cf. upstream_root above), followed by
+# replicas/descendants (and including the instance itself) based on their
+# upstream setting. Returns an empty list if the instance is not part of such a
+# replication group.
 
 
 def physical_replication_group(h, hostvars):
@@ -454,20 +556,26 @@ def pyformat_hostvars(hostname, format_str, hostvars):
     return format_str.format(**hostvars.get(hostname, {}))
 
 
-def expected_replication_slots(replica_list, inventory_hostname):
+def expected_replication_slots(replica_list, inventory_hostname=None):
     """
     Deep copy a variable inside a clean dict to ensure the variable is correctly
     formatted as dict. This filter is added due to an issue while switching to
     aws_ec2 inventory plugin. hostvars were not returned corectly. this would
     result in expected replication slots to be returned as "" or "\n".
+
+    Without inventory_hostname, returns a dict that maps each upstream host to
+    its list of expected slots, so that they can be computed once for all hosts.
     """
-    expected_slots = []
+    expected_slots = {}
     for replica in replica_list:
         pcp = replica.get("primary_conninfo_parts", {})
-        if inventory_hostname == pcp.get("host"):
-            if replica.get("primary_slot_name"):
-                expected_slots.append(replica.get("primary_slot_name"))
-    return expected_slots
+        if pcp.get("host") and replica.get("primary_slot_name"):
+            expected_slots.setdefault(pcp.get("host"), []).append(
+                replica.get("primary_slot_name")
+            )
+    if inventory_hostname is None:
+        return expected_slots
+    return expected_slots.get(inventory_hostname, [])
 
 
 def select_by_hostvar(hostnames, hostvars, varname, value):
@@ -490,11 +598,14 @@ class FilterModule(object):
         return {
             "try_subkey": try_subkey,
             "doublequote": doublequote,
+            "replication_topology": replication_topology,
             "upstream_root": upstream_root,
             "instance_with_backup_of": instance_with_backup_of,
             "remove_keys": remove_keys,
             "extract_keys": extract_keys,
             "packages_for": packages_for,
+            "resolve_package_versions": resolve_package_versions,
+            "apt_download_uris": apt_download_uris,
             "members_of": members_of,
             "from_csv": from_csv,
             "pyformat": pyformat,
@@ -6,11 +6,12 @@ Instance filters.
 
 The filters defined here take the array of instances (from config.yml)
 and other inputs and return a new array of instances with parameters
-suitably adjusted.
+suitably adjusted. They do not modify their inputs, but they copy only
+what they change, so the instances they return share all other values
+with the input.
 
 """
 
-import copy
 import re
 from ansible.errors import AnsibleFilterError
 
@@ -69,68 +70,106 @@ def set_instance_defaults(old_instances, cluster_name, instance_defaults, locati
         locations: List of cluster locations
 
     """
-    instances = []
+    locations_map = {location["Name"]: location for location in locations}
 
-    locations_map = {}
-    for location in locations:
-        locations_map[location["Name"]] = location
+    return [
+        instance_with_defaults(
+            old_instance, cluster_name, instance_defaults, locations, locations_map
+        )
+        for old_instance in old_instances
+    ]
 
-    for old_instance in old_instances:
-        new_instance = copy.deepcopy(old_instance)
-        tags = new_instance.get("tags", {})
 
-        update_instance_name(new_instance, cluster_name, tags)
+def expand_instances(old_instances, cluster_name, instance_defaults, locations):
+    """
+    Returns the result of set_instance_defaults|expand_instance_volumes, but
+    processes each instance only once.
+
+    Args:
+        old_instances: List of instances containing dictionaries with instance information.
+        cluster_name: Name of the cluster.
+        instance_defaults: Dictionary containing defaults
+        locations: List of cluster locations
 
-        # Anything set in instance_defaults should be copied to the instance,
-        # unless the instance has a setting that overrides the default. As a
-        # convenience, we also merge dict keys (so that once can, for example,
-        # set some vars in instance_defaults and some on the instance, and get
-        # all of them, with the instance settings overriding the defaults).
+    """
+    locations_map = {location["Name"]: location for location in locations}
 
-        new_instance.update(
-            merged_defaults(
-                new_instance, instance_defaults, omit_keys=["default_volumes"]
-            )
+    instances = []
+    for old_instance in old_instances:
+        instance = instance_with_defaults(
+            old_instance, cluster_name, instance_defaults, locations, locations_map
         )
+        instance["volumes"] = expanded_volumes(instance)
+        instances.append(instance)
 
-        update_instance_volume_defaults(new_instance, instance_defaults)
+    return instances
 
-        update_instance_location(new_instance, locations, locations_map)
 
-        # The upstream, backup, and role tags should be moved one level up if
-        # they're specified at all.
+def instance_with_defaults(
+    old_instance, cluster_name, instance_defaults, locations, locations_map
+):
+    """
+    Returns a copy of the given instance with defaults set as described for
+    set_instance_defaults.
 
-        for t in ["upstream", "backup", "role"]:
-            if t in tags:
-                new_instance[t] = tags[t]
-                del tags[t]
+    The instance and the defaults are not modified. The result shares with
+    them any values that are not changed, so it must not be modified in place
+    below the top level.
+    """
+    new_instance = dict(old_instance)
 
-        # The role tag should be a list, so we convert comma-separated
-        # strings if that's what we're given.
+    # We delete some keys from tags below.
+    tags = new_instance.get("tags", {})
+    tags = dict(tags) if isinstance(tags, dict) else tags
 
-        role = new_instance.get("role", [])
-        if not isinstance(role, list):
-            role = [x.strip() for x in role.split(",")]
+    update_instance_name(new_instance, cluster_name, tags)
 
-        # primary/replica instances must also be tagged 'postgres'.
+    # Anything set in instance_defaults should be copied to the instance,
+    # unless the instance has a setting that overrides the default. As a
+    # convenience, we also merge dict keys (so that once can, for example,
+    # set some vars in instance_defaults and some on the instance, and get
+    # all of them, with the instance settings overriding the defaults).
 
-        if "primary" in role or "replica" in role:
-            if "postgres" not in role:
-                role = role + ["postgres"]
+    new_instance.update(
+        merged_defaults(new_instance, instance_defaults, omit_keys=["default_volumes"])
+    )
 
-        new_instance["role"] = role
-        new_instance["tags"] = tags
+    update_instance_volume_defaults(new_instance, instance_defaults)
 
-        # Name and node should be in tags, but we'll add them in when we're
-        # actually creating the tags, not before.
+    update_instance_location(new_instance, locations, locations_map)
 
-        for t in ["name", "Name", "node"]:
-            if t in tags:
-                del tags[t]
+    # The upstream, backup, and role tags should be moved one level up if
+    # they're specified at all.
 
-        instances.append(new_instance)
+    for t in ["upstream", "backup", "role"]:
+        if t in tags:
+            new_instance[t] = tags[t]
+            del tags[t]
 
-    return instances
+    # The role tag should be a list, so we convert comma-separated
+    # strings if that's what we're given.
+
+    role = new_instance.get("role", [])
+    if not isinstance(role, list):
+        role = [x.strip() for x in role.split(",")]
+
+    # primary/replica instances must also be tagged 'postgres'.
+
+    if "primary" in role or "replica" in role:
+        if "postgres" not in role:
+            role = role + ["postgres"]
+
+    new_instance["role"] = role
+    new_instance["tags"] = tags
+
+    # Name and node should be in tags, but we'll add them in when we're
+    # actually creating the tags, not before.
+
+    for t in ["name", "Name", "node"]:
+        if t in tags:
+            del tags[t]
+
+    return new_instance
 
 
 def update_instance_location(instance, locations, locations_map=None):
@@ -239,9 +278,7 @@ def merged_defaults(item, defaults, omit_keys=None):
     for key in [k for k in defaults if k not in omit_keys]:
         result[key] = item.get(key, defaults[key])
         if isinstance(result[key], dict) and isinstance(defaults[key], dict):
-            b = copy.deepcopy(defaults[key])
-            b.update(result[key])
-            result[key] = b
+            result[key] = {**defaults[key], **result[key]}
 
     return result
 
@@ -256,35 +293,35 @@ def expand_instance_volumes(old_instances):
     See aws specific transformations in filter_plugins/aws.py
 
     """
-    instances = []
-    for instance in old_instances:
-        transform = copy.deepcopy(instance)
+    return [
+        dict(instance, volumes=expanded_volumes(instance)) for instance in old_instances
+    ]
 
-        volumes = []
-        for vol in transform.get("volumes", []):
-            volume = copy.deepcopy(vol)
-
-            # docker volumes are bind mounted directories they don't need to be
-            # initialised, the filter validate_volume_for doesn't apply, no
-            # type is needed either. docker volumes entries are not dicts.
-            if transform.get("platform") == "docker":
-                volumes.append(volume)
-                continue
 
-            _vars = volume.get("vars", {})
+def expanded_volumes(instance):
+    """
+    Returns the list of volumes for the given instance after the
+    transformations described for expand_instance_volumes. The volumes
+    themselves are not copied.
+    """
+    volumes = instance.get("volumes", [])
 
-            volume_type = volume.get("volume_type")
-            if volume_type == "none":
-                continue
+    # docker volumes are bind mounted directories they don't need to be
+    # initialised, the filter validate_volume_for doesn't apply, no
+    # type is needed either. docker volumes entries are not dicts.
+    if instance.get("platform") == "docker":
+        return list(volumes)
 
-            validate_volume_for(volume["device_name"], _vars)
+    expanded = []
+    for volume in volumes:
+        if volume.get("volume_type") == "none":
+            continue
 
-            volumes.append(volume)
+        validate_volume_for(volume["device_name"], volume.get("vars", {}))
 
-        transform["volumes"] = volumes
-        instances.append(transform)
+        expanded.append(volume)
 
-    return instances
+    return expanded
 
 
 def validate_volume_for(device_name, _vars) -> None:
@@ -559,6 +596,7 @@ class FilterModule:
             "deploy_ip_address": deploy_ip_address,
             "set_instance_defaults": set_instance_defaults,
             "expand_instance_volumes": expand_instance_volumes,
+            "expand_instances": expand_instances,
             "translate_volume_deployment_defaults": translate_volume_deployment_defaults,
             "find_replica_tablespace_mismatches": find_replica_tablespace_mismatches,
             "export_vars": export_vars,
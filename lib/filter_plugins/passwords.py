@@ -4,15 +4,18 @@
 
 import base64
 import hashlib
+import os
+import stringprep
+import unicodedata
+from functools import lru_cache
 from hmac import HMAC
 from ansible.errors import AnsibleFilterError
 
-try:
-    from passlib.hash import scram
+# We used to compute SCRAM verifiers with passlib, so we keep its defaults
+# for the number of rounds and the size of the salt.
 
-    HAVE_PASSLIB = True
-except ImportError:
-    HAVE_PASSLIB = False
+SCRAM_DEFAULT_ROUNDS = 100000
+SCRAM_SALT_SIZE = 12
 
 # Returns ``'md5' || md5_hex( password || username ))`` as computed by
 # pg_md5_encrypt() in src/common/md5.c
@@ -25,14 +28,69 @@ def md5_password(password, username):
     )
 
 
+# Returns the given password normalised as described in RFC 4013 (SASLprep),
+# as computed by pg_saslprep() in src/common/saslprep.c. As in Postgres, an
+# ASCII password is used as-is, and so is a password that SASLprep rejects.
+
+
+def saslprep(password):
+    if password.isascii():
+        return password
+
+    chars = [
+        " " if stringprep.in_table_c12(c) else c
+        for c in password
+        if not stringprep.in_table_b1(c)
+    ]
+    s = unicodedata.normalize("NFKC", "".join(chars))
+
+    prohibited = (
+        stringprep.in_table_c12,
+        stringprep.in_table_c21_c22,
+        stringprep.in_table_c3,
+        stringprep.in_table_c4,
+        stringprep.in_table_c5,
+        stringprep.in_table_c6,
+        stringprep.in_table_c7,
+        stringprep.in_table_c8,
+        stringprep.in_table_c9,
+        stringprep.in_table_a1,
+    )
+    if not s or any(f(c) for c in s for f in prohibited):
+        return password
+
+    # If there are any RandALCat characters, there must not be any LCat
+    # characters, and the first and last characters must be RandALCat.
+    if any(stringprep.in_table_d1(c) for c in s):
+        if any(stringprep.in_table_d2(c) for c in s) or not (
+            stringprep.in_table_d1(s[0]) and stringprep.in_table_d1(s[-1])
+        ):
+            return password
+
+    return s
+
+
 # Returns ``SCRAM-SHA-256$<iteration count>:<salt>$<StoredKey>:<ServerKey>`` as
 # computed by scram_build_verifier() in src/common/scram-common.c
+#
+# The same password is often encrypted many times during a deploy (e.g., once
+# for every host that renders a template), so we remember the verifiers we've
+# computed for any given salt.
 
 
 def scram_password(password, salt=None, rounds=4096):
-    s = scram.using(rounds=rounds, salt=salt, algs="sha-1,sha-256").hash(password)
+    if salt is None:
+        salt = os.urandom(SCRAM_SALT_SIZE)
+    if rounds is None:
+        rounds = SCRAM_DEFAULT_ROUNDS
+    return _scram_password(password, bytes(salt), int(rounds))
+
 
-    (salt, rounds, SaltedPassword) = scram.extract_digest_info(s, "sha-256")
+@lru_cache(maxsize=None)
+def _scram_password(password, salt, rounds):
+    SaltedPassword = hashlib.pbkdf2_hmac(
+        "sha256", saslprep(password).encode("utf-8"), salt, rounds
+    )
 
     ClientKey = HMAC(
         SaltedPassword, "Client Key".encode("ascii"), hashlib.sha256
@@ -65,11 +123,6 @@ def encrypted_password(
         salt = None
         rounds = None
 
-        if not HAVE_PASSLIB:
-            raise AnsibleFilterError(
-                "|encrypted_password requires passlib (did you run `tpaexec setup`?)"
-            )
-
         if existing_password and existing_password.startswith("SCRAM-SHA-256$"):
             (_, info, _) = existing_password.split("$", 2)
             (rounds, b64salt) = info.split(":", 1)
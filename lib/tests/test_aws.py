@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""Tests for AMI lookups on the aws platform, against stubbed EC2 clients."""
+
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from tpaexec.exceptions import AWSPlatformError
+from tpaexec.platforms.aws import AMICache, aws
+
+REGIONS = ["eu-west-1", "eu-west-2", "us-east-1", "us-east-2", "us-west-1", "us-west-2"]
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    """Makes boto3.client return EC2 clients whose responses are stubbed."""
+    stubs = {}
+    real_client = boto3.client
+
+    def client(service, region_name):
+        c = real_client(
+            service,
+            region_name=region_name,
+            aws_access_key_id="x",
+            aws_secret_access_key="x",
+        )
+        stubs[region_name] = Stubber(c)
+        stubs[region_name].activate()
+        return c
+
+    monkeypatch.setattr("tpaexec.platforms.aws.boto3.client", client)
+    monkeypatch.delenv("TPA_AMI_CACHE", raising=False)
+    return stubs
+
+
+def _platform():
+    arch = SimpleNamespace(args={"verbosity": 0, "instance_type": "t3.micro"})
+    return aws("aws", arch)
+
+
+def _expect(stubs, region, name, owner, image_ids):
+    stubs[region].add_response(
+        "describe_images",
+        {"Images": [{"ImageId": i} for i in image_ids]},
+        {
+            "Filters": [
+                {"Name": "name", "Values": [name]},
+                {"Name": "owner-id", "Values": [owner]},
+            ]
+        },
+    )
+
+
+def test_prefetch_images(stubs, tmp_path, monkeypatch):
+    monkeypatch.setenv("TPA_AMI_CACHE", str(tmp_path / "ami.json"))
+    p = _platform()
+    image = p.image("Debian")
+
+    # Create the stubbed clients, and queue one response for each region.
+    for r in REGIONS:
+        p._ec2_client(r)
+        _expect(stubs, r, image["name"], image["owner"], [f"ami-{r}"])
+
+    p.prefetch_images(["Debian"], REGIONS)
+    for r in REGIONS:
+        stubs[r].assert_no_pending_responses()
+        assert p.image("Debian", lookup=True, region=r)["image_id"] == f"ami-{r}"
+
+    # Another process finds the results in the cache file, and makes no
+    # requests at all (the stubs would raise an error if it did).
+    p = _platform()
+    p.prefetch_images(["Debian"], REGIONS)
+    assert p.ec2 == {}
+    assert p.image("Debian", lookup=True, region="us-west-2")["image_id"] == "ami-us-west-2"
+
+
+def test_lookup_ami_requires_one_match(stubs):
+    p = _platform()
+    image = p.image("Debian")
+    p._ec2_client("eu-west-1")
+    _expect(stubs, "eu-west-1", image["name"], image["owner"], ["ami-1", "ami-2"])
+
+    with pytest.raises(AWSPlatformError):
+        p.image("Debian", lookup=True, region="eu-west-1")
+    assert p.amis.get(("eu-west-1", image["name"], image["owner"])) is None
+
+
+def test_ami_cache_expiry(tmp_path):
+    path = str(tmp_path / "ami.json")
+    c = AMICache(path, ttl=60)
+    c.put(("eu-west-1", "name", None), "ami-1")
+    c.save()
+
+    assert AMICache(path, ttl=60).get(("eu-west-1", "name", None)) == "ami-1"
+    assert AMICache(path, ttl=0).get(("eu-west-1", "name", None)) is None
+    assert AMICache(path, ttl=60).get(("eu-west-1", "name", "owner")) is None
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""Tests for the aws platform's instance expansion filters."""
+
+import copy
+
+import pytest
+
+from ..filter_plugins.aws import (
+    expand_ec2_instance_image,
+    expand_ec2_instance_volumes,
+    expand_ec2_instances,
+    match_existing_volumes,
+)
+
+AMIS = {"eu-west-1": "ami-1", "eu-west-2": "ami-2"}
+PROPERTIES = {
+    "ami-1": {"root_device_name": "/dev/xvda"},
+    "ami-2": {"root_device_name": "/dev/sda1"},
+    "ami-own": {"root_device_name": "/dev/xvda"},
+}
+
+
+def many_instances(n, volumes=10):
+    """Returns a list of n instances as they are after validate.yml, each
+    with the given number of volumes, some of which are attach_existing."""
+    instances = []
+    for k in range(n):
+        i = {
+            "Name": "node-%d" % k,
+            "node": k + 1,
+            "region": "eu-west-%d" % (k % 2 + 1),
+            "type": "i3.16xlarge",
+            "vars": {"ansible_user": "admin"},
+        }
+        if k % 4 == 0:
+            i["image"] = "ami-own"
+        i["volumes"] = [{"device_name": "root", "volume_type": "gp2", "volume_size": 16}]
+        i["volumes"] += [
+            {
+                "device_name": "/dev/xvd%s" % chr(ord("c") + j),
+                "volume_type": "io1",
+                "volume_size": 10 + j,
+                "iops": 1000,
+                "encrypted": True,
+                "attach_existing": j % 3 == 0,
+                "vars": {"volume_for": "postgres_data"} if j == 0 else {},
+            }
+            for j in range(volumes)
+        ]
+        i["volumes"].append({"device_name": "/dev/xvdz", "ephemeral": "ephemeral0"})
+        instances.append(i)
+    return instances
+
+
+def existing_volumes(instances):
+    """Returns a map of existing volumes for every attach_existing volume of
+    every other one of the given (expanded) instances."""
+    volumes = {}
+    for i in instances[::2]:
+        for v in i["volumes"]:
+            if v.get("attach_existing"):
+                name = "%s:speedy:%s:%s" % (i["region"], i["node"], v["device_name"])
+                volumes[name] = {
+                    "size": v["ebs"]["volume_size"],
+                    "iops": 1000,
+                    "type": "io1",
+                    "id": "vol-%s-%s" % (i["node"], v["device_name"][-1]),
+                }
+    return volumes
+
+
+def test_expand_ec2_instance_volumes():
+    """test the transformation of volumes into the ec2_instance format"""
+    (instance,) = many_instances(1, volumes=1)
+    (result,) = expand_ec2_instance_volumes(
+        expand_ec2_instance_image([instance], AMIS), PROPERTIES
+    )
+
+    assert result["image"] == "ami-own"
+    assert result["volumes"] == [
+        {
+            "device_name": "/dev/xvda",
+            "ebs": {
+                "encrypted": False,
+                "volume_type": "gp2",
+                "volume_size": 16,
+                "delete_on_termination": True,
+            },
+        },
+        {
+            "device_name": "/dev/xvdc",
+            "attach_existing": True,
+            "vars": {"volume_for": "postgres_data"},
+            "ebs": {
+                "encrypted": True,
+                "volume_type": "io1",
+                "volume_size": 10,
+                "delete_on_termination": False,
+                "iops": 1000,
+            },
+        },
+        {"device_name": "/dev/xvdz", "virtual_name": "ephemeral0"},
+    ]
+
+
+def test_match_existing_volumes():
+    """test that match_existing_volumes copies only what it changes"""
+    instances = expand_ec2_instance_volumes(
+        expand_ec2_instance_image(many_instances(2, volumes=1), AMIS), PROPERTIES
+    )
+    original = copy.deepcopy(instances)
+
+    result = match_existing_volumes(instances, "speedy", existing_volumes(instances))
+    assert instances == original
+
+    assert result[0]["volumes"][1]["volume_id"] == "vol-1-c"
+    assert result[0]["volumes"][0] is instances[0]["volumes"][0]
+    assert result[1] is instances[1]
+
+
+@pytest.mark.parametrize("n", [10, 500])
+def test_expand_ec2_instances(n):
+    """
+    Test that expand_ec2_instances produces the same result as the individual
+    filters for large configurations, without modifying its inputs.
+    """
+    instances = many_instances(n)
+    volumes = existing_volumes(
+        expand_ec2_instance_volumes(
+            expand_ec2_instance_image(instances, AMIS), PROPERTIES
+        )
+    )
+    original = copy.deepcopy(instances)
+
+    result = expand_ec2_instances(instances, AMIS, PROPERTIES, "speedy", volumes)
+    assert instances == original
+
+    assert result == match_existing_volumes(
+        expand_ec2_instance_volumes(
+            expand_ec2_instance_image(instances, AMIS), PROPERTIES
+        ),
+        "speedy",
+        volumes,
+    )
+    assert [i["image"] for i in result[:4]] == ["ami-own", "ami-2", "ami-1", "ami-2"]
+    assert len([v for v in result[0]["volumes"] if "volume_id" in v]) == 4
+    assert not [v for v in result[1]["volumes"] if "volume_id" in v]
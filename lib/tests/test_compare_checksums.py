@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 # © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
 
+import json
+
 import pytest
 
 from pathlib import Path
@@ -66,3 +68,65 @@ def test_compare_data(setup):
             target_directory=setup["directory"],
         )
     assert exit.type == SystemExit
+
+
+def test_compare_data_stat_cache(setup, tmp_path):
+    stat_cache = str(tmp_path / "stat-cache.json")
+    stats = {}
+    compare_data(
+        path_to_file=setup["source_checksums"],
+        target_directory=setup["directory"],
+        stat_cache=stat_cache,
+        stats=stats,
+    )
+    assert stats["hashed"] == stats["files"]
+    assert stats["checksum"] == _hash_file(Path(setup["source_checksums"])).hexdigest()
+
+    # Nothing has changed, so nothing needs to be hashed again
+    mismatch_list, missing_list = compare_data(
+        path_to_file=setup["source_checksums"],
+        target_directory=setup["directory"],
+        stat_cache=stat_cache,
+        stats=stats,
+    )
+    assert (mismatch_list, missing_list) == ([], [])
+    assert stats["hashed"] == 0
+    assert stats["cached"] == stats["files"]
+
+    # Other directories that share the cache are checked (and cached) too
+    mismatch_list, missing_list = compare_data(
+        path_to_file=setup["source_checksums"],
+        target_directory=setup["tampered_nested_directory"],
+        stat_cache=stat_cache,
+        stats=stats,
+    )
+    assert len(mismatch_list) == 4
+    compare_data(
+        path_to_file=setup["source_checksums"],
+        target_directory=setup["tampered_nested_directory"],
+        stat_cache=stat_cache,
+        stats=stats,
+    )
+    assert stats["hashed"] == 0
+
+
+def test_compare_data_detects_changes(tmp_path):
+    target = tmp_path / "tree"
+    target.mkdir()
+    (target / "small").write_bytes(b"small")
+    (target / "large").write_bytes(b"x" * (3 * 1024 * 1024 + 1))
+    checksums = {
+        name: _hash_file(target / name).hexdigest() for name in ("small", "large")
+    }
+    checksums_file = tmp_path / "checksums.json"
+    checksums_file.write_text(json.dumps(checksums))
+    stat_cache = str(tmp_path / "stat-cache.json")
+
+    assert compare_data(str(checksums_file), str(target), stat_cache=stat_cache) == ([], [])
+
+    (target / "large").write_bytes(b"y" * (3 * 1024 * 1024 + 2))
+    (target / "small").unlink()
+    assert compare_data(str(checksums_file), str(target), stat_cache=stat_cache) == (
+        ["large"],
+        ["small"],
+    )
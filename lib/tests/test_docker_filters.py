@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""Tests for the docker platform's filters."""
+
+import pytest
+
+from ansible.errors import AnsibleFilterError
+
+from ..filter_plugins.docker import docker_container_results
+
+NETWORKS = [{"name": "tpanet"}, {"name": "other"}]
+
+
+def info(name, ip_address="", networks=None, **instance):
+    """Returns a docker_container_info result for the named instance."""
+    return {
+        "item": dict(instance, Name=name),
+        "exists": True,
+        "container": {
+            "Name": "/" + name,
+            "NetworkSettings": {
+                "IPAddress": ip_address,
+                "Networks": networks or {},
+            },
+        },
+    }
+
+
+def test_docker_container_results():
+    results = docker_container_results(
+        [
+            info("one", ip_address="172.17.0.2", node=1),
+            info(
+                "two",
+                networks={
+                    "other": {"IPAddress": "10.0.0.3"},
+                    "tpanet": {"IPAddress": "10.33.0.3"},
+                },
+                node=2,
+                location="second",
+            ),
+        ],
+        NETWORKS,
+    )
+
+    assert [r["item"]["Name"] for r in results] == ["one", "two"]
+    assert [r["item"]["private_ip"] for r in results] == ["172.17.0.2", "10.33.0.3"]
+    assert results[1]["item"]["node"] == 2
+    assert results[1]["item"]["location"] == "second"
+    assert results[1]["Name"] == "/two"
+    assert results[1]["NetworkSettings"]["Networks"]["other"]["IPAddress"] == "10.0.0.3"
+
+
+def test_docker_container_results_leaves_input_unchanged():
+    result = info("one", ip_address="172.17.0.2")
+    docker_container_results([result], NETWORKS)
+    assert "private_ip" not in result["item"]
+    assert "item" not in result["container"]
+
+
+def test_docker_container_results_without_address():
+    with pytest.raises(AnsibleFilterError, match="one has no IP address"):
+        docker_container_results([info("one")], NETWORKS)
+
+    with pytest.raises(AnsibleFilterError, match="one has no IP address"):
+        docker_container_results([info("one")])
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+from ..filter_plugins.filters import (
+    apt_download_uris,
+    resolve_package_versions,
+    upstream_root,
+    instance_with_backup_of,
+    physical_replication_group,
+    replication_topology,
+    expected_replication_slots,
+)
+
+
+def _hostvars():
+    return {
+        "one": {"role": ["primary"], "region": "eu", "backup": "barman"},
+        "two": {"role": ["replica"], "upstream": "one", "region": "us"},
+        "three": {
+            "role": ["replica"],
+            "upstream": "two",
+            "region": "us",
+            "backup": "barman",
+        },
+        "four": {"role": ["replica"], "upstream": "one", "region": "eu"},
+        "five": {"role": ["primary"], "region": "us"},
+        "barman": {"role": ["barman"], "region": "eu"},
+    }
+
+
+def test_upstream_root():
+    hostvars = _hostvars()
+
+    assert upstream_root("three", hostvars) == "one"
+    assert upstream_root("one", hostvars) == "one"
+    assert upstream_root("barman", hostvars) == "barman"
+    assert upstream_root("unknown", hostvars) == "unknown"
+
+
+def test_physical_replication_group():
+    hostvars = _hostvars()
+
+    group = ["one", "two", "three", "four"]
+    for h in group:
+        assert physical_replication_group(h, hostvars) == group
+
+    assert physical_replication_group("five", hostvars) == ["five"]
+    assert physical_replication_group("barman", hostvars) == []
+
+
+def test_instance_with_backup_of():
+    hostvars = _hostvars()
+    hosts = list(hostvars.keys())
+
+    assert instance_with_backup_of(hosts, "one", "two", hostvars) == "three"
+    assert instance_with_backup_of(hosts, "one", "four", hostvars) == "one"
+    assert instance_with_backup_of(hosts, "five", "five", hostvars) is None
+
+
+def test_replication_topology():
+    hostvars = _hostvars()
+    topology = replication_topology(list(hostvars), hostvars)
+
+    assert sorted(topology) == ["five", "four", "one", "three", "two"]
+    assert topology["three"] == {
+        "role": ["replica"],
+        "upstream": "two",
+        "region": "us",
+        "backup": "barman",
+    }
+
+    # The filters give the same answers with the topology as with hostvars.
+    for h in hostvars:
+        assert upstream_root(h, topology) == upstream_root(h, hostvars)
+        assert physical_replication_group(h, topology) == physical_replication_group(
+            h, hostvars
+        )
+    hosts = list(hostvars)
+    for somehost in hosts:
+        assert instance_with_backup_of(
+            hosts, "one", somehost, topology
+        ) == instance_with_backup_of(hosts, "one", somehost, hostvars)
+
+
+def test_expected_replication_slots():
+    replicas = [
+        {"primary_conninfo_parts": {"host": "one"}, "primary_slot_name": "two"},
+        {"primary_conninfo_parts": {"host": "two"}, "primary_slot_name": "three"},
+        {"primary_conninfo_parts": {"host": "one"}, "primary_slot_name": "four"},
+        {"primary_conninfo_parts": {"host": "one"}},
+        {},
+    ]
+
+    assert expected_replication_slots(replicas, "one") == ["two", "four"]
+    assert expected_replication_slots(replicas, "five") == []
+    assert expected_replication_slots(replicas) == {
+        "one": ["two", "four"],
+        "two": ["three"],
+    }
+
+
+def test_resolve_package_versions():
+    lines = [
+        "Package: edb-pgd5",
+        "Version: 5.6.1-1.bookworm",
+        "Version: 5.5.0-1.bookworm",
+        "Package: postgresql-16",
+        "Version: 1:16.4-1.pgdg120+1",
+        "Version: 1:16.3-1.pgdg120+1",
+    ]
+    result = resolve_package_versions(
+        ["rsync", "edb-pgd5=5.5*", "postgresql-16=16.4*", "foo=1.0*"], lines
+    )
+    assert result == {
+        "packages": [
+            "rsync",
+            "edb-pgd5=5.5.0-1.bookworm",
+            "postgresql-16=1:16.4-1.pgdg120+1",
+            "foo=1.0*",
+        ],
+        "versioned": ["edb-pgd5", "postgresql-16", "foo"],
+    }
+
+
+def test_apt_download_uris():
+    lines = [
+        "'http://deb.example.com/pool/r/rsync_3.2.7-1_amd64.deb' "
+        "rsync_3.2.7-1_amd64.deb 416424 SHA256:ABCD",
+        "'http://apt.example.com/pool/p/postgresql-16_16.4-1_amd64.deb' "
+        "postgresql-16_1%3a16.4-1_amd64.deb 17000000 SHA512:ef01",
+        "'http://old.example.com/pool/l/libfoo1_1.0_amd64.deb' "
+        "libfoo1_1.0_amd64.deb 1000 SHA1:2345",
+        "'http://old.example.com/pool/l/libbar1_2.0_all.deb' "
+        "libbar1_2.0_all.deb 1000 MD5Sum:6789",
+        "'http://new.example.com/pool/b/baz_3.0_all.deb' "
+        "baz_3.0_all.deb 1000 SHA3-512:abcd",
+        "W: some warning",
+    ]
+    assert apt_download_uris(lines) == [
+        {
+            "filename": "rsync_3.2.7-1_amd64.deb",
+            "checksum": "sha256:abcd",
+            "sha256": "abcd",
+            "spec": "rsync=3.2.7-1",
+        },
+        {
+            "filename": "postgresql-16_1%3a16.4-1_amd64.deb",
+            "checksum": "sha512:ef01",
+            "spec": "postgresql-16=1:16.4-1",
+        },
+        {
+            "filename": "libfoo1_1.0_amd64.deb",
+            "checksum": "sha1:2345",
+            "spec": "libfoo1=1.0",
+        },
+        {
+            "filename": "libbar1_2.0_all.deb",
+            "checksum": "md5:6789",
+            "spec": "libbar1=2.0",
+        },
+        {
+            "filename": "baz_3.0_all.deb",
+            "spec": "baz=3.0",
+        },
+    ]
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""
+Tests that the tpa_init_facts action sets exactly the same facts as the
+set_fact tasks it replaced in roles/init (which are kept in init_facts/).
+
+Both are run by ansible-playbook against the same inventory, with the role
+defaults from roles/init, and the resulting hostvars are compared.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+import yaml
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+TPA_DIR = os.path.dirname(os.path.dirname(TESTS))
+
+FACTS = """
+    target_environment ip_addresses ip_address hostname_aliases
+    postgres_flavour failover_manager postgres_family postgres_family_extended
+    postgres_data_dir default_postgres_wal_dir postgres_wal_dir
+    pg_wal_dir_outside_pgdata postgres_databases haproxy_maxconn
+    haproxy_backend_servers haproxy_stats_socket pgbouncer_backend_port
+    harp_proxy_port harp_listen_address pgbouncer_max_client_conn
+    _pgbouncer_databases pgbouncer_databases postgres_conf_dir
+    repmgr_conf_file postgres_bin_dir build_path
+    postgres_client_dsn_attributes replica_client_dsn_attributes
+    streaming_barman_client_dsn_attributes barman_client_dsn_attributes
+    repmgr_client_dsn_attributes bdr_client_dsn_attributes
+    harp_dcs_client_dsn_attributes pgd_proxy_dsn_attributes
+    bdr_connection_manager_dsn_attributes pgd_cli_dsn_attributes dsn
+    postgres_dsn node_dsn repmgr_node_dsn replication_node_dsn bdr_node_dsn
+    bdr_node_route_dsn bdr_connection_manager_route_dsn bdr_node_local_dsn
+    pgbouncer_node_dsn harp_dcs_node_dsn pgd_cli_dsn
+    max_prepared_transactions upstream_backedup pemagent_extensions
+    postgres_extensions postgis_version_maj_min postgres_extensions_dictionary
+    platypus_port platypus_database shared_buffers_mb effective_cache_size_mb
+    num_postgres_instances twice_postgres_instances max_wal_senders
+    max_replication_slots base_max_worker_processes max_worker_processes
+    archive_command initialise_harp role
+""".split()
+
+COMMON_VARS = {
+    "ansible_connection": "local",
+    "ansible_python_interpreter": sys.executable,
+    "ansible_distribution": "Debian",
+    "ansible_distribution_major_version": "12",
+    "ansible_memtotal_mb": 3955,
+    "cluster_tag": "tag_Cluster_test",
+    "postgres_version": "16",
+    "postgres_flavour": "postgresql",
+    "postgres_versionNN": "{{ postgres_version|replace('.', '') }}",
+    "edb_repositories": [],
+    "failover_manager": "harp",
+    "postgres_user": "postgres",
+    "postgres_port": 5432,
+    "postgres_databases": [],
+    "postgres_data_dir": "/opt/postgres/data",
+    "postgres_install_dir": "/opt/postgres",
+    "postgres_bin_dir": "/usr/lib/postgresql/16/bin",
+    "postgres_installation_method": "pkg",
+    "unix_socket_directories": ["/var/run/postgresql"],
+    "max_connections": "250",
+    "replication_user": "replicator",
+    "repmgr_conf_dir": "/etc/repmgr",
+    "bdr_database": "bdrdb",
+    "pgd_proxy_user": "pgdproxy",
+    "harp_manager_user": "harp_manager",
+    "harp_proxy_mode": "builtin",
+    "harp_proxy_port": "6432",
+    "haproxy_port": "5000",
+    "pgbouncer_port": "6432",
+    "pgbouncer_backend": "127.0.0.1",
+    "pgbouncer_backend_port": "5432",
+    "pgbouncer_auth_database": "pgbouncer_auth_database",
+    "pgbouncer_auth_user": "pgbouncer_auth_user",
+    "pem_database": "pem",
+    "publications": [],
+    "subscriptions": [],
+    "first_bdr_primary": "one",
+    "first_bdr_primary_candidates": ["one", "two"],
+    "private_ip": "10.33.1.1",
+    "volumes": [{"device_name": "root", "mountpoint": "/"}],
+}
+
+HOSTS = {
+    "one": {
+        "role": ["bdr", "postgres", "primary"],
+        "upstream_primary": "one",
+        "max_connections": "300",
+        "backup": "barman",
+        "barman_archiver": True,
+        "extra_postgres_extensions": ["postgis"],
+        "postgis_version": "3.4.1",
+        "bdr_client_dsn_attributes": "sslmode=require",
+        "public_ip": "192.0.2.1",
+        "postgres_flavour": None,
+        "postgresql_flavour": "2q",
+        "volumes": [
+            {"device_name": "/dev/sdb", "volume_for": "postgres_data"},
+            {
+                "device_name": "/dev/sdc",
+                "volume_for": "postgres_wal",
+                "mountpoint": "/opt/postgres/wal",
+            },
+        ],
+    },
+    "two": {
+        "role": ["bdr", "postgres", "primary", "pgbouncer", "harp-proxy"],
+        "upstream_primary": "two",
+        "postgres_version": "14",
+        "postgres_databases": [{"name": "bdrdb", "owner": "someone"}],
+        "postgres_extensions": ["pg_stat_statements", "bluefin"],
+        "ip_address": "10.33.1.2",
+        "hostname_aliases": {"two.example.com": "10.33.1.2"},
+        "postgres_flavour": "edbpge",
+        "postgres_data_dir": None,
+        "postgres_wal_dir": "/srv/wal",
+    },
+    "three": {
+        "role": ["postgres", "replica"],
+        "upstream_primary": "one",
+        "postgres_version": "11",
+        "failover_manager": "efm",
+        "repmgr_hostname": "three.example.com",
+        "postgres_installation_method": "src",
+        "build_path": ["/opt/bin", "$PATH"],
+        "barman_client_dsn_attributes": "sslmode=verify-full",
+        "target_environment": {"TZ": "UTC"},
+        "postgres_flavour": "epas",
+        "postgres_data_dir": "/srv/pgdata",
+    },
+    "proxy": {
+        "role": ["haproxy", "pgbouncer"],
+        "haproxy_backends": ["one", "two"],
+        "pgbouncer_backend": "proxy",
+        "pgbouncer_backend_port": "5000",
+        "pgbouncer_databases": [
+            {"name": "app", "options": {"pool_mode": "transaction"}},
+            {"name": "old", "dsn": "host=one dbname=old"},
+        ],
+        "ansible_distribution": "RedHat",
+        "ansible_distribution_major_version": "8",
+    },
+    "bouncer": {
+        "role": ["pgbouncer"],
+        "pgbouncer_backend": "one",
+        "haproxy_maxconn": 100,
+        "pgd_cli_dsn_attributes": "connect_timeout=2",
+    },
+    "pemserver": {
+        "role": ["pem-server", "postgres", "primary"],
+        "upstream_primary": "pemserver",
+        "failover_manager": "repmgr",
+        "platypus_database": "platypus",
+        "shared_buffers_mb": 512,
+        "max_worker_processes": 4,
+    },
+    "witness": {
+        "role": ["pem-agent", "postgres", "efm-witness", "replica"],
+        "upstream_primary": "pemserver",
+        "failover_manager": "efm",
+        "max_wal_senders": 20,
+        "postgis_version": "3.5",
+        "postgres_flavour": "pgextended",
+        "postgres_wal_dir": "/opt/postgres/data/pg_wal",
+    },
+    "barman": {
+        "role": ["barman"],
+        "enable_harp": True,
+        "failover_manager": None,
+        "private_ip": None,
+        "public_ip": "192.0.2.9",
+    },
+}
+
+PLAYBOOK = """
+- hosts: all
+  gather_facts: false
+  roles:
+    - init_facts
+
+- hosts: localhost
+  gather_facts: false
+  tasks:
+    - copy:
+        dest: "{{ output }}"
+        content: |
+          {% set r = {} %}
+          {% for h in groups['all'] %}
+          {% set _ = r.update({h: {}}) %}
+          {% for k in facts if k in hostvars[h] %}
+          {% set _ = r[h].update({k: hostvars[h][k]}) %}
+          {% endfor %}
+          {% endfor %}
+          {{ r|to_json }}
+"""
+
+
+def _inventory(hosts):
+    groups = {}
+    for name, h in hosts.items():
+        for r in h["role"]:
+            groups.setdefault("role_%s" % r, {"hosts": {}})["hosts"][name] = None
+
+    host_vars = {}
+    for name, h in hosts.items():
+        # A value of None means that the common setting is left undefined.
+        v = dict(COMMON_VARS, **h)
+        host_vars[name] = {k: x for k, x in v.items() if x is not None}
+
+    groups["tag_Cluster_test"] = {"hosts": {name: None for name in hosts}}
+    return {"all": {"hosts": host_vars, "children": groups}}
+
+
+def _run(tmp_path, tasks, hosts):
+    """
+    Runs the given tasks with the roles/init defaults on the given hosts, and
+    returns their FACTS and the time taken.
+    """
+    role = tmp_path / "roles" / "init_facts"
+    (role / "tasks").mkdir(parents=True)
+    (role / "defaults").mkdir()
+    shutil.copy(
+        os.path.join(TPA_DIR, "roles/init/defaults/main.yml"),
+        role / "defaults" / "main.yml",
+    )
+    (role / "tasks" / "main.yml").write_text(tasks)
+    (tmp_path / "inventory.yml").write_text(yaml.safe_dump(_inventory(hosts)))
+    (tmp_path / "playbook.yml").write_text(PLAYBOOK)
+    (tmp_path / "ansible.cfg").write_text("[defaults]\nforks = 50\n")
+
+    lib = os.path.join(TPA_DIR, "lib")
+    env = dict(
+        os.environ,
+        ANSIBLE_CONFIG=str(tmp_path / "ansible.cfg"),
+        ANSIBLE_ROLES_PATH=str(tmp_path / "roles"),
+        ANSIBLE_ACTION_PLUGINS=os.path.join(lib, "action_plugins"),
+        ANSIBLE_FILTER_PLUGINS=os.path.join(lib, "filter_plugins"),
+        ANSIBLE_TEST_PLUGINS=os.path.join(lib, "test_plugins"),
+        ANSIBLE_LOCALHOST_WARNING="false",
+        # The union filter returns the elements of a set, so their order is
+        # the same only if the strings hash the same in both runs.
+        PYTHONHASHSEED="0",
+    )
+    output = tmp_path / "facts.json"
+    start = time.monotonic()
+    p = subprocess.run(
+        [
+            "ansible-playbook",
+            "-i",
+            str(tmp_path / "inventory.yml"),
+            str(tmp_path / "playbook.yml"),
+            "-e",
+            json.dumps({"output": str(output), "facts": FACTS}),
+        ],
+        env=env,
+        cwd=str(tmp_path),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    elapsed = time.monotonic() - start
+    assert p.returncode == 0, p.stdout
+    return (json.loads(output.read_text()), elapsed)
+
+
+def _tasks(stage):
+    return """
+- tpa_init_facts:
+    stage: %s
+  register: _init_facts
+
+- action: set_fact
+  args: "{{ _init_facts.facts }}"
+""" % stage
+
+
+def _legacy(stage):
+    with open(os.path.join(TESTS, "init_facts", "legacy_%s.yml" % stage)) as f:
+        return f.read()
+
+
+@pytest.fixture
+def ansible_playbook():
+    if shutil.which("ansible-playbook") is None:
+        pytest.skip("ansible-playbook is not installed")
+    try:
+        import ansible_collections.community.general  # noqa: F401
+    except ImportError:
+        pytest.skip("community.general (for json_query) is not installed")
+
+
+def test_init_facts_parity(tmp_path, ansible_playbook):
+    (legacy, _) = _run(
+        tmp_path / "legacy",
+        _legacy("hostvars")
+        + _legacy("postgres_basics").replace("---", "")
+        + _legacy("postgres").replace("---", ""),
+        HOSTS,
+    )
+    (new, _) = _run(
+        tmp_path / "new",
+        _tasks("hostvars") + _tasks("postgres_basics") + _tasks("postgres"),
+        HOSTS,
+    )
+
+    assert new.keys() == legacy.keys()
+    for h in HOSTS:
+        assert new[h] == legacy[h], h
+        assert [type(new[h][k]) for k in FACTS if k in new[h]] == [
+            type(legacy[h][k]) for k in FACTS if k in legacy[h]
+        ], h
@@ -2,10 +2,15 @@
 # -*- coding: utf-8 -*-
 # © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
 
+import copy
+
 import pytest
 from ansible.errors import AnsibleFilterError
 from typing import List, Dict, Tuple
 from ..filter_plugins.instances import (
+    set_instance_defaults,
+    expand_instance_volumes,
+    expand_instances,
     validate_volume_for,
     translate_volume_deployment_defaults,
     find_replica_tablespace_mismatches,
@@ -560,3 +565,118 @@ def test_ensure_subscription():
     """
     for c in ensure_subscription_tests:
         assert ensure_subscription(c[0], c[1]) == c[2]
+
+
+instance_defaults = {
+    "type": "t3.micro",
+    "vars": {"ansible_user": "admin", "x": 1},
+    "default_volumes": [
+        {"device_name": "root", "volume_type": "gp2", "volume_size": 16},
+        {
+            "device_name": "/dev/xvdb",
+            "volume_size": 10,
+            "vars": {"volume_for": "postgres_data"},
+        },
+    ],
+}
+
+locations = [
+    {"Name": "first", "region": "eu-west-1", "vars": {"zone": 1}},
+    {"Name": "second", "region": "eu-west-2"},
+]
+
+
+def many_instances(n, volumes=10):
+    """Returns a list of n instances in the style of config.yml, each with
+    the given number of volumes (some of which are removed by expansion)."""
+    instances = []
+    for k in range(n):
+        i = {"node": k + 1, "location": ["first", "second", 1][k % 3]}
+        if k % 2:
+            i["Name"] = "Node_%d" % k
+            i["role"] = "primary, pem-agent"
+        else:
+            i["tags"] = {"Name": "tagged-%d" % k, "role": ["replica"], "foo": "x"}
+            i["vars"] = {"x": 2}
+        if k % 4 != 3:
+            i["volumes"] = [
+                {
+                    "device_name": "/dev/xvd%s" % chr(ord("c") + j),
+                    "volume_type": "none" if j % 5 == 4 else "gp3",
+                    "volume_size": 10 + j,
+                    "vars": {"volume_for": "postgres_tablespace", "tablespace_name": "t"}
+                    if j % 3 == 1
+                    else {},
+                }
+                for j in range(volumes)
+            ]
+        instances.append(i)
+    return instances
+
+
+def test_set_instance_defaults():
+    """
+    Test that set_instance_defaults applies defaults and location settings
+    without modifying its inputs.
+    """
+    (instances, defaults) = (many_instances(3, volumes=2), instance_defaults)
+    original = copy.deepcopy((instances, defaults, locations))
+
+    result = set_instance_defaults(instances, "speedy", defaults, locations)
+    assert (instances, defaults, locations) == original
+
+    assert result[0] == {
+        "node": 1,
+        "location": "first",
+        "tags": {"foo": "x"},
+        "vars": {"zone": 1, "ansible_user": "admin", "x": 2},
+        "volumes": [
+            {"device_name": "root", "volume_type": "gp2", "volume_size": 16},
+            {
+                "device_name": "/dev/xvdb",
+                "volume_size": 10,
+                "vars": {"volume_for": "postgres_data"},
+            },
+            {
+                "device_name": "/dev/xvdc",
+                "volume_type": "gp3",
+                "volume_size": 10,
+                "vars": {},
+            },
+            {
+                "device_name": "/dev/xvdd",
+                "volume_type": "gp3",
+                "volume_size": 11,
+                "vars": {"volume_for": "postgres_tablespace", "tablespace_name": "t"},
+            },
+        ],
+        "Name": "tagged-0",
+        "type": "t3.micro",
+        "region": "eu-west-1",
+        "role": ["replica", "postgres"],
+    }
+    assert result[1]["Name"] == "node-1" and result[1]["tags"] == {}
+    assert result[1]["role"] == ["primary", "pem-agent", "postgres"]
+    assert result[1]["vars"] == {"ansible_user": "admin", "x": 1}
+    assert result[2]["location"] == "second" and result[2]["region"] == "eu-west-2"
+
+
+@pytest.mark.parametrize("n", [10, 500])
+def test_expand_instances(n):
+    """
+    Test that expand_instances produces the same result as
+    set_instance_defaults|expand_instance_volumes for large configurations,
+    without modifying its inputs.
+    """
+    instances = many_instances(n)
+    original = copy.deepcopy((instances, instance_defaults, locations))
+
+    result = expand_instances(instances, "speedy", instance_defaults, locations)
+    assert (instances, instance_defaults, locations) == original
+
+    assert result == expand_instance_volumes(
+        set_instance_defaults(instances, "speedy", instance_defaults, locations)
+    )
+    assert len(result) == n
+    assert len(result[0]["volumes"]) == 10
+    assert len(result[3]["volumes"]) == 2
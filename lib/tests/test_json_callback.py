@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""Tests for the json callback plugin."""
+
+import io
+import json
+import os
+from types import SimpleNamespace
+
+from ansible.executor.stats import AggregateStats
+from ansible.inventory.host import Host
+from ansible.plugins.loader import callback_loader
+
+TPA_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _callback(**options):
+    # The plugin must be loaded by name for its options to be defined.
+    callback_loader.add_directory(os.path.join(TPA_DIR, "lib/callback_plugins"))
+    cb = callback_loader.get("json")
+    cb.set_options(direct=options)
+    cb._stream = io.StringIO()
+    return cb
+
+
+def _play():
+    return SimpleNamespace(get_name=lambda: "play", _uuid="p1", strategy="linear")
+
+
+def _task(name, uuid):
+    return SimpleNamespace(get_name=lambda: name, _uuid=uuid, action="command")
+
+
+def _result(host, task, **result):
+    return SimpleNamespace(_host=host, _task=task, _result=result)
+
+
+def _run(cb):
+    (one, two) = (Host("one"), Host("two"))
+    task = _task("echo", "t1")
+    stats = AggregateStats()
+    cb.v2_playbook_on_play_start(_play())
+    cb.v2_playbook_on_task_start(task, False)
+    cb.v2_runner_on_ok(_result(one, task, stdout="x" * 100, rc=0))
+    cb.v2_runner_on_failed(_result(two, task, msg="no"), ignore_errors=True)
+    stats.increment("ok", "one")
+    stats.increment("failures", "two")
+    cb.v2_playbook_on_stats(stats)
+
+
+def test_json_stream():
+    cb = _callback(stream=True, flush_interval=0, max_value_size=10)
+    _run(cb)
+
+    events = [json.loads(line) for line in cb._stream.getvalue().splitlines()]
+    assert [e["event"] for e in events] == [
+        "play_start",
+        "task_start",
+        "result",
+        "result",
+        "stats",
+    ]
+    assert cb.results == []
+
+    (ok, failed) = (events[2], events[3])
+    assert ok["host"] == "one" and ok["task"] == {"name": "echo", "id": "t1"}
+    assert ok["result"] == {"rc": 0, "action": "command", "dropped_keys": {"stdout": 100}}
+    assert failed["result"]["failed"] == "ignored"
+    assert events[4]["stats"]["two"]["failures"] == 1
+
+
+def test_json_document(mocker):
+    cb = _callback()
+    display = mocker.patch.object(cb._display, "display")
+    _run(cb)
+
+    assert cb._stream.getvalue() == ""
+    output = json.loads(display.call_args[0][0])
+    hosts = output["plays"][0]["tasks"][0]["hosts"]
+    assert hosts["one"]["stdout"] == "x" * 100
+    assert hosts["two"]["failed"] == "ignored"
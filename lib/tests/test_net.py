@@ -74,6 +74,32 @@ class TestSubnets:
     def test_subnets_get(self, subnets):
         assert subnets[0] == IPv4Network("10.0.0.0/28")
 
+    def test_subnets_exclude_supernet(self, subnets):
+        subnets.exclude(["10.0.0.0/26", "10.0.0.64/32", "192.168.0.0/16"])
+        assert [str(s) for s in subnets.slice(2)] == ["10.0.0.80/28", "10.0.0.96/28"]
+
+    def test_subnets_exclude_stored_ranges(self, subnets):
+        assert len(subnets.ranges) == 16
+        subnets.exclude(["10.0.0.32/27"])
+        assert len(subnets.ranges) == 14
+        assert IPv4Network("10.0.0.48/28") not in subnets.ranges
+
+    def test_subnets_shuffle_large_network(self):
+        subnets = Subnets(cidr="10.0.0.0/8", limit=100, new_prefix=28)
+        excludes = ["10.0.0.0/9"] + [f"10.128.{i}.0/28" for i in range(256)]
+        subnets.exclude(excludes)
+        subnets.shuffle()
+        selected = subnets.slice()
+        assert subnets.slice() == selected
+        assert len(set(selected)) == 100
+        for s in selected:
+            assert not any(s.overlaps(IPv4Network(e)) for e in excludes)
+
+    def test_subnets_exhausted(self, subnets):
+        subnets.exclude(["10.0.0.0/25", "10.0.0.128/26", "10.0.0.192/27"])
+        subnets.shuffle()
+        assert sorted(str(s) for s in subnets.slice(4)) == ["10.0.0.224/28", "10.0.0.240/28"]
+
 
 class TestArchitectureSubnet:
     def test_exclusion_files(self):
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""Tests for the encrypted_password filter."""
+
+import base64
+import hashlib
+from hmac import HMAC
+
+import pytest
+
+from ..filter_plugins.passwords import (
+    _scram_password,
+    encrypted_password,
+    saslprep,
+    scram_password,
+)
+
+PASSWORDS = ["secret", "aB3!@#%^&*()_+", "pässwörd", "I­X", "Ⅸ", "a b"]
+
+
+def passlib_scram_password(password, salt, rounds):
+    """Returns the verifier that scram_password used to compute with passlib."""
+    scram = pytest.importorskip("passlib.hash").scram
+    s = scram.using(rounds=rounds, salt=salt, algs="sha-1,sha-256").hash(password)
+    (salt, rounds, SaltedPassword) = scram.extract_digest_info(s, "sha-256")
+    ClientKey = HMAC(SaltedPassword, b"Client Key", hashlib.sha256).digest()
+    ServerKey = HMAC(SaltedPassword, b"Server Key", hashlib.sha256).digest()
+    StoredKey = hashlib.sha256(ClientKey).digest()
+    return "SCRAM-SHA-256$%s:%s$%s:%s" % (
+        rounds,
+        base64.b64encode(salt).decode("ascii"),
+        base64.b64encode(StoredKey).decode("ascii"),
+        base64.b64encode(ServerKey).decode("ascii"),
+    )
+
+
+def test_md5_password():
+    expected = "md5" + hashlib.md5(b"secretalice").hexdigest()
+    assert encrypted_password("md5", "secret", "alice") == expected
+
+
+def test_saslprep():
+    assert saslprep("secret") == "secret"
+    assert saslprep("I­X") == "IX"
+    assert saslprep("Ⅸ") == "IX"
+    assert saslprep("a b") == "a b"
+    # Like Postgres, we use passwords that SASLprep rejects as they are.
+    assert saslprep("اxا") == "اxا"
+    assert saslprep("a\u0007b") == "a\u0007b"
+
+
+@pytest.mark.parametrize("password", PASSWORDS)
+def test_scram_password(password):
+    """test that we compute the same verifiers as we did with passlib"""
+    salt = b"0123456789ab"
+    for rounds in (4096, 100000):
+        expected = passlib_scram_password(password, salt, rounds)
+        assert scram_password(password, salt=salt, rounds=rounds) == expected
+
+
+def test_scram_password_memoised():
+    salt = b"fedcba987654"
+    first = scram_password("memo", salt=salt, rounds=4096)
+    hits = _scram_password.cache_info().hits
+    assert scram_password("memo", salt=bytearray(salt), rounds="4096") is first
+    assert _scram_password.cache_info().hits == hits + 1
+
+
+def test_encrypted_password_scram():
+    v1 = encrypted_password("scram-sha-256", "secret")
+    v2 = encrypted_password("scram-sha-256", "secret")
+    assert v1.startswith("SCRAM-SHA-256$100000:") and v1 != v2
+    (_, info, _) = v1.split("$")
+    assert len(base64.b64decode(info.split(":")[1])) == 12
+
+    # The salt and rounds of an existing verifier are reused, so the result
+    # is the same if the password has not changed.
+    assert encrypted_password("scram-sha-256", "secret", existing_password=v1) == v1
+    assert encrypted_password("scram-sha-256", "other", existing_password=v1) != v1
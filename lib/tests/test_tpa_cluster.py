@@ -81,5 +81,98 @@ class TestCluster:
             basic_bdr_cluster.instances.get_names() == from_yaml.instances.get_names()
         )
 
-        # test covering _reorder_keys() function
-        assert from_yaml.to_yaml()
+        # the original text is reproduced if nothing has changed
+        with open(output_file) as f:
+            assert from_yaml.to_yaml() == f.read()
+
+    def test_cluster_yaml_changes(self, tmp_path):
+        """test that to_yaml() preserves everything that hasn't changed"""
+        config = """---
+# The cluster
+architecture: PGD-Always-ON
+cluster_name: speedy
+cluster_vars:
+  bdr_version: '5'   # keep this
+  # and this
+  postgres_flavour: 2q
+  extra_postgres_extensions:
+    - pglogical
+
+# Locations
+locations:
+- Name: first
+
+instance_defaults: {}
+instances:
+- Name: one   # changed
+  location: first
+  node: 1
+  role: [bdr]
+
+# Second
+- Name: two
+  location: first
+  node: 2
+"""
+        output_file = tmp_path / "config.yml"
+        output_file.write_text(config)
+        cluster = Cluster.from_yaml(str(output_file))
+        assert cluster.to_yaml() == config
+
+        cluster.vars["postgres_flavour"] = "pgextended"
+        cluster.vars["extra_postgres_extensions"].remove("pglogical")
+        cluster.vars["bdr_node_group"] = "top"
+        cluster.instances.with_name("one").only().add_role("witness")
+        cluster.add_instance("three", location_name="first")
+
+        assert cluster.to_yaml() == config.replace(
+            "2q\n", "pgextended\n"
+        ).replace(
+            ":\n    - pglogical\n", ": []\n  bdr_node_group: top\n"
+        ).replace(
+            "- Name: one   # changed\n  location: first\n  node: 1\n  role: [bdr]\n",
+            "- Name: one\n  location: first\n  node: 1\n  role:\n  - bdr\n  - witness\n",
+        ) + "- Name: three\n  location: first\n  node: 3\n"
+
+    def test_cluster_node_ids(self, basic_bdr_cluster):
+        """test node numbers assigned to new instances"""
+        assert [i.settings["node"] for i in basic_bdr_cluster.instances] == [1, 2]
+
+        basic_bdr_cluster.add_instance(
+            "numbered", location_name="first", settings={"node": 10}
+        )
+        assert basic_bdr_cluster.add_instance("next", location_name="first").settings["node"] == 11
+
+        basic_bdr_cluster.instances.with_name("data_node").only().set_settings({"node": 20})
+        assert basic_bdr_cluster.next_node_id() == 21
+
+    def test_cluster_instance_indexes(self, basic_bdr_cluster):
+        """test that queries notice changes to the cluster's instances"""
+        instances = basic_bdr_cluster.instances
+        assert instances.with_role("bdr").get_names() == ["data_node"]
+        assert basic_bdr_cluster.instances is instances
+
+        instances.with_name("proxy_node").add_role("bdr")
+        assert instances.with_role("bdr").get_names() == ["data_node", "proxy_node"]
+
+        basic_bdr_cluster.add_instance("new_node", location_name="first", roles=["bdr"])
+        assert basic_bdr_cluster.instances.with_role("bdr").get_names() == [
+            "data_node",
+            "proxy_node",
+            "new_node",
+        ]
+
+    @pytest.mark.parametrize("n", [10, 100, 1000, 10000])
+    def test_cluster_scaling(self, n):
+        """test building and querying large clusters"""
+        c = Cluster("large", "PGD-X")
+        for loc in range(10):
+            c.add_location(f"loc{loc}")
+        for k in range(n):
+            roles = ["bdr", "pgd-proxy" if k % 3 == 0 else "data"]
+            c.add_instance(f"i{k}", location_name=f"loc{k % 10}", roles=roles)
+
+        assert c.instances.with_name(f"i{n - 1}").only().settings["node"] == n
+        assert len(c.instances.in_location("loc0")) == n // 10
+        assert len(c.instances.with_roles(["bdr", "pgd-proxy"])) == (n + 2) // 3
+        assert len(c.instances.without_role("pgd-proxy")) == n - (n + 2) // 3
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+import pytest
+
+from tpa.commands.configure_batch import FleetSubnets, load_manifest
+from tpa.exceptions import ConfigureError
+
+FIXTURES = "lib/tests/net_fixtures/cluster_config"
+
+
+def test_fleet_subnets():
+    fleet = FleetSubnets()
+
+    excluded = fleet.excluded_subnets([f"{FIXTURES}/cluster1"])
+    assert excluded
+
+    fleet.allocate(["10.33.240.0/28"])
+    assert set(fleet.excluded_subnets([f"{FIXTURES}/cluster1"])) == set(
+        excluded + ["10.33.240.0/28"]
+    )
+    assert fleet.excluded_subnets([]) == ["10.33.240.0/28"]
+
+
+def test_load_manifest(tmp_path):
+    manifest = tmp_path / "manifest.yml"
+    manifest.write_text(
+        """
+args: --platform docker --os Debian
+clusters:
+  - cluster: /tmp/one/
+    args: --architecture M1 --postgresql 16
+  - cluster: /tmp/two
+    args: [--architecture, M1, --postgresql, 15]
+"""
+    )
+
+    specs = load_manifest(str(manifest))
+    assert [s.cluster_dir for s in specs] == ["/tmp/one", "/tmp/two"]
+    assert specs[0].argv == [
+        "/tmp/one",
+        "--platform",
+        "docker",
+        "--os",
+        "Debian",
+        "--architecture",
+        "M1",
+        "--postgresql",
+        "16",
+    ]
+    assert specs[1].argv[-2:] == ["--postgresql", "15"]
+
+
+def test_load_manifest_without_cluster(tmp_path):
+    manifest = tmp_path / "manifest.yml"
+    manifest.write_text("clusters:\n  - args: --architecture M1\n")
+
+    with pytest.raises(ConfigureError):
+        load_manifest(str(manifest))
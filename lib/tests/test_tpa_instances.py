@@ -77,6 +77,21 @@ class TestInstance:
         """test __repr__ function"""
         assert str(basic_instance) == "Instance('basic')"
 
+    @pytest.mark.parametrize("location_name", ["known"])
+    def test_instance_resolved_settings(self, basic_cluster, basic_instance):
+        """test that resolved settings are reused until a setter runs"""
+        resolved = basic_instance.resolved_settings()
+        assert basic_instance.resolved_settings() is resolved
+
+        basic_instance.add_role("bdr")
+        assert basic_instance.resolved_settings() is not resolved
+        assert basic_instance.roles == ["bdr"]
+
+        basic_cluster._instance_defaults = {"role": ["barman"], "x": 1}
+        assert basic_instance.get_setting("x") == 1
+        basic_instance.remove_setting("role")
+        assert basic_instance.roles == ["barman"]
+
 
 @pytest.fixture
 def basic_instances(basic_cluster):
@@ -306,3 +321,35 @@ class TestInstances:
             [Instance("a", cluster=basic_cluster, location_name="known")]
         )
         assert instances.maybe().name == "a"
+
+    def test_instances_query_is_lazy(self, instances_with_roles):
+        """test that chained selections are evaluated once, in one pass"""
+        calls = []
+
+        def callback(i):
+            calls.append(i.name)
+            return True
+
+        query = (
+            instances_with_roles.with_role("bdr")
+            .select(callback)
+            .without_role("witness")
+            .in_location("known")
+        )
+        assert calls == []
+
+        assert query.only().name == "b"
+        assert len(query) == 1 and query[0].name == "b"
+        assert calls == ["a", "b"]
+
+    def test_instances_query_contains(self, instances_with_roles):
+        """test that membership is tested without evaluating the query"""
+        (a, b) = instances_with_roles
+        query = instances_with_roles.with_role("pgd-proxy")
+
+        assert b in query and a not in query
+        assert query._result is None
+        assert Instance("b", a._cluster, "known") not in query
+
+        assert query + instances_with_roles.with_role("witness") == [b, a]
+        assert query._result is not None and b in query
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""Tests for the tpa_secrets action plugin."""
+
+import os
+import stat
+from types import SimpleNamespace
+
+import pytest
+from ansible.errors import AnsibleActionFail
+from ansible.parsing.dataloader import DataLoader
+from ansible.parsing.vault import VaultSecret
+from ansible.template import Templar
+
+from ..action_plugins.tpa_secrets import ActionModule, read_secret, write_secret
+
+VAULT_SECRETS = [("default", VaultSecret(b"vaultpw"))]
+
+
+def action(names, vault_secrets=VAULT_SECRETS, **args):
+    loader = DataLoader()
+    loader.set_vault_secrets(vault_secrets)
+    return ActionModule(
+        task=SimpleNamespace(
+            args=dict(names=names, **args), async_val=0, check_mode=False
+        ),
+        connection=SimpleNamespace(_shell=SimpleNamespace(tmpdir="/nonexistent")),
+        play_context=SimpleNamespace(check_mode=False),
+        loader=loader,
+        templar=Templar(loader=loader),
+        shared_loader_obj=None,
+    )
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    return dict(cluster_dir=str(tmp_path), cluster_tag="speedy")
+
+
+def secret_path(cluster, name):
+    return os.path.join(
+        cluster["cluster_dir"],
+        "inventory/group_vars/speedy/secrets/%s.yml" % name,
+    )
+
+
+def test_write_secret(tmp_path):
+    path = str(tmp_path / "secrets" / "x.yml")
+    assert write_secret(path, "x: 1\n")
+    assert not write_secret(path, "x: 2\n")
+    assert open(path).read() == "x: 1\n"
+    assert os.listdir(os.path.dirname(path)) == ["x.yml"]
+
+
+def test_tpa_secrets(cluster):
+    names = ["postgres_password", "repmgr_password", "postgres_password"]
+    r = action(names).run(task_vars=cluster)
+
+    assert r["changed"]
+    assert r["generated"] == ["postgres_password", "repmgr_password"]
+    assert sorted(r["secrets"]) == ["postgres_password", "repmgr_password"]
+    for name, value in r["secrets"].items():
+        path = secret_path(cluster, name)
+        assert not stat.S_IMODE(os.stat(path).st_mode) & 0o077
+        assert "$ANSIBLE_VAULT;1.1;AES256" in open(path).read()
+        assert value not in open(path).read()
+        assert read_secret(path, name, VAULT_SECRETS) == value
+
+    # The files are readable by ansible-vault in the usual way.
+    loader = DataLoader()
+    loader.set_vault_secrets(VAULT_SECRETS)
+    path = secret_path(cluster, "repmgr_password")
+    assert loader.load_from_file(path) == {
+        "repmgr_password": r["secrets"]["repmgr_password"]
+    }
+
+    # Secrets that exist and are defined are left alone, and those that exist
+    # but were not loaded with the inventory are read back.
+    task_vars = dict(cluster, postgres_password=r["secrets"]["postgres_password"])
+    again = action(names + ["replication_password"]).run(task_vars=task_vars)
+    assert again["changed"]
+    assert again["generated"] == ["replication_password"]
+    assert sorted(again["secrets"]) == ["replication_password", "repmgr_password"]
+    assert again["secrets"]["repmgr_password"] == r["secrets"]["repmgr_password"]
+
+    task_vars.update(again["secrets"])
+    assert not action(names, vault_secrets=[]).run(task_vars=task_vars)["changed"]
+
+
+def test_tpa_secrets_password_file(cluster, tmp_path):
+    script = tmp_path / "use-vault"
+    # The script must be run in the cluster directory.
+    script.write_text("#!/bin/sh\ntest -d inventory/group_vars && echo vaultpw\n")
+    script.chmod(0o755)
+    os.makedirs(os.path.join(cluster["cluster_dir"], "inventory/group_vars"))
+
+    r = action(["y"], vault_secrets=[], vault_password_file=str(script)).run(
+        task_vars=cluster
+    )
+    assert r["generated"] == ["y"]
+    path = secret_path(cluster, "y")
+    assert read_secret(path, "y", VAULT_SECRETS) == r["secrets"]["y"]
+
+    with pytest.raises(AnsibleActionFail, match="no vault password"):
+        action(["z"], vault_secrets=[]).run(task_vars=cluster)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+import os
+
+import pytest
+
+from tpa.subnet_registry import SubnetRegistry, config_subnets
+from tpaexec.architecture import Architecture
+from tpaexec.exceptions import ArchitectureError
+
+
+def _cluster(tmp_path, name, subnets):
+    d = tmp_path / name
+    d.mkdir(exist_ok=True)
+    instances = "".join(f"- Name: {name}{i}\n  subnet: {s}\n" for i, s in enumerate(subnets))
+    (d / "config.yml").write_text(f"instances:\n{instances}")
+    return str(d)
+
+
+def test_subnet_registry_reparses_only_changed_files(tmp_path, mocker):
+    one = _cluster(tmp_path, "one", ["10.33.1.0/28", "10.33.1.16/28"])
+    two = _cluster(tmp_path, "two", ["10.33.2.0/28"])
+    path = str(tmp_path / "registry.json")
+
+    r = SubnetRegistry(path)
+    assert r.subnets(one) == ["10.33.1.0/28", "10.33.1.16/28"]
+    assert r.subnets(two) == ["10.33.2.0/28"]
+    r.save()
+
+    # A new registry loaded from the file needs to parse only the config.yml
+    # that has changed.
+    _cluster(tmp_path, "two", ["10.33.2.0/28", "10.33.2.128/25"])
+    parse = mocker.patch("tpa.subnet_registry.config_subnets", wraps=config_subnets)
+    r = SubnetRegistry(path)
+    assert r.subnets(one) == ["10.33.1.0/28", "10.33.1.16/28"]
+    assert r.subnets(two) == ["10.33.2.0/28", "10.33.2.128/25"]
+    parse.assert_called_once_with(os.path.join(two, "config.yml"))
+
+    assert r.overlapping("10.33.2.128/28") == [
+        ("10.33.2.128/25", os.path.join(two, "config.yml"))
+    ]
+    assert [s for (s, _) in r.overlapping("10.33.0.0/16")] == [
+        "10.33.1.0/28",
+        "10.33.1.16/28",
+        "10.33.2.0/28",
+        "10.33.2.128/25",
+    ]
+    assert r.overlapping("10.34.0.0/16") == []
+
+
+def test_subnet_registry_ignores_bad_file(tmp_path):
+    path = tmp_path / "registry.json"
+    path.write_text("not json")
+    r = SubnetRegistry(str(path))
+    assert r.clusters == {}
+
+
+def test_get_subnets_from_registry(tmp_path, monkeypatch):
+    one = _cluster(tmp_path, "one", ["10.33.1.0/28"])
+    monkeypatch.setenv("TPA_SUBNET_REGISTRY", str(tmp_path / "registry.json"))
+
+    assert Architecture._get_subnets_from([one]) == ["10.33.1.0/28"]
+    assert os.path.exists(tmp_path / "registry.json")
+
+    with pytest.raises(ArchitectureError):
+        Architecture._get_subnets_from([str(tmp_path / "missing")])
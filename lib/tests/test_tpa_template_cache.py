@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+import os
+
+from tpa.template_cache import TemplateCache, yaml_load
+
+
+def _template(tmp_path, text="a: {{ a }}\n"):
+    t = tmp_path / "t.yml.j2"
+    t.write_text(text)
+    return str(t)
+
+
+def test_template_cache_key(tmp_path):
+    t = _template(tmp_path)
+    c = TemplateCache()
+
+    assert c.key(t, {"a": 1}) == c.key(t, {"a": 1})
+    assert c.key(t, {"a": 1}) != c.key(t, {"a": 2})
+
+    # Vars that cannot be serialised cannot be cached
+    assert c.key(t, {"a": object()}) is None
+
+    # Changing the template changes the key
+    k = c.key(t, {"a": 1})
+    st = os.stat(t)
+    with open(t, "w") as f:
+        f.write("b: {{ a }}\n")
+    os.utime(t, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert c.key(t, {"a": 1}) != k
+
+
+def test_template_cache_lru():
+    c = TemplateCache(maxsize=2)
+    c.put("k1", "one")
+    c.put("k2", "two")
+    assert c.get("k1") == "one"
+    c.put("k3", "three")
+
+    assert c.get("k2") is None
+    assert c.get("k1") == "one"
+    assert c.get("k3") == "three"
+    assert (c.hits, c.misses) == (3, 1)
+
+
+def test_template_cache_persistent(tmp_path):
+    t = _template(tmp_path)
+    d = str(tmp_path / "cache")
+
+    c1 = TemplateCache(directory=d)
+    k = c1.key(t, {"a": 1})
+    c1.put(k, "a: 1\n")
+
+    c2 = TemplateCache(directory=d)
+    assert c2.get(k) == "a: 1\n"
+    assert c2.get(c2.key(t, {"a": 2})) is None
+
+
+def test_yaml_load():
+    assert yaml_load("a: [1, 2]\n") == {"a": [1, 2]}
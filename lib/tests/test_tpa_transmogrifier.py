@@ -12,7 +12,15 @@ from tpa.checkresult import CheckResult
 from tpa.changedescription import ChangeDescription
 from tpa.cluster import Cluster
 
-from tpa.transmogrifier import Transmogrifier, opt, apply, check, describe
+from tpa.transmogrifier import (
+    Transmogrifier,
+    opt,
+    apply,
+    check,
+    describe,
+    describe_timings,
+    ordered,
+)
 from tpa.exceptions import ConfigureError, TransmogrifierError
 
 
@@ -34,6 +42,26 @@ class BasicTransmogrifier(Transmogrifier):
         return CheckResult()
 
 
+class CountingTransmogrifier(BasicTransmogrifier):
+    """Records the order in which Transmogrifiers are checked and applied"""
+
+    def __init__(self, name, log, _requires=None, ready_after=None):
+        super().__init__(_requires)
+        self.name = name
+        self.log = log
+        self.ready_after = ready_after
+
+    def is_ready(self, cluster: Cluster) -> bool:
+        return self.ready_after is None or ("apply", self.ready_after) in self.log
+
+    def check(self, cluster: Cluster) -> CheckResult:
+        self.log.append(("check", self.name))
+        return CheckResult()
+
+    def apply(self, cluster: Cluster):
+        self.log.append(("apply", self.name))
+
+
 @pytest.fixture
 def basic_transmogrifier():
     """generate a basic Transmogrifier"""
@@ -230,3 +258,54 @@ class TestTransmogrifier:
         """test describe helper function with no applicable Transmogrifier"""
 
         assert type(check(basic_cluster, tlist)) == CheckResult
+
+    def test_transmogrifier_shared_dependency(self, basic_cluster):
+        """test that a shared dependency is checked, applied, and described once"""
+
+        log = []
+        repos = CountingTransmogrifier("repos", log)
+        a = CountingTransmogrifier("a", log, _requires=[repos])
+        b = CountingTransmogrifier("b", log, _requires=[repos, a])
+
+        assert ordered([b, a]) == [repos, a, b]
+
+        apply(basic_cluster, [a, b])
+        assert log == [
+            ("check", "repos"),
+            ("check", "a"),
+            ("check", "b"),
+            ("apply", "repos"),
+            ("apply", "a"),
+            ("apply", "b"),
+        ]
+        assert str(describe(basic_cluster, [a, b])).count("one change") == 3
+
+        timings = str(describe_timings([b])).splitlines()
+        assert timings[0] == "* Time taken to apply changes"
+        assert [t.split(":")[0] for t in timings[1:]] == [
+            "  * CountingTransmogrifier"
+        ] * 3
+
+    def test_transmogrifier_apply_waits(self, basic_cluster):
+        """test that a Transmogrifier that isn't ready (and anything that
+        requires it) is applied after the others"""
+
+        log = []
+        late = CountingTransmogrifier("late", log, ready_after="other")
+        dependent = CountingTransmogrifier("dependent", log, _requires=[late])
+        other = CountingTransmogrifier("other", log)
+
+        apply(basic_cluster, [dependent, other])
+        assert [name for (op, name) in log if op == "apply"] == [
+            "other",
+            "late",
+            "dependent",
+        ]
+
+    def test_transmogrifier_requires_itself(self):
+        """test that circular dependencies are reported"""
+
+        t = BasicTransmogrifier()
+        t.require(BasicTransmogrifier(_requires=[t]))
+        with pytest.raises(TransmogrifierError):
+            ordered([t])
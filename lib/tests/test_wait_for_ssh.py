@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""Tests for the wait_for_ssh action plugin."""
+
+import itertools
+import shutil
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar
+
+from ..action_plugins.wait_for_ssh import (
+    ActionModule,
+    backoff,
+    ssh_banner,
+    ssh_settings,
+    wait_for_banner,
+)
+
+needs_ssh = pytest.mark.skipif(
+    not shutil.which("ssh"), reason="the ssh client is not installed"
+)
+
+
+class FakeSSHD:
+    """Listens on a local port (after an optional delay) and sends an SSH
+    banner to every connection."""
+
+    def __init__(self, delay=0, banner=b"SSH-2.0-OpenSSH_9.6\r\n"):
+        # We reserve a port now, but don't listen on it until later.
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.banner = banner
+        self.connections = 0
+        if not delay:
+            self.sock.listen(16)
+        threading.Thread(target=self.serve, args=(delay,), daemon=True).start()
+
+    def serve(self, delay):
+        if delay:
+            time.sleep(delay)
+            self.sock.listen(16)
+        while True:
+            try:
+                (conn, _) = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with conn:
+                conn.sendall(self.banner)
+
+    def close(self):
+        # Closing the socket doesn't interrupt a blocked accept().
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def _unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_backoff():
+    intervals = list(itertools.islice(backoff(1, 10), 8))
+    limits = [1, 2, 4, 8, 10, 10, 10, 10]
+    assert all(x / 2 <= i <= x for (i, x) in zip(intervals, limits))
+
+
+def test_ssh_banner():
+    sshd = FakeSSHD(banner=b"Hello\r\nSSH-2.0-OpenSSH_9.6\r\n")
+    try:
+        assert ssh_banner("127.0.0.1", sshd.port, 1) == "SSH-2.0-OpenSSH_9.6"
+    finally:
+        sshd.close()
+
+
+def test_wait_for_banner():
+    sshd = FakeSSHD(delay=0.3)
+    try:
+        r = wait_for_banner("127.0.0.1", sshd.port, 5, 1, 0.05, 0.1)
+    finally:
+        sshd.close()
+
+    assert r["banner"] == "SSH-2.0-OpenSSH_9.6"
+    assert r["attempts"] > 1 and 0.3 <= r["elapsed"] < 2
+    assert sshd.connections == 1
+
+    r = wait_for_banner("127.0.0.1", _unused_port(), 0.3, 1, 0.05, 0.1)
+    assert r["failed"] and r["msg"].startswith("timed out waiting for ssh")
+
+
+def _action(args=None):
+    return ActionModule(
+        task=SimpleNamespace(args=args or {}),
+        connection=None,
+        play_context=None,
+        loader=DataLoader(),
+        templar=Templar(loader=DataLoader()),
+        shared_loader_obj=None,
+    )
+
+
+@needs_ssh
+def test_ssh_address(tmp_path):
+    ssh_config = tmp_path / "ssh_config"
+    ssh_config.write_text(
+        "Host jumped\n  ProxyJump gateway\n"
+        "Host proxied\n  ProxyCommand nc %h %p\n"
+        "Host aliased\n  HostName 127.0.0.2\n  Port 2222\n"
+    )
+    args = "-F '%s'" % ssh_config
+
+    action = _action()
+    assert ssh_settings("aliased", args=["-F", str(ssh_config)])["port"] == "2222"
+
+    # Jump hosts are found in ssh_config as well as in the inventory.
+    assert action.ssh_address({"ansible_ssh_common_args": args}, "jumped") is None
+    assert action.ssh_address({"ansible_ssh_common_args": args}, "proxied") is None
+    assert (
+        action.ssh_address({"ansible_ssh_extra_args": "-J gateway"}, "plain") is None
+    )
+    assert action.ssh_address({"ansible_connection": "docker"}, "plain") is None
+
+    assert action.ssh_address({"ansible_ssh_common_args": args}, "aliased") == (
+        "127.0.0.2",
+        2222,
+    )
+    assert action.ssh_address(
+        {"ansible_ssh_common_args": args, "ansible_port": 22}, "aliased"
+    ) == ("127.0.0.2", 22)
+    assert action.ssh_address({"ansible_host": "127.0.0.3"}, "plain") == (
+        "127.0.0.3",
+        22,
+    )
+
+
+@needs_ssh
+def test_wait_for_hosts():
+    servers = [FakeSSHD(delay=d) for d in (0, 0.5, 1)]
+    hostvars = {
+        "h%d" % n: {"ansible_host": "127.0.0.1", "ansible_port": str(s.port)}
+        for n, s in enumerate(servers)
+    }
+    hostvars["docker"] = {"ansible_connection": "docker"}
+
+    action = _action()
+
+    start = time.monotonic()
+    try:
+        r = action.wait_for_hosts(
+            sorted(hostvars), {"hostvars": hostvars}, 5, 1, 0.05, 0.1
+        )
+    finally:
+        for s in servers:
+            s.close()
+
+    # The hosts are checked concurrently, so it takes as long as the slowest.
+    assert time.monotonic() - start < 2
+    assert r["skipped_hosts"] == ["docker"]
+    assert sorted(r["hosts"]) == ["h0", "h1", "h2"]
+    # (The delays start before the ssh settings are looked up, so we can't
+    # be sure how long each host took, only which ones had to wait.)
+    assert r["hosts"]["h0"]["attempts"] == 1
+    assert r["hosts"]["h1"]["attempts"] > 1 and r["hosts"]["h2"]["attempts"] > 1
+    assert r["msg"].startswith("ssh is available on 3 hosts (slowest: h2, ")
+    assert not r.get("failed")
+
+    r = action.wait_for_hosts(["h0"], {"hostvars": hostvars}, 0.2, 1, 0.05, 0.1)
+    assert r["failed"] and r["msg"] == "timed out waiting for ssh on h0"
@@ -4,13 +4,11 @@
 
 import argparse
 import os
-import io
 from pathlib import Path
 import re
 import subprocess
 import sys
 import uuid
-import yaml
 
 from typing import List
 
@@ -18,6 +16,8 @@ from .platform import Platform
 from .cluster import Cluster
 
 from ansible.template import Templar
+from .template_cache import template_cache, yaml_load
+from .subnet_registry import config_subnets, subnet_registry
 
 from .exceptions import ArchitectureError, ConfigureError, ExternalCommandError
 
@@ -43,6 +43,10 @@ class Architecture:
 
         self._net = None
 
+        # Set by `tpaexec configure-batch` to share subnet allocation between
+        # the clusters it generates (see tpa.commands.configure_batch)
+        self.fleet = None
+
     def argument_parser(self):
         """
         Returns an ArgumentParser object configured to accept the options
@@ -849,16 +853,27 @@ class Architecture:
         the output as YAML, and returns the resulting data structure
         """
         text = self.expand_template(filename, vars, loader)
-        return yaml.load(text, Loader=yaml.FullLoader)
+        return yaml_load(text)
 
     def expand_template(self, filename, vars, loader=None):
         """
         Takes a template filename and some args and returns the template output
+        (which may come from the template_cache if the same template has been
+        expanded with the same args before)
         """
         loader = loader or self.loader()
-        templar = Templar(loader=loader, variables=vars)
-        template = loader._tpaexec_get_template(filename)
-        return templar.do_template(template)
+        path = loader._tpaexec_find_template(filename)
+        if path is None:
+            return "{}"
+
+        cache = template_cache()
+        key = cache.key(path, vars)
+        text = cache.get(key)
+        if text is None:
+            (template, _) = cache.source(path)
+            text = loader._tpaexec_templar(vars).do_template(template)
+            cache.put(key, text)
+        return text
 
     def loader(self, basedirs=None):
         """
@@ -868,8 +883,12 @@ class Architecture:
         the loader will return the contents of that template directly.
         """
 
+        if basedirs is None and getattr(self, "_loader", None) is not None:
+            return self._loader
+
         class MinimalLoader(object):
             _basedirs = []
+            _templar = None
 
             def __init__(self, basedirs):
                 self._basedirs = basedirs
@@ -877,16 +896,33 @@ class Architecture:
             def get_basedir(self):
                 return self._basedirs[0]
 
-            def _tpaexec_get_template(self, filename):
+            def _tpaexec_find_template(self, filename):
                 for d in self._basedirs:
                     t = "%s/%s" % (d, filename)
                     if os.path.exists(t):
-                        return io.open(t, "r", encoding="utf-8").read()
+                        return t
                 if filename.startswith("/") and os.path.exists(filename):
-                    return io.open(filename, "r", encoding="utf-8").read()
-                return "{}"
+                    return filename
+                return None
 
-        return MinimalLoader(basedirs or self.template_directories())
+            def _tpaexec_get_template(self, filename):
+                t = self._tpaexec_find_template(filename)
+                if t is None:
+                    return "{}"
+                return template_cache().source(t)[0]
+
+            def _tpaexec_templar(self, vars):
+                # Setting up a Templar is expensive, so we reuse one per loader
+                if self._templar is None:
+                    self._templar = Templar(loader=self, variables=vars)
+                else:
+                    self._templar.available_variables = vars
+                return self._templar
+
+        loader = MinimalLoader(basedirs or self.template_directories())
+        if basedirs is None:
+            self._loader = loader
+        return loader
 
     @property
     def net(self):
@@ -912,12 +948,14 @@ class Architecture:
         requirements.
 
         """
+        exclude_dirs = self.args.get("exclude_subnet_dirs", [])
+        if self.fleet is not None:
+            excludes = self.fleet.excluded_subnets(exclude_dirs)
+        else:
+            excludes = self._get_subnets_from(exclude_dirs=exclude_dirs)
+
         subnets = self.net.subnets(limit=num)
-        subnets.exclude(
-            excludes=self._get_subnets_from(
-                exclude_dirs=self.args.get("exclude_subnet_dirs", [])
-            )
-        )
+        subnets.exclude(excludes=excludes)
 
         if len(list(subnets)) < num:
             raise ArchitectureError(
@@ -932,7 +970,14 @@ class Architecture:
             subnets.shuffle()
 
         # Select a number of subnets according to the limit set (and convert from an iterator to a list of strings)
-        return [str(s) for s in subnets]
+        selected = [str(s) for s in subnets]
+
+        # When configuring many clusters at once, later clusters must not be
+        # given the same subnets.
+        if self.fleet is not None:
+            self.fleet.allocate(selected)
+
+        return selected
 
     @staticmethod
     def _get_subnets_from(exclude_dirs):
@@ -942,30 +987,29 @@ class Architecture:
         If any subnet exclusion directories are specified, look for "subnet: a.b.c.d/n" declarations in
         config.yml files within the given directories and exclude those subnets from the list.
 
+        If TPA_SUBNET_REGISTRY is set, only the config.yml files that have changed since they were last
+        recorded in the registry are parsed.
+
         Args:
             exclude_dirs: List of directories to look in
 
         Returns: List of subnet ranges found
 
         """
+        registry = subnet_registry()
         values = []
         for dir_name in exclude_dirs:
             try:
-                with open(f"{dir_name}/config.yml") as exclude_config_yml:
-                    config_data = yaml.safe_load(exclude_config_yml)
-                    for key in ("instances", "locations"):
-                        values.extend(
-                            s["subnet"] for s in config_data.get(key) if s.get("subnet")
-                        )
-                    instance_default_subnet = config_data.get(
-                        "instance_defaults", {}
-                    ).get("subnet")
-                    if instance_default_subnet:
-                        values.append(instance_default_subnet)
+                if registry:
+                    values.extend(registry.subnets(dir_name))
+                else:
+                    values.extend(config_subnets(f"{dir_name}/config.yml"))
             except FileNotFoundError:
                 raise ArchitectureError(
                     f"Could not open a config.yml file in the provided path: {dir_name}"
                 )
+        if registry:
+            registry.save()
         return list(set(values))
 
     def update_cluster_tags(self, cluster_tags):
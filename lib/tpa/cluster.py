@@ -2,15 +2,16 @@
 # -*- coding: utf-8 -*-
 # © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Optional
 import yaml
-import copy
 
+from .config_document import ConfigDocument
 from .exceptions import ClusterError
 from .group import Group
 from .location import Location
 from .instance import Instance
 from .instances import Instances
+from .template_cache import SafeDumper
 
 
 class Cluster:
@@ -31,12 +32,16 @@ class Cluster:
 
     def __init__(self, cluster_name, architecture, platform=None, group_vars=None):
         self._name: str = cluster_name
-        self._original_yaml: Optional[Dict[str, Any]] = None
+        self._document: Optional[ConfigDocument] = None
         self._architecture: str = architecture
         self._platform: Optional[str] = platform
         self._group = Group(cluster_name, group_vars=group_vars)
         self._locations: List[Location] = []
+        self._locations_by_name: Dict[str, Location] = {}
         self._instances: List[Instance] = []
+        self._instances_by_name: Dict[str, Instance] = {}
+        self._instances_view: Optional[Instances] = None
+        self._max_node = 0
         self._instance_defaults = {}
         self._settings = {}
 
@@ -78,8 +83,14 @@ class Cluster:
 
     @property
     def instances(self):
-        """A list of instances in this cluster"""
-        return Instances(self._instances)
+        """A list of instances in this cluster
+
+        The same collection (with its indexes) is returned until the next
+        instance is added, so it must not be modified by the caller."""
+
+        if self._instances_view is None:
+            self._instances_view = Instances(self._instances)
+        return self._instances_view
 
     @property
     def instance_defaults(self):
@@ -104,7 +115,7 @@ class Cluster:
         """Returns the location with the given location_name, or None if it is
         not defined for this cluster."""
 
-        return next((loc for loc in self.locations if loc.name == location_name), None)
+        return self._locations_by_name.get(location_name)
 
     def add_location(self, location_name: str, **kwargs) -> Location:
         """Creates a location with the given name, add it to this cluster along
@@ -113,16 +124,31 @@ class Cluster:
         loc = Location(location_name, **kwargs)
         self._group.add_subgroup(loc.group)
         self._locations.append(loc)
+        self._locations_by_name.setdefault(location_name, loc)
         return loc
 
+    def next_node_id(self) -> int:
+        """Returns the node number to assign to a new instance, which is one
+        more than the largest node number assigned so far."""
+        return self._max_node + 1
+
+    def note_node_id(self, node):
+        """Records that the given node number has been assigned to one of the
+        instances in this cluster."""
+        if isinstance(node, int) and node > self._max_node:
+            self._max_node = node
+
     def add_instance(self, instance_name: str, roles: List = [], **kwargs):
         """Creates an instance with the given name, add it to this cluster, and
         return the new instance"""
-        if instance_name not in self.instances.get_names():
+        if instance_name not in self._instances_by_name:
             i = Instance(instance_name, cluster=self, **kwargs)
             for r in roles:
                 i.add_role(r)
             self._instances.append(i)
+            self._instances_by_name[instance_name] = i
+            self._instances_view = None
+            self.note_node_id(i.settings.get("node"))
             return i
         else:
             raise ClusterError(
@@ -154,38 +180,19 @@ class Cluster:
             }
         )
 
-        # XXX Quick prototype to reproduce original YAML document key order (but
-        # not comments, which we can't do with pyyaml anyway). Needs testing.
-
-        def _reorder_keys(d: Dict[str, Any], ref: Dict[str, Any]) -> Dict[str, Any]:
-            """Returns the contents of d while preserving the key order of
-            ref as far as possible."""
-            result = {}
-            for key, val in ref.items():
-                if key not in d:
-                    continue
-                if isinstance(val, dict) and isinstance(d[key], dict):
-                    result[key] = _reorder_keys(d[key], val)
-                    del d[key]
-                else:
-                    result[key] = d[key]
-                    del d[key]
-            result.update(d)
-            return result
-
-        if self._original_yaml:
-            c = _reorder_keys(c, self._original_yaml)
-        return yaml.safe_dump(c, sort_keys=False)
+        # If the cluster was loaded from config.yml, we reproduce the original
+        # text of anything that hasn't changed, including comments.
+
+        if self._document:
+            return self._document.render(c)
+        return yaml.dump(c, Dumper=SafeDumper, sort_keys=False)
 
     @staticmethod
     def from_yaml(config_filename, cluster_name=None):
         """Returns a new Cluster object initialised from the contents of the
         given config.yml file"""
 
-        y = {}
-        with open(config_filename) as doc:
-            y = yaml.safe_load(doc)
-            original_yaml = copy.deepcopy(y)
+        y, document = ConfigDocument.load(config_filename)
 
         if not cluster_name:
             cluster_name = "unknown"
@@ -195,7 +202,7 @@ class Cluster:
             y.pop("architecture", "unknown"),
             group_vars=y.pop("cluster_vars", {}),
         )
-        c._original_yaml = original_yaml
+        c._document = document
 
         locations = y.pop("locations", [])
         for loc in locations:
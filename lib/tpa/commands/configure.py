@@ -95,8 +95,13 @@ def configure(argv, tpa_dir=None):
 
 
     # the cluster object is now complete and we can write it
-    yaml_configuration = cluster.to_yaml()
+    write_configuration(cluster_dir, cluster.to_yaml())
 
+    arch.after_configuration(cluster)
+
+
+def write_configuration(cluster_dir, yaml_configuration):
+    """Creates the cluster directory and writes config.yml"""
     try:
         os.makedirs(cluster_dir)
         config_path = f"{cluster_dir}/config.yml"
@@ -105,6 +110,3 @@ def configure(argv, tpa_dir=None):
                 cfg.write(yaml_configuration)
     except OSError as e:
         raise ConfigureError(f"Could not write cluster directory: {str(e)}")
-
-
-    arch.after_configuration(cluster)
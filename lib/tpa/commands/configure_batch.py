@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""
+`tpaexec configure-batch` generates many cluster directories in one process.
+
+It reads a manifest that lists the clusters to create and the configure
+options for each, e.g.,
+
+    # Options that apply to every cluster (before the cluster's own args)
+    args: --platform docker --os Debian
+    clusters:
+      - cluster: ~/clusters/one
+        args: --architecture M1 --postgresql 16 --enable-repmgr
+      - cluster: ~/clusters/two
+        args: [--architecture, M1, --postgresql, "15", --enable-efm]
+
+and does what `tpaexec configure <cluster> <args>` would do for each cluster,
+but pays the costs of importing Ansible, constructing the argument parser, and
+setting up the template loader for each architecture only once. Subnets are
+allocated for the whole fleet in one pass, so that no two clusters in the batch
+are given the same subnets, and the config.yml in each --exclude-subnets-from
+directory is read only once. Finally, the cluster directories are written (and
+their git repositories created) in parallel by a pool of worker processes.
+"""
+
+import copy
+import multiprocessing
+import os
+import shlex
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from ..architecture import Architecture
+from ..architectures import all_architectures
+from ..cluster import Cluster
+from ..exceptions import ConfigureError
+from ..platform import Platform
+from .configure import write_configuration
+
+
+class FleetSubnets:
+    """Keeps track of the subnets that must be excluded when allocating subnets
+    for each cluster in a batch: those found in --exclude-subnets-from
+    directories (each of which is read only once), and those already allocated
+    to earlier clusters in the batch."""
+
+    def __init__(self):
+        self._dir_subnets = {}
+        self.allocated = set()
+
+    def excluded_subnets(self, exclude_dirs):
+        excludes = set(self.allocated)
+        for d in exclude_dirs:
+            if d not in self._dir_subnets:
+                self._dir_subnets[d] = Architecture._get_subnets_from([d])
+            excludes.update(self._dir_subnets[d])
+        return list(excludes)
+
+    def allocate(self, subnets):
+        self.allocated.update(subnets)
+
+
+class WarmArchitectures:
+    """Caches the argument parser and template loader for each combination of
+    architecture and platform, so that they are set up only once per batch."""
+
+    def __init__(self):
+        self._cache = {}
+
+    def prepare(self, arch, key):
+        """Parses the architecture's argv with the cached parser for the given
+        key (creating it if required), and gives it the cached loader."""
+        if key not in self._cache:
+            self._cache[key] = (arch.argument_parser(), arch.loader())
+        (parser, loader) = self._cache[key]
+
+        # The parsed args may share mutable defaults with the parser, and will
+        # be modified in place while configuring the cluster.
+        arch._args = copy.deepcopy(vars(parser.parse_args(args=arch._argv)))
+        arch._loader = loader
+
+
+class ClusterSpec:
+    """One cluster from the manifest, and the result of configuring it."""
+
+    def __init__(self, cluster_dir, argv):
+        self.cluster_dir = cluster_dir
+        self.argv = [cluster_dir] + argv
+        self.configuration = None
+        self.error = None
+        self._finish = None
+
+    def generate(self, tpa_dir, warm, fleet):
+        """Generates the contents of config.yml for this cluster, without
+        writing anything to disk."""
+        p = ArgumentParser(add_help=False)
+        p.add_argument("--architecture", "-a", required=True)
+        p.add_argument("--platform")
+        (parsed_args, _) = p.parse_known_args(self.argv)
+
+        arch_dir = os.path.join(tpa_dir, "architectures", parsed_args.architecture)
+        lib_dir = os.path.join(tpa_dir, "architectures", "lib")
+
+        if parsed_args.architecture in all_architectures:
+            self._generate(parsed_args, arch_dir, lib_dir, warm, fleet)
+        else:
+            self._generate_tpaexec(parsed_args, arch_dir, lib_dir, warm, fleet)
+
+    def _generate(self, parsed_args, arch_dir, lib_dir, warm, fleet):
+        arch = all_architectures[parsed_args.architecture](
+            directory=arch_dir, lib=lib_dir, argv=self.argv
+        )
+        platform_name = parsed_args.platform or arch.default_platform()
+        if platform_name not in arch.supported_platforms():
+            raise ConfigureError(
+                f"Unsupported platform for {arch.name}: {platform_name}"
+            )
+
+        platform = Platform.load(platform_name, arch)
+        arch.platform = platform
+        arch.fleet = fleet
+        warm.prepare(arch, (parsed_args.architecture, platform.name))
+        arch.validate_arguments(arch.args, platform)
+
+        cluster = Cluster(
+            cluster_name=os.path.basename(self.cluster_dir),
+            architecture=arch.name,
+            platform=platform.name,
+        )
+        arch.configure(cluster_dir=self.cluster_dir, cluster=cluster, platform=platform)
+        self.configuration = cluster.to_yaml()
+
+        def finish():
+            write_configuration(self.cluster_dir, self.configuration)
+            arch.after_configuration()
+
+        self._finish = finish
+
+    def _generate_tpaexec(self, parsed_args, arch_dir, lib_dir, warm, fleet):
+        # Architectures that tpa.architectures doesn't know about are handled
+        # by the older tpaexec.architectures module (as in `tpaexec configure`)
+        from tpaexec.architectures import SelectArchitecture
+
+        arch = SelectArchitecture(
+            name=parsed_args.architecture,
+            directory=arch_dir,
+            lib=lib_dir,
+            argv=self.argv,
+        )
+        arch.fleet = fleet
+        warm.prepare(arch, (parsed_args.architecture, arch.platform.name))
+        self.configuration = arch.build_configuration()
+
+        def finish():
+            arch.write_configuration(self.configuration)
+            arch.after_configuration()
+
+        self._finish = finish
+
+    def finish(self):
+        """Writes the cluster directory, config.yml, links, git repository,
+        etc."""
+        self._finish()
+
+
+def error_message(e):
+    """Returns a one-line description of the given exception"""
+    if isinstance(e, SystemExit):
+        return "invalid arguments (see above)"
+    return f'{getattr(e, "MSG", type(e).__name__)}: {e}'
+
+
+def load_manifest(filename):
+    """Returns a list of ClusterSpecs for the clusters listed in the given
+    manifest file."""
+    with open(filename) as f:
+        manifest = yaml.safe_load(f) or {}
+
+    def _args(a):
+        if a is None:
+            return []
+        if isinstance(a, str):
+            return shlex.split(a)
+        return [str(x) for x in a]
+
+    common_args = _args(manifest.get("args"))
+
+    specs = []
+    for c in manifest.get("clusters") or []:
+        if not c.get("cluster"):
+            raise ConfigureError(f"No cluster directory specified in {filename}: {c}")
+        cluster_dir = os.path.expanduser(c["cluster"]).rstrip("/")
+        specs.append(ClusterSpec(cluster_dir, common_args + _args(c.get("args"))))
+
+    return specs
+
+
+# The worker processes are forked after the configurations have been generated,
+# and inherit this list; only indexes into it need to be sent to them.
+_pending = []
+
+
+def _finish_pending(i):
+    try:
+        _pending[i].finish()
+    except Exception as e:
+        return error_message(e)
+    return None
+
+
+def configure_batch(argv, tpa_dir=None):
+    """Configures every cluster in a manifest, and returns the number of
+    clusters that could not be configured."""
+
+    # Function argument `tpa_dir` takes precedence over environment variable
+    tpa_dir = tpa_dir or os.environ.get("TPA_DIR", None)
+    if tpa_dir is None:
+        raise EnvironmentError("TPA_DIR not defined")
+
+    p = ArgumentParser(
+        "tpaexec configure-batch",
+        description="Generate cluster directories for every cluster in a manifest",
+    )
+    p.add_argument("manifest", help="path to a YAML manifest of clusters")
+    p.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of cluster directories to write in parallel",
+    )
+    args = p.parse_args(argv)
+
+    specs = load_manifest(args.manifest)
+    warm = WarmArchitectures()
+    fleet = FleetSubnets()
+
+    # We generate the configurations one by one, so that each cluster's subnets
+    # can be excluded from the choices for the next.
+
+    start = time.monotonic()
+    ready = []
+    for spec in specs:
+        try:
+            spec.generate(tpa_dir, warm, fleet)
+        except (Exception, SystemExit) as e:
+            spec.error = error_message(e)
+        else:
+            ready.append(spec)
+    generated = time.monotonic()
+
+    _pending[:] = ready
+    if args.jobs > 1 and len(ready) > 1:
+        with ProcessPoolExecutor(
+            max_workers=args.jobs, mp_context=multiprocessing.get_context("fork")
+        ) as pool:
+            errors = list(pool.map(_finish_pending, range(len(ready))))
+    else:
+        errors = [_finish_pending(i) for i in range(len(ready))]
+    for spec, error in zip(ready, errors):
+        spec.error = error
+    _pending[:] = []
+    written = time.monotonic()
+
+    failed = 0
+    for spec in specs:
+        if spec.error:
+            failed += 1
+            print(f"{spec.cluster_dir}: {spec.error}", file=sys.stderr)
+        else:
+            print(f"{spec.cluster_dir}: ok")
+
+    print(
+        f"Configured {len(specs) - failed}/{len(specs)} clusters "
+        f"(generate: {generated - start:.2f}s, write: {written - generated:.2f}s)"
+    )
+
+    return failed
@@ -10,7 +10,7 @@ from argparse import ArgumentParser
 from tpa.exceptions import ConfigureError
 
 from ..cluster import Cluster
-from ..transmogrifier import apply, describe, check
+from ..transmogrifier import apply, describe, describe_timings, check
 from ..transmogrifiers import transmogrifiers_from_args, add_all_transmogrifier_options
 
 
@@ -65,6 +65,8 @@ def reconfigure(args: List[str]) -> None:
         print(check(cluster, tlist))
     else:
         apply(cluster, tlist)
+        if parsed_args.timings:
+            print(describe_timings(tlist))
 
         output_file = os.path.join(cluster_dir, parsed_args.output_file)
         write_output(cluster, output_file)
@@ -92,6 +94,11 @@ def add_main_arguments(p: ArgumentParser):
         action="store_true",
         help="validate changes against the cluster, without changing anything",
     )
+    g.add_argument(
+        "--timings",
+        action="store_true",
+        help="show how long it took to apply each change",
+    )
     g.add_argument(
         "--output",
         dest="output_file",
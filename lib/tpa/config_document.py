@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""
+Round-trip editing of config.yml.
+
+Cluster.from_yaml() loads config.yml through a ConfigDocument, which remembers
+the original text and the YAML node tree it was parsed from. When the cluster
+is written out again, ConfigDocument.render() compares the new contents of
+each top-level setting with the node it was loaded from, and copies the
+original text for anything that has not changed. Only the settings that were
+changed are serialised again, and within cluster_vars, instance_defaults,
+locations, and instances, only the individual entries that were changed. So
+comments and formatting are preserved everywhere else, and the time taken
+depends on the size of the change, not the size of the file.
+
+If the document can't be edited this way (e.g., because it uses aliases or is
+not a block mapping), it is serialised again in full, as before.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+from yaml.nodes import MappingNode, Node, ScalarNode, SequenceNode
+
+from .template_cache import SafeDumper, SafeLoader
+
+# Matches the indicators of block scalars with "keep" chomping, where trailing
+# blank lines are part of the value.
+KEEP_CHOMPING = re.compile(r"[|>][1-9]?\+")
+
+
+class ConfigDocument:
+    """Represents the text of a YAML document and the nodes parsed from it."""
+
+    def __init__(self, text: str, root: Optional[Node], scalars: Dict[Node, Any]):
+        self._text = text
+        self._root = root
+        self._scalars = scalars
+
+    @staticmethod
+    def load(filename: str) -> Tuple[Any, "ConfigDocument"]:
+        """Returns the data parsed from the given YAML file, and a
+        ConfigDocument that can render a modified version of it."""
+
+        with open(filename) as f:
+            text = f.read()
+
+        loader = _Loader(text)
+        try:
+            root = loader.get_single_node()
+            data = loader.construct_document(root) if root is not None else None
+        finally:
+            loader.dispose()
+
+        return data, ConfigDocument(text, root, loader.scalars)
+
+    def render(self, data: Dict[str, Any]) -> str:
+        """Returns the YAML representation of the given dict, reusing the
+        original text for any entries that are unchanged."""
+
+        root = self._root
+        if not _is_block(root, MappingNode) or _has_aliases(root):
+            return _dump(data)
+
+        start = _line_start(self._text, root.value[0][0].start_mark.index)
+        body = self._mapping(root, data, start, len(self._text), depth=1)
+        if body is None:
+            return _dump(data)
+
+        return self._text[:start] + body
+
+    def _unchanged(self, node: Node, value: Any) -> bool:
+        """Returns true if the given node would be parsed as the given value."""
+
+        if isinstance(node, ScalarNode):
+            if node not in self._scalars:
+                return False
+            v = self._scalars[node]
+            return type(v) is type(value) and v == value
+
+        elif isinstance(node, SequenceNode):
+            return (
+                isinstance(value, list)
+                and len(value) == len(node.value)
+                and all(self._unchanged(n, v) for n, v in zip(node.value, value))
+            )
+
+        elif isinstance(node, MappingNode):
+            if not isinstance(value, dict) or len(value) != len(node.value):
+                return False
+            for k, v in node.value:
+                key = self._scalars.get(k)
+                if key is None or key not in value:
+                    return False
+                if not self._unchanged(v, value[key]):
+                    return False
+            return True
+
+        return False
+
+    def _mapping(
+        self, node: MappingNode, data: Dict[str, Any], start: int, end: int, depth: int
+    ) -> Optional[str]:
+        """Returns the text for the given dict, which replaces the block mapping
+        node occupying text[start:end], or None if it can't be done."""
+
+        text = self._text
+        bounds = []
+        for k, _ in node.value:
+            i = _line_start(text, k.start_mark.index)
+            if not isinstance(k, ScalarNode) or text[i : k.start_mark.index].strip():
+                return None
+            bounds.append(i)
+        if not _ascending([start] + bounds[1:] + [end]) or bounds[0] != start:
+            return None
+        bounds.append(end)
+
+        col = node.value[0][0].start_mark.column
+        pieces = []
+        seen = set()
+
+        for n, (k, v) in enumerate(node.value):
+            span = text[bounds[n] : bounds[n + 1]]
+            key = self._scalars.get(k)
+            if key is None or key not in data or key in seen:
+                pieces.append(_split_tail(span)[1])
+                continue
+            seen.add(key)
+            pieces.append(
+                self._entry(v, data[key], {key: data[key]}, span, bounds[n], col, depth)
+            )
+
+        added = {k: v for k, v in data.items() if k not in seen}
+        return _append(pieces, added, col)
+
+    def _sequence(
+        self, node: SequenceNode, data: List[Any], start: int, end: int, depth: int
+    ) -> Optional[str]:
+        """Returns the text for the given list, which replaces the block
+        sequence node occupying text[start:end], or None if it can't be done."""
+
+        text = self._text
+        bounds = []
+        for item in node.value:
+            i = _dash_line_start(text, item.start_mark.index)
+            if i is None:
+                return None
+            bounds.append(i)
+        if not _ascending([start] + bounds[1:] + [end]) or bounds[0] != start:
+            return None
+        bounds.append(end)
+
+        col = text.index("-", start) - start
+        pieces = []
+
+        for n, item in enumerate(node.value):
+            span = text[bounds[n] : bounds[n + 1]]
+            if n >= len(data):
+                pieces.append(_split_tail(span)[1])
+                continue
+            pieces.append(
+                self._entry(item, data[n], [data[n]], span, bounds[n], col, depth)
+            )
+
+        return _append(pieces, data[len(node.value) :], col)
+
+    def _entry(
+        self,
+        node: Node,
+        value: Any,
+        entry: Any,
+        span: str,
+        offset: int,
+        col: int,
+        depth: int,
+    ) -> str:
+        """Returns the text for one entry (a key and value, or a sequence item)
+        whose value was parsed from the given node, and which occupied the
+        given span of text, starting at the given offset."""
+
+        if self._unchanged(node, value):
+            return span
+
+        # If we can, we re-render only the changed entries of the value. The
+        # entry header (e.g., "cluster_vars:" and any comments that follow it)
+        # is kept as it was.
+
+        cls = {dict: MappingNode, list: SequenceNode}.get(type(value))
+        if depth > 0 and value and cls and _is_block(node, cls):
+            first = node.value[0]
+            first = first[0] if isinstance(first, tuple) else first
+            if first.start_mark.line > _line_of(self._text, offset):
+                end = offset + len(span)
+                body = None
+                if cls is MappingNode:
+                    start = _line_start(self._text, first.start_mark.index)
+                    body = self._mapping(node, value, start, end, depth - 1)
+                else:
+                    start = _dash_line_start(self._text, first.start_mark.index)
+                    if start is not None:
+                        body = self._sequence(node, value, start, end, depth - 1)
+                if body is not None:
+                    return self._text[offset:start] + body
+
+        return _dump(entry, col, tail=_split_tail(span)[1])
+
+
+class _Loader(SafeLoader):
+    """A SafeLoader that remembers the value constructed from each scalar
+    node, so that ConfigDocument can compare them with new values later."""
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.scalars: Dict[Node, Any] = {}
+
+    def construct_object(self, node, deep=False):
+        data = super().construct_object(node, deep=deep)
+        if isinstance(node, ScalarNode):
+            self.scalars[node] = data
+        return data
+
+
+def _dump(data: Any, col: int = 0, tail: str = "") -> str:
+    """Returns the YAML representation of data, indented by col spaces, and
+    followed by the given tail (blank lines and comments)."""
+
+    text = yaml.dump(data, Dumper=SafeDumper, sort_keys=False)
+    if col:
+        text = "".join(
+            " " * col + line if line.strip() else line
+            for line in text.splitlines(keepends=True)
+        )
+    if KEEP_CHOMPING.search(text):
+        tail = tail.lstrip(" \n")
+    return text + tail
+
+
+def _append(pieces: List[str], added: Any, col: int) -> str:
+    """Returns the concatenated pieces, with the YAML representation of the
+    added entries (if any) inserted before any trailing comments."""
+
+    text = "".join(pieces)
+    if not added:
+        return text
+    body, tail = _split_tail(text)
+    if body and not body.endswith("\n"):
+        body += "\n"
+    return body + _dump(added, col) + tail
+
+
+def _split_tail(span: str) -> Tuple[str, str]:
+    """Splits the given span into its content and any trailing lines that
+    contain only whitespace or comments."""
+
+    lines = span.splitlines(keepends=True)
+    n = len(lines)
+    while n > 0 and (not lines[n - 1].strip() or lines[n - 1].lstrip()[0] == "#"):
+        n -= 1
+    return "".join(lines[:n]), "".join(lines[n:])
+
+
+def _is_block(node: Optional[Node], cls: type) -> bool:
+    """Returns true if the given node is a non-empty block collection of the
+    given class."""
+    return (
+        isinstance(node, (MappingNode, SequenceNode))
+        and isinstance(node, cls)
+        and node.flow_style is not True
+        and len(node.value) > 0
+    )
+
+
+def _has_aliases(root: Node) -> bool:
+    """Returns true if any node occurs more than once in the tree, which means
+    that it was referred to by an alias (and copying the text that contains
+    the alias may not work if the anchor is in text that we replace)."""
+
+    seen = set()
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        if id(node) in seen:
+            return True
+        seen.add(id(node))
+        if isinstance(node, MappingNode):
+            for k, v in node.value:
+                nodes += [k, v]
+        elif isinstance(node, SequenceNode):
+            nodes += node.value
+    return False
+
+
+def _line_start(text: str, index: int) -> int:
+    return text.rfind("\n", 0, index) + 1
+
+
+def _line_of(text: str, index: int) -> int:
+    return text.count("\n", 0, index)
+
+
+def _dash_line_start(text: str, index: int) -> Optional[int]:
+    """Returns the index of the start of the line containing the "-" that
+    introduces the sequence item at the given index, if it is the first thing
+    on that line, or None otherwise."""
+
+    i = index - 1
+    while i >= 0 and text[i] in " \t\n":
+        i -= 1
+    if i < 0 or text[i] != "-":
+        return None
+    start = _line_start(text, i)
+    if text[start:i].strip():
+        return None
+    return start
+
+
+def _ascending(indexes: List[int]) -> bool:
+    return all(a < b for a, b in zip(indexes, indexes[1:]))
@@ -11,6 +11,11 @@ from .exceptions import InstanceError
 class Instance:
     """This class represents a server to deploy to."""
 
+    # Incremented (by _changed) whenever the settings (and therefore possibly
+    # the roles) of any instance are changed, so that Instances can tell when the indexes it
+    # has built are out of date.
+    changes = 0
+
     def __init__(
         self,
         name: str,
@@ -19,23 +24,19 @@ class Instance:
         settings=None,
         host_vars=None,
     ):
-        def _next_node_id(cluster):
-            nodes = (i.settings["node"] for i in cluster.instances if "node" in i.settings)
-            return max(nodes, default=0) + 1
-
         self._name: str = name
         self._cluster = cluster
         settings = {} if settings is None else settings
 
-        if cluster.get_location_by_name(location_name) is not None:
-            self._location = cluster.get_location_by_name(location_name)
-        else:
+        self._location = cluster.get_location_by_name(location_name)
+        if self._location is None:
             raise InstanceError(f"Could not find location '{location_name}'.")
         if "node" not in settings:
-            settings["node"] = _next_node_id(cluster)
+            settings["node"] = cluster.next_node_id()
 
         self._settings = settings or {}
         self._host_vars = host_vars or {}
+        self._resolved = None
 
     def __repr__(self):
         return f"Instance({self.name!r})"
@@ -99,10 +100,23 @@ class Instance:
         key is not in the instance's settings, the cluster's instance_defaults,
         or the instance's location's settings."""
 
-        v = ChainMap(
-            self.settings, self._cluster.instance_defaults, self.location.settings or {}
-        )
-        return v.get(key, default)
+        return self.resolved_settings().get(key, default)
+
+    def resolved_settings(self) -> ChainMap:
+        """Returns a ChainMap of this instance's settings, the cluster's
+        instance_defaults, and its location's settings. It is built once and
+        reused until a setter runs or instance_defaults are replaced."""
+
+        defaults = self._cluster.instance_defaults
+        if self._resolved is None or self._resolved.maps[1] is not defaults:
+            self._resolved = ChainMap(
+                self._settings, defaults, self.location.settings
+            )
+        return self._resolved
+
+    def _changed(self):
+        self._resolved = None
+        Instance.changes += 1
 
     def set_settings(self, new_settings: dict):
         """Adds the items in the dict to the instance, overriding any existing
@@ -110,20 +124,26 @@ class Instance:
 
         for k, v in new_settings.items():
             self._settings[k] = v
+        if "node" in new_settings:
+            self._cluster.note_node_id(new_settings["node"])
+        self._changed()
 
     def remove_setting(self, setting):
         """Deletes a setting entirely"""
 
         if setting in self._settings:
             del self._settings[setting]
+            self._changed()
 
     def add_role(self, r):
         """Adds the given role to this instance's roles"""
         self._settings.setdefault("role", []).append(r)
+        self._changed()
 
     def remove_role(self, r):
         """Removes the given role from this instance's roles"""
         self._settings.setdefault("role", []).remove(r)
+        self._changed()
 
     def to_yaml_dict(self):
         d = {
@@ -3,52 +3,82 @@
 # © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
 
 
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 from tpa.exceptions import ConfigureError
 from tpa.instance import Instance
 
+# A predicate is (kind, key, test), where test(instance, roles) returns true
+# if the instance matches. If kind is "name", "role", or "location", then only
+# instances found under key in the corresponding index can match.
+Predicate = Tuple[Optional[str], Optional[str], Callable[[Instance, List[str]], bool]]
 
-class Instances(list):
-    """Represents a collection of instances, and provides methods to operate on
-    all or a selected subset of those instances."""
 
-    def __init__(self, *args):
-        super().__init__(*args)
+def bdr_node_kind(role: List[str]) -> str:
+    # XXX This duplicates bdr_node_kind in lib/filter_plugins/bdr.py as a
+    # temporary helper function for convenience.
+    if "bdr" in role:
+        if "witness" in role:
+            return "witness"
+        elif "subscriber-only" in role:
+            return "subscriber-only"
+        elif "standby" in role:
+            return "standby"
+        else:
+            return "data"
+    else:
+        return ""
+
+
+class Selectable:
+    """Provides the methods to select a subset of instances, each of which
+    returns an InstanceQuery with one more predicate than the receiver."""
+
+    def _where(self, kind, key, test) -> "InstanceQuery":
+        raise NotImplementedError
 
     def select(self, callback):
         """Returns a new collection of instances for which the given callback
         returns true."""
-        return Instances([i for i in self if callback(i)])
+        return self._where(None, None, lambda i, roles: callback(i))
 
     def with_name(self, name: str):
         """Returns a new collection of instances that have the given name. Use
         .only() to retrieve the instance itself, or .maybe() if you're not sure
         that there is one.
         """
-        return Instances([i for i in self if i.name == name])
+        return self._where("name", name, lambda i, roles: i.name == name)
 
     def with_role(self, role: str):
         """Returns a new collection of instances that have the given role."""
-        return Instances([i for i in self if role in i.roles])
+        return self._where("role", role, lambda i, roles: role in roles)
 
     def with_roles(self, roles: List[str]):
         """Returns a new collection of instances that have all of the given
         list of role names."""
-        return Instances([i for i in self if set(roles).issubset(i.roles)])
+        q = self._where(None, None, lambda i, _roles: True)
+        for r in roles:
+            q = q.with_role(r)
+        return q
 
     def without_role(self, role: str):
         """Returns a new collection of instances that don't have the given role."""
-        return Instances([i for i in self if role not in i.roles])
+        return self.without_roles([role])
 
     def without_roles(self, roles: List[str]):
         """Returns a new collection of instances that have none of the given
         list of role names."""
-        return Instances([i for i in self if set(roles).isdisjoint(i.roles)])
+        return self._where(
+            None, None, lambda i, _roles: not any(r in _roles for r in roles)
+        )
 
     def in_location(self, location_name):
         """Returns a new collection of instances in the given location."""
-        return Instances([i for i in self if i.location.name == location_name])
+        return self._where(
+            "location",
+            location_name,
+            lambda i, roles: i.location.name == location_name,
+        )
 
     def with_hostvar(self, key, **kwargs):
         """Returns a new collection of instances that have the given key set
@@ -56,41 +86,66 @@ class Instances(list):
         value, if specified in kwargs."""
 
         val = kwargs.get("value")
-        return Instances(
-            [
-                i
-                for i in self
-                if key in i.host_vars and (val is None or i.host_vars.get(key) == val)
-            ]
+        return self._where(
+            None,
+            None,
+            lambda i, roles: key in i.host_vars
+            and (val is None or i.host_vars.get(key) == val),
         )
 
     def with_bdr_node_kind(self, kind: str):
         """Returns a new collection of instances with the given BDR node kind
         (witness, subscriber-only, standby, or data).
         """
+        return self._where(None, None, lambda i, roles: bdr_node_kind(roles) == kind)
+
+
+class Instances(Selectable, list):
+    """Represents a collection of instances, and provides methods to operate on
+    all or a selected subset of those instances.
+
+    Selecting instances returns an InstanceQuery, which is evaluated only when
+    it is used as a collection. Selecting instances by name, role, or location
+    uses indexes that are built on first use, and rebuilt if the collection is
+    modified or any instance's settings are changed through Instance methods in
+    the meantime."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._indexes = {}
+        self._indexed_at = None
+
+    def _index(self, kind: str) -> Dict[str, List[Instance]]:
+        """Returns a dict that maps each name, role, or location name (as
+        specified by kind) to the instances in this collection that have it,
+        in their original order."""
+        if self._indexed_at != Instance.changes:
+            self._indexes = {}
+            self._indexed_at = Instance.changes
 
-        # XXX This duplicates bdr_node_kind in lib/filter_plugins/bdr.py as a
-        # temporary helper function for convenience.
-        def bdr_node_kind(role: List[str]) -> str:
-            if "bdr" in role:
-                if "witness" in role:
-                    return "witness"
-                elif "subscriber-only" in role:
-                    return "subscriber-only"
-                elif "standby" in role:
-                    return "standby"
+        index = self._indexes.get(kind)
+        if index is None:
+            index = {}
+            for i in self:
+                if kind == "name":
+                    keys = [i.name]
+                elif kind == "role":
+                    keys = dict.fromkeys(i.roles)
                 else:
-                    return "data"
-            else:
-                return ""
+                    keys = [i.location.name]
+                for k in keys:
+                    index.setdefault(k, []).append(i)
+            self._indexes[kind] = index
+        return index
 
-        return Instances([i for i in self if bdr_node_kind(i.roles) == kind])
+    def _invalidate(self):
+        self._indexes = {}
+
+    def _where(self, kind, key, test) -> "InstanceQuery":
+        return InstanceQuery(self, [(kind, key, test)])
 
     def get_names(self):
-        ret = []
-        for i in self:
-            ret.append(i.name)
-        return ret
+        return [i.name for i in self]
 
     def add_role(self, role):
         """Adds the given role to the instances in this list."""
@@ -129,3 +184,135 @@ class Instances(list):
         elif num == 1:
             return self[0]
         return None
+
+
+class InstanceQuery(Selectable):
+    """A selection of instances from an Instances collection, described by a
+    list of predicates that are all applied in a single pass over the
+    collection when the query is first used as a collection (by iterating over
+    it, or calling len(), .only(), .maybe(), etc.). The result is remembered,
+    so later changes to the instances do not affect it.
+
+    Testing whether an instance is in a query that has not been evaluated yet
+    does not evaluate it; the predicates are applied to that instance alone.
+    """
+
+    def __init__(self, source: Instances, predicates: List[Predicate]):
+        self._source = source
+        self._predicates = predicates
+        self._result: Optional[Instances] = None
+
+    def _where(self, kind, key, test) -> "InstanceQuery":
+        return InstanceQuery(self._source, self._predicates + [(kind, key, test)])
+
+    def _matches(self, instance: Instance) -> bool:
+        roles = instance.roles
+        return all(test(instance, roles) for (_, _, test) in self._predicates)
+
+    def _candidates(self) -> List[Instance]:
+        """Returns the smallest list of instances from the source's indexes
+        that can satisfy the predicates, or the whole source collection if no
+        predicate can use an index."""
+        candidates = self._source
+        for kind, key, _ in self._predicates:
+            if kind is not None:
+                matches = self._source._index(kind).get(key, [])
+                if len(matches) < len(candidates):
+                    candidates = matches
+        return candidates
+
+    def all(self) -> Instances:
+        """Evaluates the query (once) and returns the matching instances."""
+        if self._result is None:
+            self._result = Instances(
+                [i for i in self._candidates() if self._matches(i)]
+            )
+        return self._result
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __len__(self):
+        return len(self.all())
+
+    def __bool__(self):
+        return len(self.all()) > 0
+
+    def __getitem__(self, n):
+        return self.all()[n]
+
+    def __contains__(self, instance):
+        if self._result is not None:
+            return any(i is instance for i in self._result)
+        name = getattr(instance, "name", None)
+        return any(
+            i is instance for i in self._source._index("name").get(name, [])
+        ) and self._matches(instance)
+
+    def __add__(self, other):
+        return Instances(self.all() + list(other))
+
+    def __radd__(self, other):
+        return Instances(list(other) + self.all())
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, InstanceQuery)):
+            return NotImplemented
+        return self.all() == list(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"InstanceQuery({self.all()!r})"
+
+    def get_names(self):
+        return self.all().get_names()
+
+    def add_role(self, role):
+        """Adds the given role to the selected instances."""
+        self.all().add_role(role)
+        return self
+
+    def set_hostvar(self, var, val):
+        """Sets the given var=val on the selected instances."""
+        self.all().set_hostvar(var, val)
+        return self
+
+    def only(self) -> Instance:
+        """See Instances.only()"""
+        return self.all().only()
+
+    def maybe(self) -> Optional[Instance]:
+        """See Instances.maybe()"""
+        return self.all().maybe()
+
+
+def _invalidating(name):
+    """Returns a version of the named list method that also discards the
+    indexes of the Instances collection it is called on."""
+    method = getattr(list, name)
+
+    def invalidating_method(self, *args, **kwargs):
+        self._invalidate()
+        return method(self, *args, **kwargs)
+
+    invalidating_method.__name__ = name
+    invalidating_method.__doc__ = method.__doc__
+    return invalidating_method
+
+
+for _name in (
+    "append",
+    "extend",
+    "insert",
+    "remove",
+    "pop",
+    "clear",
+    "sort",
+    "reverse",
+    "__setitem__",
+    "__delitem__",
+    "__iadd__",
+    "__imul__",
+):
+    setattr(Instances, _name, _invalidating(_name))
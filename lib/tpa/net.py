@@ -5,9 +5,11 @@
 
 
 from argparse import ArgumentParser
+from bisect import bisect_right
 from ipaddress import IPv4Network, ip_network
-from random import shuffle
-from typing import Iterator, MutableSequence, List
+from math import inf
+from random import randrange, sample, shuffle
+from typing import Iterator, MutableSequence, List, Tuple
 
 from .exceptions import NetError
 
@@ -62,7 +64,13 @@ class Network:
 
 
 class Subnets:
-    """Interface for defining the IP address ranges and selecting subnets for a given network."""
+    """Interface for defining the IP address ranges and selecting subnets for a given network.
+
+    Subnets are identified by their index within the network, and excluded
+    subnets are kept as a sorted list of disjoint (first, last) index ranges,
+    so that the free subnets can be found (in order or at random) without
+    enumerating every subnet in the network.
+    """
 
     MIN_PREFIX = 23
     MAX_PREFIX = 29
@@ -81,6 +89,10 @@ class Subnets:
         self.limit = limit
         self.new_prefix = new_prefix
         self._ranges = None
+        self._excluded = []
+        self._free = None
+        self._shuffled = False
+        self._sample = []
 
     def validate(self):
         """Validate the prefix length restrictions."""
@@ -92,9 +104,20 @@ class Subnets:
 
     @property
     def ranges(self) -> TypeSubnets:
-        """Calculate and store subnet ranges for the defined IP network."""
+        """Calculate and store subnet ranges for the defined IP network.
+
+        This enumerates every free subnet, which slice() and exclude() avoid
+        doing unless the ranges have already been stored or set.
+        """
         if self._ranges is None:
-            self._ranges = list(self.__get_subnet_ranges(self.cidr))
+            self.validate()
+            if self._shuffled:
+                # Keep any subnets already selected at random at the front,
+                # so that slice() returns the same results as before.
+                ranks = self._sampled(self._total())
+            else:
+                ranks = range(self._total())
+            self._ranges = [self._subnet(self._index(r)) for r in ranks]
         return self._ranges
 
     @ranges.setter
@@ -102,26 +125,122 @@ class Subnets:
         """Setter method for ranges property."""
         self._ranges = value
 
-    def __get_subnet_ranges(self, net: IPv4Network) -> TypeNets:
-        """Return a generator object with the subnets for the defined network according to new_prefix length."""
-        self.validate()
-        return net.subnets(new_prefix=self.new_prefix)
+    @property
+    def _shift(self) -> int:
+        """Number of host bits in each subnet."""
+        return self.cidr.max_prefixlen - self.new_prefix
+
+    @property
+    def _count(self) -> int:
+        """Number of subnets of new_prefix length in the defined IP network."""
+        if self.new_prefix < self.cidr.prefixlen:
+            raise ValueError("new prefix must be longer")
+        return 1 << (self.new_prefix - self.cidr.prefixlen)
+
+    def _subnet(self, index: int) -> IPv4Network:
+        """Return the subnet at the given index within the defined IP network."""
+        address = int(self.cidr.network_address) + (index << self._shift)
+        return self.cidr.__class__((address, self.new_prefix))
+
+    def _indexes(self, net) -> Tuple[int, int]:
+        """Return the (first, last) indexes of the subnets that overlap the given network."""
+        base = int(self.cidr.network_address)
+        first = max(int(net.network_address) - base, 0)
+        last = min(int(net.broadcast_address) - base, (self._count << self._shift) - 1)
+        return first >> self._shift, last >> self._shift
+
+    def _is_excluded(self, first: int, last: int) -> bool:
+        """Return True if any subnet between the given indexes is excluded."""
+        i = bisect_right(self._excluded, (last, inf)) - 1
+        return i >= 0 and self._excluded[i][1] >= first
+
+    def _free_ranges(self) -> Tuple[List[int], List[int]]:
+        """
+        Return the starting index of each run of free subnets, and the number
+        of free subnets that precede each run (plus the total at the end).
+        """
+        if self._free is None:
+            starts, ranks = [], [0]
+            start = 0
+            for first, last in self._excluded + [(self._count, self._count)]:
+                if first > start:
+                    starts.append(start)
+                    ranks.append(ranks[-1] + first - start)
+                start = last + 1
+            self._free = (starts, ranks)
+        return self._free
+
+    def _total(self) -> int:
+        """Return the number of free subnets."""
+        return self._free_ranges()[1][-1]
+
+    def _index(self, rank: int) -> int:
+        """Return the index of the rank-th free subnet."""
+        starts, ranks = self._free_ranges()
+        i = bisect_right(ranks, rank) - 1
+        return starts[i] + rank - ranks[i]
+
+    def _sampled(self, num: int) -> List[int]:
+        """Return the ranks of num free subnets, selected at random."""
+        total = self._total()
+        num = min(num, total)
+        if len(self._sample) < num:
+            seen = set(self._sample)
+            if num > total // 2:
+                rest = [r for r in range(total) if r not in seen]
+                shuffle(rest)
+                self._sample.extend(rest)
+            elif not self._sample:
+                self._sample = sample(range(total), num)
+            else:
+                while len(self._sample) < num:
+                    r = randrange(total)
+                    if r not in seen:
+                        seen.add(r)
+                        self._sample.append(r)
+        return self._sample[:num]
 
     def exclude(self, excludes: Iterator[str]) -> None:
         """Remove any subnet in stored ranges which overlaps with any range in an excludes list of CIDR addresses."""
-        self.ranges = list(
-            r
-            for r in self.ranges
-            if not any(map(r.overlaps, map(ip_network, excludes)))
-        )
+        self.validate()
+        excluded = list(self._excluded)
+        for e in excludes:
+            net = ip_network(e)
+            if net.version == self.cidr.version and net.overlaps(self.cidr):
+                excluded.append(self._indexes(net))
+
+        self._excluded = []
+        for first, last in sorted(excluded):
+            if self._excluded and first <= self._excluded[-1][1] + 1:
+                if last > self._excluded[-1][1]:
+                    self._excluded[-1] = (self._excluded[-1][0], last)
+            else:
+                self._excluded.append((first, last))
+        self._free = None
+        self._sample = []
+
+        if self._ranges is not None:
+            self._ranges = [r for r in self._ranges if not self._is_excluded(*self._indexes(r))]
 
     def shuffle(self) -> None:
         """Randomise the order of the stored subnets ranges."""
-        shuffle(self.ranges)
+        if self._ranges is not None:
+            shuffle(self._ranges)
+        else:
+            self._shuffled = True
+            self._sample = []
 
     def slice(self, num: int = None) -> List:
         """Return a list with the first num nets in nets or stored subnet ranges."""
-        return list(self.ranges[: num or self.limit])
+        num = num or self.limit
+        if self._ranges is not None:
+            return list(self._ranges[:num])
+        self.validate()
+        if self._shuffled:
+            ranks = self._sampled(num)
+        else:
+            ranks = range(min(num, self._total()))
+        return [self._subnet(self._index(r)) for r in ranks]
 
     def __repr__(self) -> str:
         """String representation of class object."""
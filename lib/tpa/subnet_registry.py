@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""
+A persistent registry of the subnets used by existing clusters.
+
+`tpaexec configure --exclude-subnets-from <dir>` excludes the subnets that are
+declared in <dir>/config.yml. When the same (possibly very large) set of
+cluster directories is given to every configure, it is wasteful to parse every
+config.yml each time, so if the TPA_SUBNET_REGISTRY environment variable names
+a file, we record the subnets found in each config.yml there along with the
+file's mtime and size. On later runs, we need only stat each config.yml, and
+parse those that have changed since they were recorded.
+
+The registry file is only a cache, and may be removed at any time. If two
+processes update it at once, one of the updates is lost, and the affected
+directories are parsed again next time.
+"""
+
+import json
+import os
+import tempfile
+from bisect import bisect_left, bisect_right
+from ipaddress import ip_network
+
+from .template_cache import yaml_load
+
+# Increment this to discard existing registry files if the format changes.
+REGISTRY_VERSION = 1
+
+
+def config_subnets(path):
+    """
+    Returns a list of the subnets declared in the given config.yml (in the
+    instances, locations, and instance_defaults).
+    """
+    with open(path) as f:
+        config_data = yaml_load(f.read())
+
+    values = []
+    for key in ("instances", "locations"):
+        values.extend(s["subnet"] for s in config_data.get(key) or [] if s.get("subnet"))
+    instance_default_subnet = (config_data.get("instance_defaults") or {}).get("subnet")
+    if instance_default_subnet:
+        values.append(instance_default_subnet)
+    return sorted(set(values))
+
+
+class SubnetRegistry:
+    """Maps cluster directories to the subnets used in their config.yml."""
+
+    def __init__(self, path):
+        self.path = path
+        self.clusters = {}
+        self._dirty = False
+        self._index = None
+        self._load()
+
+    def subnets(self, dir_name):
+        """
+        Returns the subnets declared in the given directory's config.yml,
+        parsing it only if it has changed since we last recorded its subnets.
+        Raises FileNotFoundError if the directory has no config.yml.
+        """
+        config_yml = os.path.join(os.path.abspath(dir_name), "config.yml")
+        st = os.stat(config_yml)
+        stamp = [st.st_mtime_ns, st.st_size]
+
+        entry = self.clusters.get(config_yml)
+        if entry is None or entry["stamp"] != stamp:
+            entry = {"stamp": stamp, "subnets": config_subnets(config_yml)}
+            self.clusters[config_yml] = entry
+            self._dirty = True
+            self._index = None
+        return entry["subnets"]
+
+    def overlapping(self, cidr):
+        """
+        Returns a sorted list of (subnet, config.yml) pairs for the recorded
+        subnets that overlap the given network.
+        """
+        net = ip_network(cidr)
+        (starts, ends, entries, widest) = self._overlap_index(net.version)
+
+        # Only subnets that start within `widest` addresses before the query
+        # network can reach into it.
+        first = int(net.network_address)
+        last = int(net.broadcast_address)
+        lo = bisect_left(starts, first - widest)
+        hi = bisect_right(starts, last)
+        return sorted(entries[i] for i in range(lo, hi) if ends[i] >= first)
+
+    def save(self):
+        """Writes the registry file, if anything has changed."""
+        if not self._dirty:
+            return
+        data = {"version": REGISTRY_VERSION, "clusters": self.clusters}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            (fd, tmp) = tempfile.mkstemp(dir=directory, prefix=".subnets-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            # The registry is only an optimisation.
+            return
+        self._dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == REGISTRY_VERSION:
+            self.clusters = data.get("clusters") or {}
+
+    def _overlap_index(self, version):
+        """
+        Returns the recorded subnets of the given IP version as parallel lists
+        of first and last addresses (sorted by first address) and (subnet,
+        config.yml) pairs, along with the size of the largest subnet.
+        """
+        if self._index is None:
+            self._index = {}
+        if version not in self._index:
+            rows = []
+            for config_yml, entry in self.clusters.items():
+                for s in entry["subnets"]:
+                    try:
+                        net = ip_network(s)
+                    except ValueError:
+                        continue
+                    if net.version == version:
+                        rows.append(
+                            (
+                                int(net.network_address),
+                                int(net.broadcast_address),
+                                (s, config_yml),
+                            )
+                        )
+            rows.sort()
+            self._index[version] = (
+                [r[0] for r in rows],
+                [r[1] for r in rows],
+                [r[2] for r in rows],
+                max((r[1] - r[0] for r in rows), default=0),
+            )
+        return self._index[version]
+
+
+_subnet_registry = None
+
+
+def subnet_registry():
+    """
+    Returns the process-wide SubnetRegistry named by TPA_SUBNET_REGISTRY, or
+    None if it is not set.
+    """
+    global _subnet_registry
+    path = os.environ.get("TPA_SUBNET_REGISTRY")
+    if not path:
+        return None
+    if _subnet_registry is None or _subnet_registry.path != path:
+        _subnet_registry = SubnetRegistry(path)
+    return _subnet_registry
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+"""
+Caches for configure-time template expansion.
+
+`tpaexec configure` expands a handful of templates (the architecture's layout,
+platform instance_defaults, and config.yml.j2) with the command-line arguments,
+and parses the output as YAML. The output depends only on the template source
+and the variables, so we can avoid re-reading and re-rendering a template when
+we have seen the same (template, mtime, vars) before.
+
+Rendered templates are kept in an in-memory LRU cache, and optionally also in
+a directory named by the TPA_TEMPLATE_CACHE_DIR environment variable, so that
+repeated `tpaexec configure` runs can share them. The files in that directory
+are named by the hash of their key, and the directory may be removed at any
+time.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+import yaml
+from ansible.release import __version__ as ansible_version
+
+# Use libyaml's parser and emitter when they are available.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Increment this to invalidate existing entries in persistent caches if the
+# format of the key or the value ever changes.
+CACHE_VERSION = 1
+
+DEFAULT_MAXSIZE = 128
+
+
+def yaml_load(text):
+    """
+    Returns the data structure obtained by parsing the given YAML text.
+    """
+    return yaml.load(text, Loader=SafeLoader)
+
+
+class TemplateCache(object):
+    """
+    Caches template sources by path, and rendered templates by a key derived
+    from the template path, its contents, and the variables used to expand it.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._sources = {}
+        self._rendered = OrderedDict()
+
+    def source(self, path):
+        """
+        Returns a (text, digest) tuple for the template at the given path, and
+        rereads it only if its mtime or size has changed since the last time.
+        """
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        cached = self._sources.get(path)
+        if cached is None or cached[0] != stamp:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            cached = self._sources[path] = (stamp, text, digest)
+
+        return cached[1:]
+
+    def key(self, path, vars):
+        """
+        Returns a key for the result of expanding the template at the given
+        path with the given vars, or None if the vars cannot be serialised (in
+        which case the result must not be cached).
+        """
+        try:
+            serialised_vars = json.dumps(vars, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+
+        (_, digest) = self.source(path)
+
+        h = hashlib.sha256()
+        for part in (
+            str(CACHE_VERSION),
+            ansible_version,
+            os.path.abspath(path),
+            digest,
+            serialised_vars,
+        ):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the rendered text cached under the given key, or None.
+        """
+        if key is None:
+            return None
+
+        text = self._rendered.get(key)
+        if text is not None:
+            self._rendered.move_to_end(key)
+        elif self.directory:
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    text = f.read()
+            except OSError:
+                pass
+            else:
+                self._remember(key, text)
+
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def put(self, key, text):
+        """
+        Caches the given rendered text under the given key (unless the key is
+        None, or the text is not a string).
+        """
+        if key is None or not isinstance(text, str):
+            return
+
+        self._remember(key, text)
+
+        if self.directory:
+            try:
+                self._write(self._path(key), text)
+            except OSError:
+                # The persistent cache is only an optimisation.
+                pass
+
+    def clear(self):
+        self._sources.clear()
+        self._rendered.clear()
+
+    def _remember(self, key, text):
+        self._rendered[key] = text
+        self._rendered.move_to_end(key)
+        while len(self._rendered) > self.maxsize:
+            self._rendered.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    @staticmethod
+    def _write(path, text):
+        """
+        Writes text to the given path atomically, so that concurrent configure
+        runs never see a partially-written entry.
+        """
+        d = os.path.dirname(path)
+        os.makedirs(d, exist_ok=True)
+        (fd, tmp) = tempfile.mkstemp(dir=d, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+_template_cache = None
+
+
+def template_cache():
+    """
+    Returns the process-wide TemplateCache, creating it on first use.
+    """
+    global _template_cache
+    if _template_cache is None:
+        _template_cache = TemplateCache(
+            directory=os.environ.get("TPA_TEMPLATE_CACHE_DIR") or None
+        )
+    return _template_cache
@@ -2,12 +2,11 @@
 # -*- coding: utf-8 -*-
 # © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
 
-from typing import Any, Dict, List
+import time
+from typing import Any, Callable, Dict, List, Optional
 from abc import ABC, abstractmethod
 from argparse import Namespace
-from collections import deque
-from functools import reduce
-from operator import add
+from itertools import count
 
 from tpa.cluster import Cluster
 from tpa.checkresult import CheckResult
@@ -84,6 +83,13 @@ class Transmogrifier(ABC):
 
         return tlist
 
+    @property
+    def apply_time(self) -> Optional[float]:
+        """Returns the number of seconds that apply() took for this
+        Transmogrifier, or None if it has not been applied.
+        """
+        return getattr(self, "_apply_time", None)
+
     def is_applicable(self, cluster: Cluster) -> bool:
         """Returns true if this Transmogrifier would apply any changes to the
         given Cluster based on the given arguments, false otherwise.
@@ -141,9 +147,67 @@ def opt(*args, **kwargs) -> Dict[str, Dict[str, Any]]:
     return {optname: {**kwargs}}
 
 
+def ordered(
+    tlist: List[Transmogrifier],
+    include: Callable[[Transmogrifier], bool] = lambda t: True,
+) -> List[Transmogrifier]:
+    """Returns the given Transmogrifiers and their dependencies, each one only
+    once (even if it is required by more than one other Transmogrifier), in an
+    order where each one comes after everything it requires.
+
+    Transmogrifiers for which include() returns false are omitted, and so are
+    their dependencies, unless something else requires them.
+    """
+
+    result = []
+    done = set()
+    visiting = set()
+
+    def visit(t: Transmogrifier):
+        if id(t) in done:
+            return
+        if id(t) in visiting:
+            raise TransmogrifierError(
+                f"Internal error: {type(t).__name__} requires itself"
+            )
+        if not include(t):
+            done.add(id(t))
+            return
+        visiting.add(id(t))
+        for req in t.required:
+            visit(req)
+        visiting.remove(id(t))
+        done.add(id(t))
+        result.append(t)
+
+    for t in tlist:
+        visit(t)
+
+    return result
+
+
+def applicable(cluster: Cluster) -> Callable[[Transmogrifier], bool]:
+    """Returns a function that calls is_applicable(cluster) at most once for
+    each Transmogrifier given to it, and remembers the answer."""
+
+    answers = {}
+
+    def is_applicable(t: Transmogrifier) -> bool:
+        if id(t) not in answers:
+            answers[id(t)] = t.is_applicable(cluster)
+        return answers[id(t)]
+
+    return is_applicable
+
+
+# Tells describe_timings() the order in which Transmogrifiers were applied.
+_apply_order = count()
+
+
 def apply(cluster: Cluster, tlist: List[Transmogrifier]):
     """Applies each of the list of Transmogrifiers to the given Cluster, along
-    with any of their dependencies."""
+    with any of their dependencies, and records how long each one took (see
+    Transmogrifier.apply_time)."""
 
     if not tlist:
         raise ConfigureError(
@@ -157,65 +221,96 @@ def apply(cluster: Cluster, tlist: List[Transmogrifier]):
     if check_result.warnings:
         print(check_result)
 
-    # Expand tlist to include dependencies, then prune anything that's not
-    # applicable to the cluster.
-    tlist = reduce(add, [t.all_required() + [t] for t in tlist], [])
-    ts = deque([t for t in tlist if t.is_applicable(cluster)])
-
-    # We take the first item in the queue and either apply it if it's ready, or
-    # move it to the end of the queue to be retried later, and keep going until
-    # we run out of Transmogrifiers to apply.
-
-    while ts:
-        t = ts.popleft()
-        if t.is_ready(cluster):
+    # Expand tlist to include dependencies (in dependency order), then prune
+    # anything that's not applicable to the cluster.
+    is_applicable = applicable(cluster)
+    pending = [t for t in ordered(tlist) if is_applicable(t)]
+
+    # We go through the list applying each Transmogrifier that is ready, and
+    # set aside any that are not (along with anything that requires them) to
+    # retry after the others have been applied. If we go through the whole
+    # list without applying anything, it means there's a bug somewhere in one
+    # of the is_ready() tests.
+
+    while pending:
+        waiting = []
+        waiting_ids = set()
+        for t in pending:
+            blocked = any(id(req) in waiting_ids for req in t.required)
+            if blocked or not t.is_ready(cluster):
+                waiting.append(t)
+                waiting_ids.add(id(t))
+                continue
+
+            start = time.monotonic()
             t.apply(cluster)
-        else:
-            ts.append(t)
-
-        # If we end up with a queue where no Transmogrifier is ready, it means
-        # there's a bug somewhere in one of the is_ready() tests.
+            t._apply_time = time.monotonic() - start
+            t._apply_order = next(_apply_order)
 
-        if ts and not any(t.is_ready(cluster) for t in ts):
+        if len(waiting) == len(pending):
             raise TransmogrifierError(
                 "Internal error: no Transmogrifier ready to apply"
             )
+        pending = waiting
 
 
 def describe(cluster: Cluster, tlist: List[Transmogrifier]) -> ChangeDescription:
     """Returns a composite description of what changes the list of
-    Transmogrifiers would make to the given Cluster.
+    Transmogrifiers would make to the given Cluster. Each Transmogrifier is
+    described only once, even if it is required by more than one other.
     """
+
+    return _describe(cluster, tlist, applicable(cluster), set())
+
+
+def _describe(cluster, tlist, is_applicable, seen) -> ChangeDescription:
     items = []
 
     for t in tlist:
-        if not t.is_applicable(cluster):
+        if id(t) in seen or not is_applicable(t):
             continue
+        seen.add(id(t))
 
         # Prepend the descriptions from any required objects to the items of
         # this object's description.
 
         desc = t.description(cluster)
-        if t.required:
-            desc._items = [describe(cluster, t.required)] + desc._items
+        required = [r for r in t.required if id(r) not in seen]
+        if required:
+            desc._items = [
+                _describe(cluster, required, is_applicable, seen)
+            ] + desc._items
 
         items.append(desc)
 
     return ChangeDescription(items=items)
 
 
+def describe_timings(tlist: List[Transmogrifier]) -> ChangeDescription:
+    """Returns a description of how long it took to apply each of the given
+    Transmogrifiers and their dependencies, in the order they were applied.
+    """
+
+    ts = sorted(
+        [t for t in ordered(tlist) if t.apply_time is not None],
+        key=lambda t: t._apply_order,
+    )
+    return ChangeDescription(
+        title="Time taken to apply changes",
+        items=[f"{type(t).__name__}: {t.apply_time:.3f}s" for t in ts],
+    )
+
+
 def check(cluster: Cluster, tlist: List[Transmogrifier]) -> CheckResult:
     """Returns a CheckResult containing warnings and errors accumulated by
-    running checks from the given Transmogrifiers on the Cluster.
+    running checks from the given Transmogrifiers on the Cluster. Checks from
+    each Transmogrifier are run only once, after the checks from everything it
+    requires.
     """
 
     result = CheckResult()
 
-    for t in tlist:
-        if not t.is_applicable(cluster):
-            continue
-
-        result.absorb(check(cluster, t.required))
+    for t in ordered(tlist, include=applicable(cluster)):
         result.absorb(t.check(cluster))
 
     return result
@@ -156,9 +156,9 @@ class BDR4PGD5(Transmogrifier):
                 loc_witnesses = loc_instances.with_role("witness")
 
                 for instance in loc_instances:
-                    if instance in instances.with_role("bdr") + instances.with_role(
-                        "pgd-proxy"
-                    ):
+                    if instance in instances.with_role(
+                        "bdr"
+                    ) or instance in instances.with_role("pgd-proxy"):
                         if "bdr_child_group" not in instance.host_vars:
                             instance.host_vars["bdr_child_group"] = group["name"]
 
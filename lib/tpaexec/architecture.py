@@ -3,14 +3,12 @@
 # © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
 import sys
 import os
-import io
 import uuid
 import subprocess
 import argparse
 import shutil
 from pathlib import Path
 
-import yaml
 import re
 
 from typing import List
@@ -22,6 +20,8 @@ from functools import reduce
 from .exceptions import ArchitectureError, ExternalCommandError
 from .net import Network, DEFAULT_SUBNET_PREFIX_LENGTH, DEFAULT_NETWORK_CIDR
 from .platforms import Platform
+from tpa.template_cache import template_cache, yaml_load
+from tpa.subnet_registry import config_subnets, subnet_registry
 
 KEYRING_SUPPORTED_BACKENDS = ["system", "legacy"]
 
@@ -54,6 +54,10 @@ class Architecture(object):
         self._args = None
         self._net = None
 
+        # Set by `tpaexec configure-batch` to share subnet allocation between
+        # the clusters it generates (see tpa.commands.configure_batch)
+        self.fleet = None
+
     ##
     ## Command-line parsing
     ##
@@ -78,12 +82,19 @@ class Architecture(object):
         platform, gives the architecture and platform a chance to process the
         configuration information, and generates a cluster configuration.
         """
+        configuration = self.build_configuration()
+        self.write_configuration(configuration, force=force)
+        self.after_configuration(force=force)
+
+    def build_configuration(self) -> str:
+        """
+        Validates and processes the command-line arguments, and returns the
+        contents of config.yml (without writing anything to disk).
+        """
         self.validate_arguments(self.args)
         self.process_arguments(self.args)
         self.apply_compliance(self.args)
-        configuration = self.generate_configuration()
-        self.write_configuration(configuration, force=force)
-        self.after_configuration(force=force)
+        return self.generate_configuration()
 
     def argument_parser(self):
         """
@@ -1001,12 +1012,14 @@ class Architecture(object):
         requirements.
 
         """
+        exclude_dirs = self.args.get("exclude_subnet_dirs", [])
+        if self.fleet is not None:
+            excludes = self.fleet.excluded_subnets(exclude_dirs)
+        else:
+            excludes = self._get_subnets_from(exclude_dirs=exclude_dirs)
+
         subnets = self.net.subnets(limit=num)
-        subnets.exclude(
-            excludes=self._get_subnets_from(
-                exclude_dirs=self.args.get("exclude_subnet_dirs", [])
-            )
-        )
+        subnets.exclude(excludes=excludes)
 
         if len(list(subnets)) < num:
             raise ArchitectureError(
@@ -1021,7 +1034,14 @@ class Architecture(object):
             subnets.shuffle()
 
         # Select a number of subnets according to the limit set (and convert from an iterator to a list of strings)
-        return [str(s) for s in subnets]
+        selected = [str(s) for s in subnets]
+
+        # When configuring many clusters at once, later clusters must not be
+        # given the same subnets.
+        if self.fleet is not None:
+            self.fleet.allocate(selected)
+
+        return selected
 
     @staticmethod
     def _get_subnets_from(exclude_dirs):
@@ -1031,30 +1051,29 @@ class Architecture(object):
         If any subnet exclusion directories are specified, look for "subnet: a.b.c.d/n" declarations in
         config.yml files within the given directories and exclude those subnets from the list.
 
+        If TPA_SUBNET_REGISTRY is set, only the config.yml files that have changed since they were last
+        recorded in the registry are parsed.
+
         Args:
             exclude_dirs: List of directories to look in
 
         Returns: List of subnet ranges found
 
         """
+        registry = subnet_registry()
         values = []
         for dir_name in exclude_dirs:
             try:
-                with open(f"{dir_name}/config.yml") as exclude_config_yml:
-                    config_data = yaml.safe_load(exclude_config_yml)
-                    for key in ("instances", "locations"):
-                        values.extend(
-                            s["subnet"] for s in config_data.get(key) if s.get("subnet")
-                        )
-                    instance_default_subnet = config_data.get(
-                        "instance_defaults", {}
-                    ).get("subnet")
-                    if instance_default_subnet:
-                        values.append(instance_default_subnet)
+                if registry:
+                    values.extend(registry.subnets(dir_name))
+                else:
+                    values.extend(config_subnets(f"{dir_name}/config.yml"))
             except FileNotFoundError:
                 raise ArchitectureError(
                     f"Could not open a config.yml file in the provided path: {dir_name}"
                 )
+        if registry:
+            registry.save()
         return list(set(values))
 
     def _init_locations(self, locations):
@@ -1798,16 +1817,27 @@ class Architecture(object):
         the output as YAML, and returns the resulting data structure
         """
         text = self.expand_template(filename, vars, loader)
-        return yaml.load(text, Loader=yaml.FullLoader)
+        return yaml_load(text)
 
     def expand_template(self, filename, vars, loader=None):
         """
         Takes a template filename and some args and returns the template output
+        (which may come from the template_cache if the same template has been
+        expanded with the same args before)
         """
         loader = loader or self.loader()
-        templar = Templar(loader=loader, variables=vars)
-        template = loader._tpaexec_get_template(filename)
-        return templar.do_template(template)
+        path = loader._tpaexec_find_template(filename)
+        if path is None:
+            return "{}"
+
+        cache = template_cache()
+        key = cache.key(path, vars)
+        text = cache.get(key)
+        if text is None:
+            (template, _) = cache.source(path)
+            text = loader._tpaexec_templar(vars).do_template(template)
+            cache.put(key, text)
+        return text
 
     def loader(self, basedirs=None):
         """
@@ -1817,8 +1847,12 @@ class Architecture(object):
         the loader will return the contents of that template directly.
         """
 
+        if basedirs is None and getattr(self, "_loader", None) is not None:
+            return self._loader
+
         class MinimalLoader(object):
             _basedirs = []
+            _templar = None
 
             def __init__(self, basedirs):
                 self._basedirs = basedirs
@@ -1826,16 +1860,33 @@ class Architecture(object):
             def get_basedir(self):
                 return self._basedirs[0]
 
-            def _tpaexec_get_template(self, filename):
+            def _tpaexec_find_template(self, filename):
                 for d in self._basedirs:
                     t = "%s/%s" % (d, filename)
                     if os.path.exists(t):
-                        return io.open(t, "r", encoding="utf-8").read()
+                        return t
                 if filename.startswith("/") and os.path.exists(filename):
-                    return io.open(filename, "r", encoding="utf-8").read()
-                return "{}"
+                    return filename
+                return None
+
+            def _tpaexec_get_template(self, filename):
+                t = self._tpaexec_find_template(filename)
+                if t is None:
+                    return "{}"
+                return template_cache().source(t)[0]
+
+            def _tpaexec_templar(self, vars):
+                # Setting up a Templar is expensive, so we reuse one per loader
+                if self._templar is None:
+                    self._templar = Templar(loader=self, variables=vars)
+                else:
+                    self._templar.available_variables = vars
+                return self._templar
 
-        return MinimalLoader(basedirs or self.template_directories())
+        loader = MinimalLoader(basedirs or self.template_directories())
+        if basedirs is None:
+            self._loader = loader
+        return loader
 
 
 def update_symlinks_recursively(source, destination, force):
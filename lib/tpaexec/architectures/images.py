@@ -88,6 +88,8 @@ class Images(Architecture):
                 "Please use --distributions (not --distribution) for this architecture"
             )
 
+        self.platform.prefetch_images(distributions, regions)
+
         for i, r in enumerate(regions):
             for j, d in enumerate(distributions):
                 image = self.platform.image(d, lookup=True, region=r)
@@ -5,9 +5,22 @@
 import argparse
 import hashlib
 import json
+import mmap
+import os
+import stat
 import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# Files are hashed in chunks of this size, or mapped into memory if they are
+# larger than this.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Increment this to discard existing stat cache files if the format changes.
+STAT_CACHE_VERSION = 1
+
 
 def get_args(args=None):
     parser = argparse.ArgumentParser(
@@ -22,45 +35,168 @@ def get_args(args=None):
         metavar="SAVE_FILE",
         help="Path to the JSON file to which file checksum data is written",
     )
+    parser.add_argument(
+        "--stat-cache",
+        metavar="CACHE_FILE",
+        help="Path to a JSON file in which to remember the checksums of files, "
+        "so that files whose size, mtime, and inode have not changed since "
+        "then need not be hashed again (which means that changes to a file "
+        "that preserve all three go undetected; by default, every file is "
+        "hashed)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of files to hash in parallel",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print the number of files hashed and the time taken to stderr",
+    )
     return parser.parse_args(args)
 
 
 def _hash_file(path_to_file: Path):
-    sha256_hash = hashlib.sha256(path_to_file.read_bytes())
+    sha256_hash = hashlib.sha256()
+    with open(path_to_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size > HASH_CHUNK_SIZE:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                sha256_hash.update(m)
+        else:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha256_hash.update(chunk)
     return sha256_hash
 
 
-def compare_data(path_to_file: str, target_directory: str):
+def _load_stat_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if isinstance(data, dict) and data.get("version") == STAT_CACHE_VERSION:
+        return data.get("files") or {}
+    return {}
+
+
+def _save_stat_cache(path, files):
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        (fd, tmp) = tempfile.mkstemp(dir=directory, prefix=".checksums-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": STAT_CACHE_VERSION, "files": files}, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        # The cache is only an optimisation.
+        pass
+
+
+def compare_data(
+    path_to_file: str,
+    target_directory: str,
+    stat_cache: str = None,
+    jobs: int = None,
+    stats: dict = None,
+):
+    """
+    Compares the files in target_directory with the checksums in the given
+    JSON file, and returns lists of the files that do not match and those
+    that are missing.
+
+    If stat_cache names a file, the checksum of each file is remembered there
+    along with its size, mtime, and inode, and it is not hashed again until
+    one of those changes. If a stats dict is given, it is filled in with the
+    checksum of the JSON file and the number of files checked and hashed.
+    """
+    start = time.monotonic()
     mismatch_list = []
     missing_list = []
     try:
-        with open(path_to_file, "r", encoding="utf-8") as in_file:
-            source_checksums = json.load(in_file)
-            for source_filepath, source_hash_value in source_checksums.items():
-                target_filepath = Path.joinpath(Path(target_directory), source_filepath)
-                if target_filepath.exists() and target_filepath.is_file():
-                    calculated_hash_value = _hash_file(target_filepath).hexdigest()
-
-                    if calculated_hash_value != source_hash_value:
-                        mismatch_list.append(f"{source_filepath}")
-                else:
-                    missing_list.append(f"{source_filepath}")
-
+        with open(path_to_file, "rb") as in_file:
+            checksums_data = in_file.read()
+        source_checksums = json.loads(checksums_data.decode("utf-8"))
     except IOError:
         sys.exit(1)
 
+    cache = _load_stat_cache(stat_cache) if stat_cache else {}
+    new_cache = {}
+    to_hash = []
+    checked = []
+
+    for source_filepath, source_hash_value in source_checksums.items():
+        target_filepath = Path.joinpath(Path(target_directory), source_filepath)
+        try:
+            st = target_filepath.stat()
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            missing_list.append(f"{source_filepath}")
+            continue
+
+        key = str(target_filepath.absolute())
+        stamp = [st.st_size, st.st_mtime_ns, st.st_ino]
+        checked.append((source_filepath, source_hash_value, key))
+        cached = cache.get(key)
+        if cached and cached[:3] == stamp:
+            new_cache[key] = cached
+        else:
+            to_hash.append((key, stamp, target_filepath))
+
+    # hashlib releases the GIL while hashing, so threads are enough to hash
+    # many files in parallel.
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            digests = pool.map(lambda t: _hash_file(t[2]).hexdigest(), to_hash)
+            for (key, stamp, _), digest in zip(to_hash, digests):
+                new_cache[key] = stamp + [digest]
+
+    for source_filepath, source_hash_value, key in checked:
+        if new_cache[key][3] != source_hash_value:
+            mismatch_list.append(f"{source_filepath}")
+
+    # The cache may be shared with other directories, so we update the
+    # entries we have checked and leave the rest alone.
+    if stat_cache and to_hash:
+        cache.update(new_cache)
+        _save_stat_cache(stat_cache, cache)
+
+    if stats is not None:
+        stats.update(
+            checksum=hashlib.sha256(checksums_data).hexdigest(),
+            files=len(source_checksums),
+            hashed=len(to_hash),
+            cached=len(checked) - len(to_hash),
+            seconds=time.monotonic() - start,
+        )
+
     return mismatch_list, missing_list
 
 
 if __name__ == "__main__":  # pragma: no cover
     args = get_args()
+    stats = {}
     mismatch_list, missing_list = compare_data(
-        path_to_file=args.checksums_file, target_directory=args.directory
+        path_to_file=args.checksums_file,
+        target_directory=args.directory,
+        stat_cache=args.stat_cache,
+        jobs=args.jobs,
+        stats=stats,
     )
     if len(mismatch_list) == 0:
-        print(
-            f"Validated: {_hash_file(path_to_file=Path(args.checksums_file)).hexdigest()} [OK]"
-        )
+        print(f"Validated: {stats['checksum']} [OK]")
     else:
         print("Modified:", end=" ")
         print(*mismatch_list, sep=", ")
+    if args.stats:
+        print(
+            f"Checked {stats['files']} files ({stats['hashed']} hashed, "
+            f"{stats['cached']} unchanged) in {stats['seconds']:.3f}s",
+            file=sys.stderr,
+        )
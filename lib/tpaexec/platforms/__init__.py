@@ -88,6 +88,14 @@ class Platform:
         """
         return {}
 
+    def prefetch_images(self, labels, regions):
+        """
+        Looks up the images for each of the given labels in each of the given
+        regions in advance of calls to image(…, lookup=True), on platforms
+        where lookups are expensive (subclasses may override this).
+        """
+        pass
+
     def setup_local_repo(self):
         """
         Performs necessary platform specific setup for package repository
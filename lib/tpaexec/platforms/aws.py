@@ -2,6 +2,12 @@
 # -*- coding: utf-8 -*-
 # © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
 
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
 
 from . import CloudPlatform
@@ -30,11 +36,90 @@ AWS_ZONES_PER_REGION = {
     "us-west-2": ["a", "b", "c", "d"],
 }
 
+# How long the results of AMI lookups are remembered in TPA_AMI_CACHE
+AWS_AMI_CACHE_TTL = 24 * 60 * 60
+
+# How many AMI lookups may be in progress at once
+AWS_AMI_LOOKUP_THREADS = 8
+
+
+class AMICache:
+    """
+    Remembers the image ids found by looking up AMIs by (region, name, owner).
+
+    Results are kept in memory for the life of the process, and if a path is
+    given (by default, the value of the TPA_AMI_CACHE environment variable),
+    they are also saved to that file and reused by later runs until they are
+    older than the given ttl. The file may be removed at any time.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path=None, ttl=AWS_AMI_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self._dirty = False
+        if path:
+            self._load()
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(list(key))
+
+    def get(self, key):
+        """
+        Returns the image id for the given (region, name, owner), or None if
+        it is not known or has expired.
+        """
+        entry = self.entries.get(self._key(key))
+        if entry and time.time() - entry["time"] < self.ttl:
+            return entry["image_id"]
+        return None
+
+    def put(self, key, image_id):
+        self.entries[self._key(key)] = {"image_id": image_id, "time": time.time()}
+        self._dirty = True
+
+    def save(self):
+        """Writes the cache file (if any), if anything has changed."""
+        if not (self.path and self._dirty):
+            return
+        now = time.time()
+        entries = {
+            k: v for k, v in self.entries.items() if now - v["time"] < self.ttl
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            (fd, tmp) = tempfile.mkstemp(dir=directory, prefix=".ami-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"version": self.VERSION, "images": entries}, f)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            # The cache is only an optimisation.
+            return
+        self._dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == self.VERSION:
+            self.entries = data.get("images") or {}
+
 
 class aws(CloudPlatform):
     def __init__(self, name, arch):
         super().__init__(name, arch)
         self.ec2 = {}
+        self.amis = AMICache(os.environ.get("TPA_AMI_CACHE") or None)
         self.preferred_python_version = "python3"
 
     @property
@@ -241,31 +326,76 @@ class aws(CloudPlatform):
     def _is_default_ec2_instance_type(self):
         return self.arch.args.get("instance_type") == AWS_DEFAULT_INSTANCE_TYPE
 
-    def _lookup_ami(self, image, region):
+    def prefetch_images(self, labels, regions):
+        """
+        Looks up the AMIs for the given labels in each of the given regions
+        concurrently, so that image(…, lookup=True) finds them in the cache.
+        """
+        keys = []
+        for label in labels:
+            image = self.image(label)
+            for region in regions:
+                key = self._ami_key(image, region)
+                if key not in keys and self.amis.get(key) is None:
+                    keys.append(key)
+        if not keys:
+            return
+
+        # boto3 clients are thread-safe, but creating them is not.
+        for (region, _, _) in keys:
+            self._ec2_client(region)
+
+        with ThreadPoolExecutor(
+            max_workers=min(len(keys), AWS_AMI_LOOKUP_THREADS)
+        ) as pool:
+            for key, image_id in zip(keys, pool.map(self._describe_image, keys)):
+                self.amis.put(key, image_id)
+        self.amis.save()
+
+    @staticmethod
+    def _ami_key(image, region):
+        return (region, image["name"], image.get("owner"))
+
+    def _ec2_client(self, region):
         if region not in self.ec2:
             self.ec2[region] = boto3.client("ec2", region_name=region)
+        return self.ec2[region]
+
+    def _lookup_ami(self, image, region):
+        key = self._ami_key(image, region)
+        image_id = self.amis.get(key)
+        if image_id is None:
+            image_id = self._describe_image(key)
+            self.amis.put(key, image_id)
+            self.amis.save()
+        return {"image_id": image_id}
+
+    def _describe_image(self, key):
+        """
+        Returns the id of the single AMI that matches the given (region,
+        name, owner).
+        """
+        (region, name, owner) = key
         filters = [
-            {"Name": "name", "Values": [image["name"]]},
+            {"Name": "name", "Values": [name]},
         ]
-        if "owner" in image:
+        if owner is not None:
             filters.append(
                 {
                     "Name": "owner-id",
-                    "Values": [image["owner"]],
+                    "Values": [owner],
                 }
             )
         v = self.arch.args["verbosity"]
         if v > 0:
-            print('aws: Looking up AMI "%s" in "%s"' % (image["name"], region))
-        r = self.ec2[region].describe_images(Filters=filters)
+            print('aws: Looking up AMI "%s" in "%s"' % (name, region))
+        r = self._ec2_client(region).describe_images(Filters=filters)
         if v > 1:
             print("aws: Got lookup result: %s" % str(r))
         n = len(r["Images"])
         if n != 1:
-            raise AWSPlatformError(
-                "Expected 1 match for %s, found %d" % (image["name"], n)
-            )
-        return {"image_id": r["Images"][0]["ImageId"]}
+            raise AWSPlatformError("Expected 1 match for %s, found %d" % (name, n))
+        return r["Images"][0]["ImageId"]
 
     def update_cluster_tags(self, cluster_tags, args, **kwargs):
         if args["owner"] is not None:
@@ -53,7 +53,11 @@
 from __future__ import absolute_import, division, print_function
 
 import os, io, pwd, grp
+import datetime
+import re
+import time
 import traceback
+from contextlib import contextmanager
 
 from ansible.module_utils.basic import AnsibleModule
 
@@ -80,8 +84,24 @@ options:
       - A conninfo string for this instance
     required: false
     default: "''"
+  batched:
+    description:
+      - Collect the facts with one composite query per capability tier
+        (instance, database, BDR) instead of one query per fact, which
+        saves many round-trips on high-latency connections.
+      - Results are packed into JSON on the server. Timestamps are converted
+        back to the same values that the unbatched queries return, and known
+        columns of types that psycopg2 doesn't convert (e.g., aclitem[]) are
+        cast to text. Infinite timestamps are returned as "infinity", and
+        arrays of other unconverted types (e.g., in bdr.* catalogs) as lists.
+      - Requires Postgres 9.6 or later; older servers are queried one fact
+        at a time as usual.
+    type: bool
+    required: false
+    default: false
 notes:
    - This module requires the I(psycopg2) Python library to be installed.
+   - The time spent in each section of discovery is returned as I(timings).
 requirements: [ psycopg2 ]
 author: "Abhijit Menon-Sen <ams@2ndQuadrant.com>"
 """
@@ -93,6 +113,13 @@ EXAMPLES = """
   become_user: "{{ postgres_user }}"
   become: yes
 - debug: msg="the data directory is {{ cluster_facts.postgres_data_dir }}"
+
+- name: Collect the same facts in fewer round-trips
+  cluster_discovery:
+    conninfo: dbname=postgres
+    batched: yes
+  become_user: "{{ postgres_user }}"
+  become: yes
 """
 
 
@@ -105,6 +132,7 @@ def main():
         supports_check_mode=True,
         argument_spec=dict(
             conninfo=dict(default=""),
+            batched=dict(type="bool", default=False),
         ),
     )
 
@@ -115,11 +143,17 @@ def main():
 
     m = {}
     m["changed"] = False
+    m["timings"] = timings = {}
 
     conn = None
     try:
         conn = psycopg2.connect(dsn=module.params["conninfo"])
-        m.update({"ansible_facts": {"cluster_facts": cluster_discovery(module, conn)}})
+        discover = cluster_discovery
+        if module.params["batched"] and conn.server_version >= 90600:
+            discover = batched_cluster_discovery
+        with timed(timings, "total"):
+            facts = discover(module, conn, timings)
+        m.update({"ansible_facts": {"cluster_facts": facts}})
     except Exception as e:
         m["error"] = str(e)
         m["exception"] = traceback.format_exc()
@@ -127,7 +161,23 @@ def main():
     module.exit_json(failed=("error" in m), **m)
 
 
-def cluster_discovery(module, conn):
+@contextmanager
+def timed(timings, section):
+    """
+    Records the time (in seconds) spent in the body of the with statement as
+    timings[section].
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[section] = round(time.monotonic() - start, 6)
+
+
+def cluster_discovery(module, conn, timings=None):
+    if timings is None:
+        timings = {}
+
     m = dict()
     cur = conn.cursor()
 
@@ -174,6 +224,221 @@ def cluster_discovery(module, conn):
 
     cur.execute("SELECT pg_backend_pid()")
     pid = cur.fetchone()[0]
+    m.update(process_discovery(pid))
+
+    # We're done with the basic system facts, so we move on to querying the
+    # server to get an idea of its place in the world^Wcluster.
+
+    with timed(timings, "catalog"):
+        m.update(catalog_discovery(module, conn, m))
+    with timed(timings, "replica"):
+        m.update(replica_discovery(module, conn, m))
+    with timed(timings, "database"):
+        m.update(database_discovery(module, conn, m))
+    with timed(timings, "repmgr"):
+        m.update(repmgr_discovery(module, conn, m))
+    with timed(timings, "role"):
+        m.update(role_discovery(module, conn, m))
+
+    return m
+
+
+# In batched mode, we ask for everything we need at each level (instance,
+# database, BDR node) in one composite query, with each result set packed
+# into a JSON array by json_agg. The answers to some probes (e.g., whether
+# pg_stat_wal_receiver exists) follow from server_version_num, so we don't
+# need to ask.
+#
+# The JSON representation of some values is not what psycopg2 would return
+# for them otherwise. json_bundle() converts timestamps back to datetime
+# objects, and we cast aclitem[] columns to text (as psycopg2 returns them
+# unconverted). The remaining differences from the unbatched code are that
+# infinite timestamps are returned as "infinity" rather than datetime.max,
+# and arrays of other types that psycopg2 doesn't know about (which may be
+# found in bdr.* catalogs) are returned as lists rather than strings.
+
+
+def batched_cluster_discovery(module, conn, timings=None):
+    if timings is None:
+        timings = {}
+
+    m = dict()
+
+    # We're only called for 9.6+, so pg_stat_wal_receiver and the missing_ok
+    # argument to current_setting() must exist.
+
+    with timed(timings, "instance"):
+        r = json_bundle(
+            conn,
+            [
+                ("version_string", "version()"),
+                ("pid", "pg_backend_pid()"),
+                ("pg_is_in_recovery", "pg_is_in_recovery()"),
+                (
+                    "ebcm",
+                    "current_setting('bdr.enable_builtin_connection_manager', true)",
+                ),
+                (
+                    "pg_settings",
+                    """(SELECT json_object_agg(name, setting)
+                    FROM pg_catalog.pg_settings)""",
+                ),
+                (
+                    "pg_stat_replication",
+                    json_agg_of("SELECT * FROM pg_catalog.pg_stat_replication"),
+                ),
+                (
+                    "pg_replication_slots",
+                    json_agg_of("SELECT * FROM pg_catalog.pg_replication_slots"),
+                ),
+                (
+                    "pg_stat_wal_receiver",
+                    json_agg_of("SELECT * FROM pg_catalog.pg_stat_wal_receiver"),
+                ),
+                ("databases", json_agg_of(BATCHED_DATABASES_QUERY)),
+                ("roles", json_agg_of(ROLES_QUERY)),
+            ],
+        )
+
+    m["postgres_version_string"] = r["version_string"]
+    m["postgres_version_int"] = conn.server_version
+    m["postgres_version"] = major_version(conn.server_version)
+
+    m["pg_settings"] = settings = r["pg_settings"]
+    if r["ebcm"] is not None:
+        settings["bdr.enable_builtin_connection_manager"] = r["ebcm"]
+
+    m["postgres_port"] = int(settings["port"])
+    m["postgres_data_dir"] = settings["data_directory"]
+
+    m.update(process_discovery(r["pid"]))
+
+    for cr in ["pg_stat_replication", "pg_replication_slots", "pg_stat_wal_receiver"]:
+        m[cr] = r[cr]
+
+    with timed(timings, "replica"):
+        if r["pg_is_in_recovery"]:
+            m.update(replica_discovery(module, conn, m, in_recovery=True))
+        else:
+            m.update({"role": "primary"})
+
+    with timed(timings, "database"):
+        m.update(batched_database_discovery(module, r["databases"], m))
+    with timed(timings, "repmgr"):
+        m.update(repmgr_discovery(module, conn, m))
+
+    m["roles"] = dict((role["rolname"], role) for role in r["roles"])
+
+    return m
+
+
+def batched_database_discovery(module, dbs, m0):
+    m = dict()
+    m["databases"] = dict()
+    m["bdr_databases"] = []
+
+    for db in dbs:
+        results = dict(db)
+        datname = db["datname"]
+
+        m["databases"].update({datname: results})
+
+        if datname in ("template0", "bdr_supervisordb"):
+            continue
+
+        db_conn = psycopg2.connect(module.params["conninfo"] + " dbname=%s" % datname)
+
+        r = json_bundle(
+            db_conn,
+            [
+                (
+                    "schemas",
+                    json_agg_of(
+                        """SELECT nspname, nspowner, nspacl::text AS nspacl
+                        FROM pg_catalog.pg_namespace"""
+                    ),
+                ),
+                ("extensions", json_agg_of("SELECT * FROM pg_catalog.pg_extension")),
+                ("has_pglogical", "to_regclass('pglogical.node') IS NOT NULL"),
+                (
+                    "has_bdr",
+                    """EXISTS (SELECT 1
+                    FROM pg_catalog.pg_proc p
+                        JOIN pg_catalog.pg_namespace n ON (p.pronamespace=n.oid)
+                    WHERE n.nspname='bdr' AND p.proname='bdr_version_num')""",
+                ),
+            ],
+        )
+
+        results["schemas"] = dict((s["nspname"], s) for s in r["schemas"])
+        results["extensions"] = dict((e["extname"], e) for e in r["extensions"])
+        if r["has_pglogical"]:
+            results.update(pglogical_discovery(module, db_conn, m0, exists=True))
+        if r["has_bdr"]:
+            results.update(batched_bdr_discovery(module, db_conn, m0))
+
+        if results.get("bdr", {}).get("node_group"):
+            m["bdr_databases"].append(datname)
+
+    return m
+
+
+def batched_bdr_discovery(module, conn, m0):
+    m = query_results(
+        conn,
+        """SELECT bdr.bdr_version(), bdr.bdr_version_num(),
+        (bdr.bdr_version_num()/10000)::int as bdr_major_version""",
+    )[0]
+    bdr_major_version = m["bdr_major_version"]
+
+    queries = []
+    if bdr_major_version >= 3:
+        queries += [
+            ("local_node", json_agg_of("SELECT * FROM bdr.local_node_info()")),
+            ("node", json_agg_of("SELECT * FROM bdr.node")),
+            ("node_group", json_agg_of("SELECT * FROM bdr.node_group")),
+        ]
+    if bdr_major_version in (5, 6):
+        queries += [
+            (
+                "local_node_summary",
+                json_agg_of("SELECT * FROM bdr.local_node_summary"),
+            ),
+            (
+                "node_config",
+                json_agg_of(
+                    """SELECT n.node_name, nc.* FROM bdr.node n
+                    LEFT JOIN bdr.node_config nc USING (node_id)"""
+                ),
+            ),
+            (
+                "node_group_summary",
+                json_agg_of("SELECT * FROM bdr.node_group_summary"),
+            ),
+        ]
+    if bdr_major_version == 5:
+        queries += [
+            (
+                "proxy_config_summary",
+                json_agg_of("SELECT * FROM bdr.proxy_config_summary"),
+            ),
+        ]
+
+    if queries:
+        m.update(json_bundle(conn, queries))
+    if "local_node" in m:
+        m["local_node"] = m["local_node"] and m["local_node"][0] or {}
+
+    return {"bdr": m}
+
+
+def process_discovery(pid):
+    """
+    Returns the facts that we can find from /proc/<pid>/{exe,status} for the
+    given backend pid: postgres_bin_dir, postgres_user, postgres_group, and
+    postgres_home.
+    """
+    m = dict()
     m["postgres_bin_dir"] = os.path.dirname(os.readlink("/proc/%d/exe" % pid))
 
     for line in io.open("/proc/%d/status" % pid, "r"):
@@ -191,15 +456,6 @@ def cluster_discovery(module, conn):
             ent = grp.getgrgid(int(s[1]))
             m["postgres_group"] = ent.gr_name
 
-    # We're done with the basic system facts, so we move on to querying the
-    # server to get an idea of its place in the world^Wcluster.
-
-    m.update(catalog_discovery(module, conn, m))
-    m.update(replica_discovery(module, conn, m))
-    m.update(database_discovery(module, conn, m))
-    m.update(repmgr_discovery(module, conn, m))
-    m.update(role_discovery(module, conn, m))
-
     return m
 
 
@@ -229,12 +485,14 @@ def catalog_discovery(module, conn, m0):
     return m
 
 
-def replica_discovery(module, conn, m0):
+def replica_discovery(module, conn, m0, in_recovery=None):
     m = dict()
-    cur = conn.cursor()
 
-    cur.execute("SELECT pg_is_in_recovery()")
-    if not cur.fetchone()[0]:
+    if in_recovery is None:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_is_in_recovery()")
+        in_recovery = cur.fetchone()[0]
+    if not in_recovery:
         return {"role": "primary"}
 
     m.update({"recovery_settings": read_recovery_conf(m0)})
@@ -271,11 +529,7 @@ def database_discovery(module, conn, m0):
     m["databases"] = dict()
     m["bdr_databases"] = []
 
-    dbs = query_results(
-        conn,
-        """SELECT *, pg_encoding_to_char(encoding) as encoding
-        FROM pg_catalog.pg_database""",
-    )
+    dbs = query_results(conn, DATABASES_QUERY)
     for db in dbs:
         results = dict(db)
         datname = db["datname"]
@@ -328,10 +582,13 @@ def extension_discovery(module, conn, m0):
     return m
 
 
-def pglogical_discovery(module, conn, m0):
+def pglogical_discovery(module, conn, m0, exists=None):
     m = dict()
 
-    if relation_exists(conn, "pglogical.node"):
+    if exists is None:
+        exists = relation_exists(conn, "pglogical.node")
+
+    if exists:
         try:
             v = query_results(
                 conn,
@@ -431,9 +688,21 @@ def role_discovery(module, conn, m0):
     m = dict()
     m["roles"] = dict()
 
-    roles = query_results(
-        conn,
-        """
+    roles = query_results(conn, ROLES_QUERY)
+    for r in roles:
+        m["roles"].update({r["rolname"]: r})
+
+    return m
+
+
+DATABASES_QUERY = """SELECT *, pg_encoding_to_char(encoding) as encoding
+        FROM pg_catalog.pg_database"""
+
+BATCHED_DATABASES_QUERY = """SELECT *, pg_encoding_to_char(encoding) as encoding,
+        datacl::text AS datacl
+        FROM pg_catalog.pg_database"""
+
+ROLES_QUERY = """
         SELECT *, s.setconfig as rolconfig, ARRAY(SELECT b.rolname
                 FROM pg_catalog.pg_auth_members m
                 JOIN pg_catalog.pg_roles b ON (m.roleid = b.oid)
@@ -442,12 +711,7 @@ def role_discovery(module, conn, m0):
                 LEFT JOIN pg_catalog.pg_db_role_setting s
                     ON (a.oid = s.setrole AND s.setdatabase = 0::oid)
             WHERE rolname !~ '^pg_'
-        """,
-    )
-    for r in roles:
-        m["roles"].update({r["rolname"]: r})
-
-    return m
+        """
 
 
 def parse_kv(str):
@@ -552,6 +816,80 @@ def repmgr_schema_name(conn):
     return repmgr_schema
 
 
+def json_agg_of(query):
+    """
+    Returns an expression that evaluates to a JSON array of the rows returned
+    by the given query (as objects), or an empty array if there are none.
+    """
+    return "(SELECT coalesce(json_agg(q), '[]') FROM (%s) q)" % query
+
+
+def json_bundle(conn, expressions):
+    """
+    Given a list of (name, expression) pairs, evaluates all the expressions in
+    a single query and returns a dict that maps each name to its value. (JSON
+    values are decoded by psycopg2.)
+    """
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT %s" % ",\n".join('%s AS "%s"' % (e, n) for (n, e) in expressions)
+    )
+    return dict(
+        zip(
+            [desc[0] for desc in cur.description],
+            [json_timestamps(v) for v in cur.fetchone()],
+        )
+    )
+
+
+# Postgres represents timestamps in JSON as "2025-01-02T03:04:05.678+00:00"
+# (or without the offset, for a timestamp without time zone).
+
+JSON_TIMESTAMP = re.compile(
+    r"^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?"
+    r"(?:([+-])(\d\d):(\d\d)(?::(\d\d))?)?$"
+)
+
+
+def json_timestamps(value):
+    """
+    Returns the given value (decoded from JSON) with any strings that look
+    like JSON timestamps converted to datetime objects, as psycopg2 would
+    have returned them if they had not been packed into JSON.
+    """
+    if isinstance(value, dict):
+        return dict((k, json_timestamps(v)) for (k, v) in value.items())
+    if isinstance(value, list):
+        return [json_timestamps(v) for v in value]
+    if not isinstance(value, str):
+        return value
+
+    t = JSON_TIMESTAMP.match(value)
+    if not t:
+        return value
+
+    (Y, M, D, h, m, s, us, sign, oh, om, os_) = t.groups()
+    tz = None
+    if sign:
+        offset = datetime.timedelta(
+            hours=int(oh), minutes=int(om), seconds=int(os_ or 0)
+        )
+        tz = datetime.timezone(-offset if sign == "-" else offset)
+    try:
+        return datetime.datetime(
+            int(Y),
+            int(M),
+            int(D),
+            int(h),
+            int(m),
+            int(s),
+            int((us or "0").ljust(6, "0")),
+            tzinfo=tz,
+        )
+    except ValueError:
+        return value
+
+
 def query_results(conn, query):
     res = []
     cur = conn.cursor()
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+ANSIBLE_METADATA = {
+    "metadata_version": "1.1",
+    "status": ["preview"],
+    "supported_by": "EDB",
+}
+
+DOCUMENTATION = """
+---
+module: ec2_instances
+short_description: Launch the EC2 instances for a cluster in batches
+description:
+  - Takes the list of aws_instances for a cluster and ensures that an EC2
+    instance exists and is running for each one, then returns the result of
+    describing each instance.
+  - Existing instances are found by their Cluster and Name tags with one
+    DescribeInstances request per region. Stopped instances are started, and
+    any missing tags are added. Other changes to the instance's configuration
+    are not detected.
+  - Missing instances with identical launch specifications (region, subnet,
+    type, image, volumes, user-data, etc.) are launched together by a single
+    RunInstances request with MinCount and MaxCount set to the number of
+    instances. Their Name and node tags are set after launch. If a run was
+    interrupted before that happened, the untagged instances are adopted by
+    the next run instead of launching new ones.
+  - Regions are handled concurrently, and the state of the instances in each
+    region is polled with one DescribeInstances request until all of them are
+    running.
+version_added: "2.16"
+options:
+  instances:
+    description:
+      - A list of instances, as in aws_instances (after the image and volumes
+        have been expanded).
+    type: list
+    elements: dict
+    required: true
+  cluster_name:
+    description:
+      - The name of the cluster, which is set as the Cluster tag on each
+        instance.
+    type: str
+    required: true
+  cluster_tags:
+    description:
+      - Tags to set on every instance (overridden by each instance's tags).
+    type: dict
+    default: {}
+  subnets:
+    description:
+      - A map from region to a map from each instance's subnet to a subnet id,
+        as in ec2_region_subnets.
+    type: dict
+    required: true
+  groups:
+    description:
+      - A map from region to the security group id (or list of ids) to use,
+        as in ec2_region_groups.
+    type: dict
+    required: true
+  key_name:
+    description:
+      - The name of the key pair to launch instances with.
+    type: str
+  instance_profile_name:
+    description:
+      - The name or ARN of the IAM instance profile to launch instances with.
+    type: str
+  user_data:
+    description:
+      - A map from instance name to the user-data script for that instance.
+    type: dict
+    default: {}
+  private_ips:
+    description:
+      - A map from instance name to the private IP address to assign to that
+        instance, if any. Instances with a fixed address are launched one by
+        one.
+    type: dict
+    default: {}
+  profile:
+    description:
+      - The AWS profile to use, if not the default.
+    type: str
+  wait_timeout:
+    description:
+      - How many seconds to wait for the instances in a region to be running.
+    type: int
+    default: 1500
+  poll_interval:
+    description:
+      - How many seconds to wait between DescribeInstances requests.
+    type: int
+    default: 5
+notes:
+  - This module requires the I(boto3) Python library to be installed.
+requirements: [ boto3 ]
+"""
+
+EXAMPLES = """
+- ec2_instances:
+    instances: "{{ aws_instances }}"
+    cluster_name: "{{ cluster_name }}"
+    subnets: "{{ ec2_region_subnets }}"
+    groups: "{{ ec2_region_groups }}"
+  register: ec2_jobs
+"""
+
+RETURN = """
+results:
+  description:
+    - One entry for each instance, in the same order as the given instances,
+      with the instance (as item), its region, and the result of describing
+      the EC2 instance (as instances[0], with snake_case keys and tags as a
+      dict).
+  returned: always
+  type: list
+"""
+
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    HAS_BOTO3 = True
+except ImportError:
+    HAS_BOTO3 = False
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible.module_utils.common.dict_transformations import camel_dict_to_snake_dict
+from ansible.module_utils.parsing.convert_bool import boolean
+
+# Instances in these states belong to the cluster; anything else is gone or
+# on its way out.
+LIVE_STATES = ["pending", "running", "stopping", "stopped"]
+
+# These tags are different for every instance, so they are set only after a
+# batch of instances has been launched.
+INSTANCE_TAGS = ("Name", "node")
+
+# Maps the ebs settings of a volume (as produced by expand_ec2_instance_volumes)
+# to the corresponding EbsBlockDevice fields.
+EBS_FIELDS = {
+    "delete_on_termination": ("DeleteOnTermination", boolean),
+    "encrypted": ("Encrypted", boolean),
+    "iops": ("Iops", int),
+    "kms_key_id": ("KmsKeyId", str),
+    "snapshot_id": ("SnapshotId", str),
+    "throughput": ("Throughput", int),
+    "volume_size": ("VolumeSize", int),
+    "volume_type": ("VolumeType", str),
+}
+
+
+class EC2Error(Exception):
+    pass
+
+
+def tag_dict(tags):
+    """Converts a list of EC2 tags into a dict."""
+    return {t["Key"]: t["Value"] for t in tags or []}
+
+
+def tag_list(tags):
+    """Converts a dict into a list of EC2 tags."""
+    return [{"Key": k, "Value": v} for k, v in tags.items()]
+
+
+def instance_tags(instance, params):
+    tags = dict(params["cluster_tags"] or {})
+    tags.update(instance.get("tags") or {})
+    tags.update(
+        Cluster=params["cluster_name"],
+        node=instance["node"],
+        Name=instance["Name"],
+    )
+    return {str(k): str(v) for k, v in tags.items()}
+
+
+def block_device(volume):
+    """Returns a BlockDeviceMapping for the given volume."""
+
+    bd = {"DeviceName": volume["device_name"]}
+    if "ebs" in volume:
+        ebs = {}
+        for key, (field, convert) in EBS_FIELDS.items():
+            if volume["ebs"].get(key) is not None:
+                ebs[field] = convert(volume["ebs"][key])
+        bd["Ebs"] = ebs
+    elif "virtual_name" in volume:
+        bd["VirtualName"] = volume["virtual_name"]
+    elif "no_device" in volume:
+        bd["NoDevice"] = ""
+    return bd
+
+
+def launch_spec(instance, params):
+    """Returns the RunInstances parameters (other than tags and counts) for
+    the given instance."""
+
+    region = instance["region"]
+    name = instance["Name"]
+
+    groups = params["groups"][region]
+    if isinstance(groups, str):
+        groups = [groups]
+
+    interface = {
+        "DeviceIndex": 0,
+        "SubnetId": params["subnets"][region][instance["subnet"]],
+        "Groups": groups,
+        "AssociatePublicIpAddress": boolean(instance.get("assign_public_ip", True)),
+        "DeleteOnTermination": True,
+    }
+    if params["private_ips"].get(name):
+        interface["PrivateIpAddress"] = params["private_ips"][name]
+
+    spec = {
+        "ImageId": instance["image"],
+        "InstanceType": instance["type"],
+        "NetworkInterfaces": [interface],
+        "DisableApiTermination": boolean(
+            instance.get("termination_protection", False)
+        ),
+    }
+
+    if params["key_name"]:
+        spec["KeyName"] = params["key_name"]
+
+    profile = params["instance_profile_name"]
+    if profile:
+        spec["IamInstanceProfile"] = (
+            {"Arn": profile} if profile.startswith("arn:") else {"Name": profile}
+        )
+
+    # Existing volumes are attached by the user-data script, not at launch.
+    volumes = [
+        block_device(v) for v in instance.get("volumes") or [] if "volume_id" not in v
+    ]
+    if volumes:
+        spec["BlockDeviceMappings"] = volumes
+
+    if params["user_data"].get(name):
+        spec["UserData"] = params["user_data"][name]
+
+    return spec
+
+
+def matches(ec2_instance, spec):
+    """Returns true if the given EC2 instance could have been launched with
+    the given spec."""
+    return (
+        ec2_instance["ImageId"] == spec["ImageId"]
+        and ec2_instance["InstanceType"] == spec["InstanceType"]
+        and ec2_instance.get("SubnetId") == spec["NetworkInterfaces"][0]["SubnetId"]
+    )
+
+
+def describe(client, **kwargs):
+    """Returns a list of the EC2 instances described by a DescribeInstances
+    request with the given parameters, following any NextToken."""
+
+    instances = []
+    while True:
+        r = client.describe_instances(**kwargs)
+        for reservation in r["Reservations"]:
+            instances.extend(reservation["Instances"])
+        if not r.get("NextToken"):
+            return instances
+        kwargs["NextToken"] = r["NextToken"]
+
+
+def launch(client, instances, existing, orphans, params):
+    """Launches the given instances that do not already exist, and returns a
+    map from the name of each one to its EC2 instance id."""
+
+    batches = {}
+    for instance in instances:
+        if instance["Name"] in existing:
+            continue
+        spec = launch_spec(instance, params)
+        tags = instance_tags(instance, params)
+        common = {k: v for k, v in tags.items() if k not in INSTANCE_TAGS}
+        key = json.dumps([spec, common], sort_keys=True)
+        batches.setdefault(key, (spec, common, []))[2].append(tags)
+
+    ids = {}
+    for spec, common, members in batches.values():
+        adopted = [o for o in orphans if matches(o, spec)][: len(members)]
+        for o in adopted:
+            orphans.remove(o)
+
+        launched = []
+        n = len(members) - len(adopted)
+        if n > 0:
+            # A single instance can be tagged completely at launch.
+            tags = members[0] if len(members) == 1 else common
+            r = client.run_instances(
+                MinCount=n,
+                MaxCount=n,
+                TagSpecifications=[
+                    {"ResourceType": "instance", "Tags": tag_list(tags)}
+                ],
+                **spec,
+            )
+            launched = r["Instances"]
+
+        for tags, i in zip(members, adopted + launched):
+            ids[tags["Name"]] = i["InstanceId"]
+            if len(members) > 1 or i in adopted:
+                client.create_tags(Resources=[i["InstanceId"]], Tags=tag_list(tags))
+
+    return ids
+
+
+def provision_region(client, region, instances, params):
+    """Ensures that the given instances in one region exist and are running,
+    and returns (changed, {name: described EC2 instance})."""
+
+    changed = False
+
+    existing = {}
+    orphans = []
+    filters = [
+        {"Name": "tag:Cluster", "Values": [params["cluster_name"]]},
+        {"Name": "instance-state-name", "Values": LIVE_STATES},
+    ]
+    for i in describe(client, Filters=filters):
+        name = tag_dict(i.get("Tags")).get("Name")
+        if name is None:
+            orphans.append(i)
+        else:
+            existing.setdefault(name, i)
+
+    ids = {}
+    for instance in instances:
+        i = existing.get(instance["Name"])
+        if i is None:
+            continue
+        ids[instance["Name"]] = i["InstanceId"]
+        have = tag_dict(i.get("Tags"))
+        missing = {
+            k: v
+            for k, v in instance_tags(instance, params).items()
+            if have.get(k) != v
+        }
+        if missing:
+            client.create_tags(Resources=[i["InstanceId"]], Tags=tag_list(missing))
+            changed = True
+
+    launched = launch(client, instances, existing, orphans, params)
+    if launched:
+        ids.update(launched)
+        changed = True
+
+    # Now we wait until every instance is running, starting any that are
+    # stopped (including those that were still stopping before).
+
+    names = {v: k for k, v in ids.items()}
+    deadline = time.monotonic() + params["wait_timeout"]
+    while True:
+        try:
+            found = {
+                i["InstanceId"]: i
+                for i in describe(client, InstanceIds=list(names))
+            }
+        except ClientError as e:
+            # Newly-launched instances may not be visible immediately.
+            if e.response["Error"]["Code"] != "InvalidInstanceID.NotFound":
+                raise
+            found = {}
+
+        states = {k: i["State"]["Name"] for k, i in found.items()}
+        for k, state in states.items():
+            if state in ("shutting-down", "terminated"):
+                raise EC2Error("instance %s (%s) is %s" % (names[k], k, state))
+
+        stopped = [k for k, state in states.items() if state == "stopped"]
+        if stopped:
+            client.start_instances(InstanceIds=stopped)
+            changed = True
+
+        waiting = [names[k] for k in names if states.get(k) != "running"]
+        if not waiting:
+            break
+        if time.monotonic() > deadline:
+            raise EC2Error(
+                "timed out waiting for instances to start: %s" % ", ".join(waiting)
+            )
+        time.sleep(params["poll_interval"])
+
+    return changed, {name: found[k] for k, name in names.items()}
+
+
+def result(instance, ec2_instance):
+    """Returns the result for one instance."""
+
+    described = camel_dict_to_snake_dict(ec2_instance, ignore_list=["Tags"])
+    described["tags"] = tag_dict(described.get("tags"))
+    return {
+        "item": instance,
+        "region": instance["region"],
+        "instances": [described],
+    }
+
+
+def provision_all(connect, params):
+    """Provisions the instances in each region concurrently, using a client
+    returned by connect(region). Returns (changed, results, errors)."""
+
+    regions = {}
+    for instance in params["instances"]:
+        regions.setdefault(instance["region"], []).append(instance)
+
+    clients = {r: connect(r) for r in regions}
+    with ThreadPoolExecutor(max_workers=max(len(regions), 1)) as pool:
+        futures = {
+            r: pool.submit(provision_region, clients[r], r, instances, params)
+            for r, instances in regions.items()
+        }
+
+    changed = False
+    described = {}
+    errors = []
+    for r, f in futures.items():
+        try:
+            (c, d) = f.result()
+        except Exception as e:
+            errors.append("%s: %s" % (r, e))
+            continue
+        changed = changed or c
+        described.update(d)
+
+    results = [
+        result(instance, described[instance["Name"]])
+        for instance in params["instances"]
+        if instance["Name"] in described
+    ]
+
+    return changed, results, errors
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            instances=dict(type="list", elements="dict", required=True),
+            cluster_name=dict(type="str", required=True),
+            cluster_tags=dict(type="dict", default={}),
+            subnets=dict(type="dict", required=True),
+            groups=dict(type="dict", required=True),
+            key_name=dict(type="str"),
+            instance_profile_name=dict(type="str"),
+            user_data=dict(type="dict", default={}),
+            private_ips=dict(type="dict", default={}),
+            profile=dict(type="str"),
+            wait_timeout=dict(type="int", default=1500),
+            poll_interval=dict(type="int", default=5),
+        ),
+        supports_check_mode=False,
+    )
+
+    if not HAS_BOTO3:
+        module.fail_json(msg=missing_required_lib("boto3"))
+
+    session = boto3.session.Session(profile_name=module.params["profile"])
+
+    def connect(region):
+        return session.client("ec2", region_name=region)
+
+    try:
+        changed, results, errors = provision_all(connect, module.params)
+    except (BotoCoreError, ClientError, EC2Error) as e:
+        module.fail_json(msg=str(e), exception=traceback.format_exc())
+
+    if errors:
+        module.fail_json(msg="; ".join(errors), changed=changed, results=results)
+
+    module.exit_json(changed=changed, results=results)
+
+
+if __name__ == "__main__":
+    main()
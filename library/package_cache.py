@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+# © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+ANSIBLE_METADATA = {
+    "metadata_version": "1.1",
+    "status": ["preview"],
+    "supported_by": "EDB",
+}
+
+DOCUMENTATION = """
+---
+module: package_cache
+short_description: Maintain a package repository directory and a shared cache
+description:
+  - Maintains a manifest of the files in a package repository directory
+    (such as a cluster's local-repo), which records the SHA256 checksum of
+    each file, and rehashes only the files whose size or mtime has changed.
+  - Copies packages into the directory from a content-addressed cache that
+    can be shared between clusters, and adds packages to that cache.
+  - Generates apt repository metadata (Packages.gz) incrementally, by
+    scanning only those packages it has not scanned before.
+version_added: "2.8"
+options:
+  path:
+    description:
+      - The repository directory
+    required: true
+  mode:
+    description:
+      - C(manifest) updates the manifest and returns it
+      - C(restore) copies the given I(packages) from the cache into I(path),
+        and returns those that are not in the cache
+      - C(store) adds the packages in I(path) to the cache
+      - C(scanpackages) generates Packages.gz in I(path)
+    choices: [manifest, restore, store, scanpackages]
+    default: manifest
+  cache_dir:
+    description:
+      - The cache directory (required except in manifest mode)
+  index:
+    description:
+      - The name under which packages are indexed by filename in the cache
+        (e.g., Debian/12), so that they can be restored without a checksum
+  packages:
+    description:
+      - A list of packages to restore, each either a hash with a filename
+        and a sha256 checksum or any other C(algo:hex) checksum, or just a
+        filename to look up in the index
+    type: list
+    default: []
+author: "EDB"
+"""
+
+EXAMPLES = """
+- package_cache:
+    path: /local-repo/Debian/12
+    cache_dir: /package-cache
+    index: Debian/12
+    mode: restore
+    packages:
+    - filename: foo_1.0-1_all.deb
+      sha256: 9f122d0e143cd1d1d8566e8fe9aa2e7e94f0914461fcdbf5d7b0f0db99ad2f49
+  register: restore
+
+- package_cache:
+    path: "{{ local_repo_dir }}"
+  delegate_to: localhost
+  register: local_repo
+"""
+
+RETURN = """
+manifest:
+  description: A hash that maps each file in path to its SHA256 checksum
+  returned: always
+  type: dict
+restored:
+  description: The packages copied from the cache (in restore mode)
+  returned: when mode is restore
+  type: list
+missing:
+  description: The packages that are not in the cache (in restore mode)
+  returned: when mode is restore
+  type: list
+stored:
+  description: The packages added to the cache (in store mode)
+  returned: when mode is store
+  type: list
+"""
+
+import errno
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+
+MANIFEST = ".tpa-manifest.json"
+PACKAGE_SUFFIXES = (".deb", ".ddeb", ".rpm")
+
+
+def sha256sum(path):
+    return digest(path, "sha256")
+
+
+def digest(path, algorithm):
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_checksum(path, rel, manifest, algorithm):
+    """
+    Returns the checksum of the given file in path with the given algorithm,
+    using the manifest entry for the file if it has one (the sha256 checksum
+    is always there), or else computing it and recording it in the entry.
+    """
+    entry = manifest[rel]
+    if algorithm not in entry:
+        entry[algorithm] = digest(os.path.join(path, rel), algorithm)
+    return entry[algorithm]
+
+
+def chown(path, owner):
+    """
+    Changes the owner of the given path to the given (uid, gid), if we can.
+    """
+    if owner and os.geteuid() == 0:
+        os.chown(path, *owner)
+
+
+def write_atomically(path, data, owner=None):
+    """
+    Writes the given bytes to a temporary file in the same directory as the
+    given path and renames it into place, so that concurrent readers (or
+    writers) never see a partially-written file.
+    """
+    directory = os.path.dirname(path)
+    (fd, tmp) = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        chown(tmp, owner)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def copy_atomically(src, dest, owner=None):
+    """
+    Links or copies src to a temporary file next to dest, and renames it into
+    place. (Linking fails across filesystems, including bind mounts of the
+    same filesystem, in which case we copy.)
+    """
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=".tmp-")
+    os.close(fd)
+    try:
+        os.unlink(tmp)
+        try:
+            os.link(src, tmp)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            shutil.copy2(src, tmp)
+            chown(tmp, owner)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def update_manifest(path):
+    """
+    Returns a hash that maps the path (relative to the given directory) of
+    every file under it to a hash with its size, mtime, and sha256 checksum,
+    and records it in the directory. Files whose size and mtime match the
+    previous manifest are not read again.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    manifest = {}
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name == MANIFEST or name.startswith(".tmp-"):
+                continue
+            filename = os.path.join(root, name)
+            rel = os.path.relpath(filename, path)
+            st = os.stat(filename)
+            entry = previous.get(rel)
+            if not (
+                entry
+                and entry["size"] == st.st_size
+                and entry["mtime"] == st.st_mtime_ns
+            ):
+                entry = dict(
+                    size=st.st_size, mtime=st.st_mtime_ns, sha256=sha256sum(filename)
+                )
+            manifest[rel] = entry
+
+    if manifest != previous:
+        write_manifest(path, manifest)
+    return manifest
+
+
+def write_manifest(path, manifest):
+    write_atomically(
+        os.path.join(path, MANIFEST),
+        json.dumps(manifest, sort_keys=True).encode(),
+        owner=directory_owner(path),
+    )
+
+
+def directory_owner(path):
+    st = os.stat(path)
+    return (st.st_uid, st.st_gid)
+
+
+class PackageCache(object):
+    """
+    A directory of files named by their SHA256 checksum (under sha256/), with
+    an index of symbolic links to them by filename (under names/«index»/).
+    New files are owned by the owner of the cache directory.
+    """
+
+    def __init__(self, cache_dir, index=None):
+        self.cache_dir = cache_dir
+        self.index = index
+        os.makedirs(cache_dir, exist_ok=True)
+        self.owner = directory_owner(cache_dir)
+
+    def _makedirs(self, path):
+        if not os.path.isdir(path):
+            self._makedirs(os.path.dirname(path))
+            try:
+                os.mkdir(path)
+            except FileExistsError:
+                return
+            chown(path, self.owner)
+
+    def object_path(self, checksum):
+        return os.path.join(self.cache_dir, "sha256", checksum[:2], checksum)
+
+    def index_path(self, filename):
+        return os.path.join(self.cache_dir, "names", self.index, filename)
+
+    def lookup(self, package):
+        """
+        Returns the path to the given package in the cache, or None if it
+        isn't in the cache. The package may be a filename to look up in the
+        index, or a hash with a filename and its sha256 checksum, or some
+        other "algo:hex" checksum (in which case we look up the filename in
+        the index and check that the file has that checksum).
+        """
+        if isinstance(package, dict) and "sha256" in package:
+            path = self.object_path(package["sha256"])
+            return path if os.path.exists(path) else None
+
+        if isinstance(package, dict):
+            if "checksum" not in package:
+                return None
+            filename = package["filename"]
+        else:
+            filename = package
+        if not self.index:
+            return None
+
+        path = os.path.realpath(self.index_path(filename))
+        if not os.path.exists(path):
+            return None
+        if isinstance(package, dict):
+            (algorithm, _, checksum) = package["checksum"].partition(":")
+            if digest(path, algorithm) != checksum:
+                return None
+        return path
+
+    def add(self, filename, checksum):
+        """
+        Adds the given file to the cache (and to the index, if there is one),
+        and returns True if it wasn't already there.
+        """
+        path = self.object_path(checksum)
+        added = False
+        if not os.path.exists(path):
+            self._makedirs(os.path.dirname(path))
+            copy_atomically(filename, path, owner=self.owner)
+            added = True
+
+        if self.index:
+            link = self.index_path(os.path.basename(filename))
+            target = os.path.relpath(path, os.path.dirname(link))
+            if os.path.islink(link) and os.readlink(link) == target:
+                return added
+            self._makedirs(os.path.dirname(link))
+            tmp = "%s.tmp-%d" % (link, os.getpid())
+            os.symlink(target, tmp)
+            if os.geteuid() == 0:
+                os.lchown(tmp, *self.owner)
+            os.replace(tmp, link)
+        return added
+
+    def stanza_path(self, checksum):
+        return self.object_path(checksum) + ".stanza"
+
+
+def restore_packages(path, cache, packages, manifest):
+    """
+    Copies the given packages from the cache into path, unless a file with
+    the same checksum (or name, if we don't know the checksum) is already
+    there, and returns the lists of packages restored and missing. Packages
+    given as a hash without any checksum are always missing.
+    """
+    restored = []
+    missing = []
+    for package in packages:
+        if isinstance(package, dict):
+            filename = package["filename"]
+            if filename in manifest:
+                if "sha256" in package:
+                    if manifest[filename]["sha256"] == package["sha256"]:
+                        continue
+                elif "checksum" in package:
+                    (algorithm, _, checksum) = package["checksum"].partition(":")
+                    if file_checksum(path, filename, manifest, algorithm) == checksum:
+                        continue
+        else:
+            filename = package
+            if filename in manifest:
+                continue
+
+        cached = cache.lookup(package)
+        if cached is None:
+            missing.append(package)
+            continue
+        dest = os.path.join(path, filename)
+        copy_atomically(cached, dest, owner=directory_owner(path))
+        restored.append(package)
+    return (restored, missing)
+
+
+def store_packages(cache, path, manifest):
+    """
+    Adds every package in the manifest to the cache, and returns the names
+    of those that weren't already there.
+    """
+    stored = []
+    for rel, entry in sorted(manifest.items()):
+        if rel.endswith(PACKAGE_SUFFIXES):
+            if cache.add(os.path.join(path, rel), entry["sha256"]):
+                stored.append(rel)
+    return stored
+
+
+def parse_stanzas(text):
+    """
+    Returns a hash that maps the Filename of each stanza in the given output
+    of dpkg-scanpackages to the stanza.
+    """
+    stanzas = {}
+    for stanza in text.split("\n\n"):
+        stanza = stanza.strip("\n")
+        for line in stanza.splitlines():
+            if line.startswith("Filename: "):
+                stanzas[os.path.normpath(line[len("Filename: ") :])] = stanza
+    return stanzas
+
+
+def set_filename(stanza, filename):
+    return "\n".join(
+        "Filename: ./%s" % filename if line.startswith("Filename: ") else line
+        for line in stanza.splitlines()
+    )
+
+
+def scan_packages(module, cache, path, manifest):
+    """
+    Generates Packages.gz for the .deb and .ddeb packages in the manifest, as
+    dpkg-scanpackages would, but runs dpkg-scanpackages only on the packages
+    that we have not scanned before (keeping their stanzas in the cache), and
+    returns True if the contents of Packages.gz changed.
+    """
+    packages = sorted(
+        rel for rel in manifest if rel.endswith((".deb", ".ddeb"))
+    )
+
+    stanzas = {}
+    unscanned = []
+    for rel in packages:
+        stanza_path = cache.stanza_path(manifest[rel]["sha256"])
+        if os.path.exists(stanza_path):
+            with open(stanza_path) as f:
+                stanzas[rel] = f.read()
+        else:
+            unscanned.append(rel)
+
+    if unscanned:
+        scandir = tempfile.mkdtemp(prefix="scanpackages-")
+        try:
+            for rel in unscanned:
+                link = os.path.join(scandir, rel)
+                os.makedirs(os.path.dirname(link), exist_ok=True)
+                os.symlink(os.path.abspath(os.path.join(path, rel)), link)
+            scanned = {}
+            for package_type in ("deb", "ddeb"):
+                (rc, out, err) = module.run_command(
+                    ["dpkg-scanpackages", "--type", package_type, "."],
+                    cwd=scandir,
+                    check_rc=True,
+                )
+                scanned.update(parse_stanzas(out))
+        finally:
+            shutil.rmtree(scandir)
+
+        for rel in unscanned:
+            if rel not in scanned:
+                module.fail_json(msg="dpkg-scanpackages did not scan %s" % rel)
+            stanza = scanned[rel]
+            stanzas[rel] = stanza
+            stanza_path = cache.stanza_path(manifest[rel]["sha256"])
+            cache._makedirs(os.path.dirname(stanza_path))
+            write_atomically(stanza_path, stanza.encode(), owner=cache.owner)
+
+    contents = "".join(
+        "%s\n\n" % set_filename(stanzas[rel], rel) for rel in packages
+    ).encode()
+
+    packages_gz = os.path.join(path, "Packages.gz")
+    try:
+        with gzip.open(packages_gz) as f:
+            if f.read() == contents:
+                return False
+    except (OSError, EOFError):
+        pass
+
+    write_atomically(
+        packages_gz,
+        gzip.compress(contents, mtime=0),
+        owner=directory_owner(path),
+    )
+    return True
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            path=dict(type="path", required=True),
+            mode=dict(
+                default="manifest",
+                choices=["manifest", "restore", "store", "scanpackages"],
+            ),
+            cache_dir=dict(type="path"),
+            index=dict(type="str"),
+            packages=dict(type="list", elements="raw", default=[]),
+        ),
+        required_if=[
+            ("mode", "restore", ["cache_dir"]),
+            ("mode", "store", ["cache_dir"]),
+            ("mode", "scanpackages", ["cache_dir"]),
+        ],
+        supports_check_mode=False,
+    )
+
+    path = module.params["path"]
+    mode = module.params["mode"]
+    result = dict(changed=False)
+
+    try:
+        manifest = update_manifest(path)
+
+        if mode != "manifest":
+            cache = PackageCache(module.params["cache_dir"], module.params["index"])
+
+        if mode == "restore":
+            before = json.dumps(manifest, sort_keys=True)
+            (restored, missing) = restore_packages(
+                path, cache, module.params["packages"], manifest
+            )
+            result.update(restored=restored, missing=missing, changed=bool(restored))
+            # Record any other checksums we computed for existing files.
+            if json.dumps(manifest, sort_keys=True) != before:
+                write_manifest(path, manifest)
+            if restored:
+                manifest = update_manifest(path)
+        elif mode == "store":
+            stored = store_packages(cache, path, manifest)
+            result.update(stored=stored, changed=bool(stored))
+        elif mode == "scanpackages":
+            result["changed"] = scan_packages(module, cache, path, manifest)
+            manifest = update_manifest(path)
+    except OSError as e:
+        module.fail_json(msg="%s: %s" % (mode, e), **result)
+
+    result["manifest"] = {rel: e["sha256"] for rel, e in manifest.items()}
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
@@ -41,6 +41,37 @@ options:
         For such statements autocommit should be set to 'yes'.
     required: false
     default: 'no'
+  fetch_size:
+    description:
+      - If set, queries are executed with a named (server-side) cursor, and
+        the rows are fetched from the server this many at a time, instead of
+        all at once. This can be used only for queries that return rows (e.g.,
+        SELECT or VALUES).
+    required: false
+    type: int
+  max_rows:
+    description:
+      - If set, no more than this many rows are returned for each query, and
+        the corresponding element of 'truncated' is set if there were more.
+    required: false
+    type: int
+  columns_only:
+    description:
+      - If set, the results of each query are returned as a dict mapping each
+        column name to an array of the values in that column, instead of an
+        array of dicts, one for each row. This is much more compact for
+        queries that return many rows.
+    required: false
+    default: 'no'
+  pipeline:
+    description:
+      - If set, consecutive entries in 'queries' that have the same text and
+        specify args (or named_args) are sent to the server in batches with
+        psycopg2's execute_batch, instead of one at a time. Queries executed
+        in this way may not return rows, and their rowcounts are reported
+        as -1 (i.e., unknown).
+    required: false
+    default: 'no'
 notes:
    - This module requires the I(psycopg2) Python library to be installed.
    - This module can execute any sort of query, but you may need to cast some
@@ -74,6 +105,20 @@ EXAMPLES = """
 - debug: msg="also {{ query.rowcount }} rows"
   when:
     query.rowcounts|length == 1
+- postgresql_query:
+    query: SELECT relname, relkind FROM pg_class
+    fetch_size: 10000
+    max_rows: 100000
+    columns_only: yes
+  register: classes
+- debug: msg="{{ classes.results.relname|length }} relations"
+- postgresql_query:
+    queries:
+      - text: insert into x(a,b) values (%s, %s)
+        args: [1, foo]
+      - text: insert into x(a,b) values (%s, %s)
+        args: [2, bar]
+    pipeline: yes
 """
 
 RETURN = """
@@ -115,6 +160,23 @@ runtime:
     as a single floating-point number (in addition to the 'runtimes' array).
     type: float
     sample: 42.321
+rows_per_second:
+    description: An array of the number of rows returned (or affected, or
+    statements executed, for pipelined queries) per second by each query,
+    including the time taken to fetch the results.
+    type: list
+    sample: [
+        1532.2,
+        12.1
+    ]
+truncated:
+    description: An array of booleans, which are true for each query that
+    returned more than max_rows rows.
+    type: list
+    sample: [
+        false,
+        true
+    ]
 """
 
 from ansible.module_utils.six import string_types
@@ -195,6 +257,71 @@ def get_query(q):
     return text, args
 
 
+def fetch_results(cur, fetch_size=None, max_rows=None, columns_only=False):
+    """
+    Fetches the rows returned by the query executed on the given cursor, at
+    most fetch_size (or 1000) at a time, and returns a tuple of the results,
+    the number of rows fetched, and whether more than max_rows were returned.
+
+    The results are a list of dicts, one for each row, or (if columns_only is
+    set) a dict mapping each column name to a list of values.
+    """
+    batch_size = fetch_size or 1000
+    res = {} if columns_only else []
+    columns = None
+    rows = 0
+    truncated = False
+
+    while max_rows is None or rows < max_rows:
+        n = batch_size if max_rows is None else min(batch_size, max_rows - rows)
+        batch = cur.fetchmany(n)
+        if not batch:
+            break
+
+        # Named cursors have no description until the first fetch.
+        if columns is None:
+            column_names = [desc[0] for desc in cur.description]
+            if columns_only:
+                columns = [res.setdefault(c, []) for c in column_names]
+            else:
+                columns = column_names
+
+        if columns_only:
+            for column, values in zip(columns, zip(*batch)):
+                column.extend(values)
+        else:
+            res.extend(dict(zip(columns, row)) for row in batch)
+        rows += len(batch)
+    else:
+        truncated = cur.fetchone() is not None
+
+    if columns_only and columns is None and cur.description is not None:
+        res = {desc[0]: [] for desc in cur.description}
+
+    return res, rows, truncated
+
+
+def pipelined(queries, pipeline):
+    """
+    Yields lists of (query, text, args) for each query. Each list has only one
+    element unless pipeline is set, in which case consecutive queries with the
+    same text and non-empty arguments are grouped together.
+    """
+    group = []
+    for q in queries:
+        text, args = get_query(q)
+        if group and not (pipeline and args and group[-1][2] and text == group[-1][1]):
+            yield group
+            group = []
+        group.append((q, text, args))
+    if group:
+        yield group
+
+
+def rate(n, elapsed):
+    return round(n / elapsed, 1) if elapsed > 0 else None
+
+
 def main():
     module = AnsibleModule(
         argument_spec=dict(
@@ -202,6 +329,10 @@ def main():
             queries=dict(type="list"),
             query=dict(type="str"),
             autocommit=dict(type="bool", default=False),
+            fetch_size=dict(type="int"),
+            max_rows=dict(type="int"),
+            columns_only=dict(type="bool", default=False),
+            pipeline=dict(type="bool", default=False),
         ),
         required_one_of=[["query", "queries"]],
         mutually_exclusive=[["query", "queries"]],
@@ -234,30 +365,70 @@ def main():
     if autocommit:
         conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
 
+    fetch_size = module.params["fetch_size"]
+    max_rows = module.params["max_rows"]
+    columns_only = module.params["columns_only"]
+
     results = []
     runtimes = []
     rowcounts = []
+    rates = []
+    truncations = []
     try:
-        for q in queries:
-            cur = conn.cursor()
+        for group in pipelined(queries, module.params["pipeline"]):
+            if len(group) > 1:
+                cur = conn.cursor()
+                text = group[0][1]
+
+                starttime = time.time()
+                psycopg2.extras.execute_batch(
+                    cur,
+                    text,
+                    [args for (_, _, args) in group],
+                    page_size=fetch_size or 100,
+                )
+                elapsed = time.time() - starttime
+                changed = True
 
-            text, args = get_query(q)
+                for _ in group:
+                    rowcounts.append(-1)
+                    results.append({} if columns_only else [])
+                    runtimes.append(round(elapsed, 3))
+                    rates.append(rate(len(group), elapsed))
+                    truncations.append(False)
+                cur.close()
+                continue
+
+            (q, text, args) = group[0]
+            if fetch_size:
+                cur = conn.cursor(
+                    name="tpa_query_%d" % len(results), withhold=autocommit
+                )
+                cur.itersize = fetch_size
+            else:
+                cur = conn.cursor()
 
             starttime = time.time()
             cur.execute(text, args)
             runtime = round(time.time() - starttime, 3)
 
-            res = []
-            if cur.description is not None:
-                column_names = [desc[0] for desc in cur.description]
-                for row in cur:
-                    res.append(dict(list(zip(column_names, row))))
+            res = {} if columns_only else []
+            rows = 0
+            truncated = False
+            if fetch_size or cur.description is not None:
+                res, rows, truncated = fetch_results(
+                    cur, fetch_size, max_rows, columns_only
+                )
             elif cur.rowcount:
                 changed = True
+                rows = max(cur.rowcount, 0)
+            elapsed = time.time() - starttime
 
             rowcounts.append(cur.rowcount)
             results.append(res)
             runtimes.append(runtime)
+            rates.append(rate(rows, elapsed))
+            truncations.append(truncated)
             cur.close()
     except Exception as e:
         try:
@@ -278,7 +449,7 @@ def main():
 
     if len(results) == 1:
         results = results[0]
-    if len(results) == 1 and len(results[0]) == 1:
+    if not columns_only and len(results) == 1 and len(results[0]) == 1:
         m.update(results[0])
 
     m["runtimes"] = runtimes
@@ -287,6 +458,8 @@ def main():
     m["rowcounts"] = rowcounts
     if len(rowcounts) == 1:
         m["rowcount"] = rowcounts[0]
+    m["rows_per_second"] = rates
+    m["truncated"] = truncations
 
     module.exit_json(changed=changed, results=results, **m)
 
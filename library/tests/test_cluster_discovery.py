@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+#  © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+import datetime
+import json
+
+import psycopg2.extensions
+
+from ansible.module_utils.basic import jsonify
+
+from cluster_discovery import (
+    BATCHED_DATABASES_QUERY,
+    json_agg_of,
+    json_bundle,
+    major_version,
+    query_results,
+    register_casts,
+    timed,
+)
+
+
+def test_major_version():
+    assert major_version(90624) == "9.6"
+    assert major_version(160004) == "16"
+
+
+def test_json_bundle(mocker):
+    conn = mocker.Mock()
+    cur = conn.cursor.return_value
+    cur.description = [("pid",), ("slots",)]
+    cur.fetchone.return_value = (1234, [{"slot_name": "s1"}])
+
+    r = json_bundle(
+        conn,
+        [
+            ("pid", "pg_backend_pid()"),
+            ("slots", json_agg_of("SELECT * FROM pg_catalog.pg_replication_slots")),
+        ],
+    )
+
+    assert r == {"pid": 1234, "slots": [{"slot_name": "s1"}]}
+
+    # Everything is fetched with one query
+    cur.execute.assert_called_once()
+    (query,) = cur.execute.call_args[0]
+    assert query.startswith("SELECT pg_backend_pid() AS \"pid\",\n")
+    assert "coalesce(json_agg(q), '[]')" in query
+
+
+def test_timed():
+    timings = {}
+    with timed(timings, "section"):
+        pass
+    assert timings["section"] >= 0
+
+
+def test_batched_results_match(mocker):
+    register_casts()
+
+    def cast(oid, value):
+        return psycopg2.extensions.string_types[oid](value, None)
+
+    utc = datetime.timezone(datetime.timedelta(0))
+    ist = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+    # The same rows, as psycopg2 returns them from an ordinary query…
+
+    rows = {
+        "databases": {
+            "datname": "postgres",
+            "datacl": "{=Tc/postgres,postgres=CTc/postgres}",
+            "datfrozenxid": "722",
+            "encoding": "UTF8",
+        },
+        "replication": {
+            "application_name": "2025-01-02T03:04:05",
+            "client_addr": "192.0.2.1",
+            "backend_start": datetime.datetime(2025, 1, 2, 3, 4, 5, 120000, utc),
+            "reply_time": datetime.datetime(2025, 1, 2, 3, 4, 6, tzinfo=ist),
+            "write_lag": cast(1186, "00:00:00.0015"),
+            "sent_lsn": "0/3000148",
+        },
+        "roles": {
+            "rolname": "postgres",
+            "rolconfig": cast(1009, '{"search_path=a, b",work_mem=4MB}'),
+            "memberof": cast(1003, "{pg_monitor}"),
+            "rolvaliduntil": cast(1114, "2030-06-30 00:00:00.5"),
+        },
+    }
+
+    # …and as Postgres represents them in JSON, after the columns that are
+    # cast to text in the batched queries.
+
+    json_rows = {
+        "databases": {
+            "datname": "postgres",
+            "datacl": "{=Tc/postgres,postgres=CTc/postgres}",
+            "datfrozenxid": "722",
+            "encoding": "UTF8",
+        },
+        "replication": {
+            "application_name": "2025-01-02T03:04:05",
+            "client_addr": "192.0.2.1",
+            "backend_start": "2025-01-02T03:04:05.12+00:00",
+            "reply_time": "2025-01-02T03:04:06+05:30",
+            "write_lag": "00:00:00.0015",
+            "sent_lsn": "0/3000148",
+        },
+        "roles": {
+            "rolname": "postgres",
+            "rolconfig": ["search_path=a, b", "work_mem=4MB"],
+            "memberof": ["pg_monitor"],
+            "rolvaliduntil": "2030-06-30T00:00:00.5",
+        },
+    }
+
+    unbatched = {}
+    for name, row in rows.items():
+        conn = mocker.Mock()
+        cur = conn.cursor.return_value
+        cur.description = [(k,) for k in row]
+        cur.__iter__ = mocker.Mock(return_value=iter([tuple(row.values())]))
+        unbatched[name] = query_results(conn, "SELECT …")
+
+    conn = mocker.Mock()
+    cur = conn.cursor.return_value
+    cur.description = [(k,) for k in json_rows]
+    cur.fetchone.return_value = tuple(
+        json.loads(json.dumps([r])) for r in json_rows.values()
+    )
+    batched = json_bundle(conn, [(k, json_agg_of("SELECT …")) for k in json_rows])
+
+    # The facts are the same once the module has returned them.
+
+    assert json.loads(jsonify(batched)) == json.loads(jsonify(unbatched))
+    assert "datacl::text" in BATCHED_DATABASES_QUERY
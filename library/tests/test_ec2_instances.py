@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+#  © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+import itertools
+
+import pytest
+from botocore.exceptions import ClientError
+
+from ec2_instances import launch_spec, provision_all
+
+IDS = itertools.count(1)
+
+
+class FakeEC2:
+    """Implements just enough of the EC2 client API, in the manner of moto, to
+    launch, tag, start, and describe instances in one region. Instances are
+    invisible to the first DescribeInstances after they are launched, and
+    become running on the one after that. Every request is recorded."""
+
+    def __init__(self, region):
+        self.region = region
+        self.instances = {}
+        self.calls = []
+        self.fresh = set()
+
+    def add(self, state="running", **kwargs):
+        i = {
+            "InstanceId": "i-%04d" % next(IDS),
+            "ImageId": kwargs.pop("ImageId", "ami-1"),
+            "InstanceType": kwargs.pop("InstanceType", "t3.micro"),
+            "SubnetId": kwargs.pop("SubnetId", "subnet-1"),
+            "State": {"Name": state},
+            "Tags": [{"Key": k, "Value": v} for k, v in kwargs.pop("Tags", {}).items()],
+            "NetworkInterfaces": [
+                {
+                    "PrivateIpAddress": "10.0.0.%d" % (len(self.instances) + 1),
+                    "Association": {"PublicIp": "192.0.2.%d" % len(self.instances)},
+                }
+            ],
+            "BlockDeviceMappings": [],
+        }
+        self.instances[i["InstanceId"]] = i
+        return i
+
+    def run_instances(self, MinCount, MaxCount, TagSpecifications, **spec):
+        self.calls.append(("run_instances", MaxCount))
+        assert MinCount == MaxCount
+        tags = {t["Key"]: t["Value"] for t in TagSpecifications[0]["Tags"]}
+        launched = []
+        for _ in range(MaxCount):
+            i = self.add(
+                state="pending",
+                ImageId=spec["ImageId"],
+                InstanceType=spec["InstanceType"],
+                SubnetId=spec["NetworkInterfaces"][0]["SubnetId"],
+                Tags=tags,
+            )
+            i["BlockDeviceMappings"] = [
+                {"DeviceName": bd["DeviceName"], "Ebs": {"VolumeId": "vol-x"}}
+                for bd in spec.get("BlockDeviceMappings", [])
+            ]
+            self.fresh.add(i["InstanceId"])
+            launched.append(i)
+        return {"Instances": launched}
+
+    def create_tags(self, Resources, Tags):
+        self.calls.append(("create_tags", len(Resources)))
+        for r in Resources:
+            i = self.instances[r]
+            tags = {t["Key"]: t["Value"] for t in i["Tags"]}
+            tags.update({t["Key"]: t["Value"] for t in Tags})
+            i["Tags"] = [{"Key": k, "Value": v} for k, v in tags.items()]
+
+    def start_instances(self, InstanceIds):
+        self.calls.append(("start_instances", len(InstanceIds)))
+        for k in InstanceIds:
+            self.instances[k]["State"]["Name"] = "pending"
+
+    def describe_instances(self, Filters=None, InstanceIds=None):
+        self.calls.append(("describe_instances", len(InstanceIds or [])))
+        if InstanceIds is not None:
+            if self.fresh & set(InstanceIds):
+                self.fresh.clear()
+                raise ClientError(
+                    {"Error": {"Code": "InvalidInstanceID.NotFound"}},
+                    "DescribeInstances",
+                )
+            found = []
+            for k in InstanceIds:
+                i = self.instances[k]
+                found.append(dict(i, State=dict(i["State"])))
+                if i["State"]["Name"] in ("pending", "stopping"):
+                    i["State"]["Name"] = {"pending": "running"}.get(
+                        i["State"]["Name"], "stopped"
+                    )
+            return {"Reservations": [{"Instances": found}]}
+
+        (cluster, states) = (Filters[0]["Values"], Filters[1]["Values"])
+        found = [
+            i
+            for i in self.instances.values()
+            if {"Key": "Cluster", "Value": cluster[0]} in i["Tags"]
+            and i["State"]["Name"] in states
+        ]
+        return {"Reservations": [{"Instances": found}]}
+
+    def count(self, call):
+        return len([c for c in self.calls if c[0] == call])
+
+
+def instance(name, node, region="eu-west-1", **kwargs):
+    i = dict(
+        Name=name,
+        node=node,
+        region=region,
+        subnet="10.33.0.0/24",
+        type="t3.micro",
+        image="ami-1",
+        volumes=[
+            {
+                "device_name": "/dev/xvda",
+                "ebs": {"volume_size": 16, "volume_type": "gp2", "encrypted": "no"},
+            },
+            {"device_name": "/dev/xvdf", "volume_id": "vol-old"},
+        ],
+    )
+    i.update(kwargs)
+    return i
+
+
+def params(instances, **kwargs):
+    p = dict(
+        instances=instances,
+        cluster_name="speedy",
+        cluster_tags={"Owner": "me"},
+        subnets={
+            "eu-west-1": {"10.33.0.0/24": "subnet-1"},
+            "us-east-1": {"10.34.0.0/24": "subnet-2"},
+        },
+        groups={"eu-west-1": "sg-1", "us-east-1": ["sg-2"]},
+        key_name="speedy_key",
+        instance_profile_name="speedy_profile",
+        user_data={},
+        private_ips={},
+        wait_timeout=10,
+        poll_interval=0,
+    )
+    p.update(kwargs)
+    return p
+
+
+@pytest.fixture
+def ec2():
+    clients = {}
+
+    def connect(region):
+        return clients.setdefault(region, FakeEC2(region))
+
+    connect.clients = clients
+    return connect
+
+
+def tags(result):
+    return result["instances"][0]["tags"]
+
+
+def test_ec2_launch_spec():
+    spec = launch_spec(
+        instance("one", 1, termination_protection="yes", assign_public_ip=False),
+        params([], private_ips={"one": "10.33.0.10"}, user_data={"one": "#!/bin/sh"}),
+    )
+    assert spec == {
+        "ImageId": "ami-1",
+        "InstanceType": "t3.micro",
+        "NetworkInterfaces": [
+            {
+                "DeviceIndex": 0,
+                "SubnetId": "subnet-1",
+                "Groups": ["sg-1"],
+                "AssociatePublicIpAddress": False,
+                "DeleteOnTermination": True,
+                "PrivateIpAddress": "10.33.0.10",
+            }
+        ],
+        "DisableApiTermination": True,
+        "KeyName": "speedy_key",
+        "IamInstanceProfile": {"Name": "speedy_profile"},
+        "BlockDeviceMappings": [
+            {
+                "DeviceName": "/dev/xvda",
+                "Ebs": {"Encrypted": False, "VolumeSize": 16, "VolumeType": "gp2"},
+            }
+        ],
+        "UserData": "#!/bin/sh",
+    }
+
+
+def test_ec2_batches(ec2):
+    instances = [instance("eu%d" % n, n) for n in range(1, 6)]
+    instances += [
+        instance("us%d" % n, n + 5, "us-east-1", subnet="10.34.0.0/24")
+        for n in range(1, 4)
+    ]
+    instances.append(instance("big", 9, type="r5.large"))
+    instances.append(instance("fixed", 10))
+
+    p = params(instances, private_ips={"fixed": "10.33.0.10"})
+    (changed, results, errors) = provision_all(ec2, p)
+
+    assert errors == []
+    assert changed
+    assert [r["item"]["Name"] for r in results] == [i["Name"] for i in instances]
+    for r in results:
+        assert tags(r)["Name"] == r["item"]["Name"]
+        assert tags(r)["node"] == str(r["item"]["node"])
+        assert tags(r)["Cluster"] == "speedy" and tags(r)["Owner"] == "me"
+        assert r["instances"][0]["state"]["name"] == "running"
+        assert r["instances"][0]["network_interfaces"][0]["private_ip_address"]
+    assert results[5]["region"] == "us-east-1"
+
+    # One RunInstances for each distinct launch spec, and one DescribeInstances
+    # per poll in each region.
+    (eu, us) = (ec2.clients["eu-west-1"], ec2.clients["us-east-1"])
+    assert [c for c in eu.calls if c[0] == "run_instances"] == [
+        ("run_instances", 5),
+        ("run_instances", 1),
+        ("run_instances", 1),
+    ]
+    assert [c for c in us.calls if c[0] == "run_instances"] == [("run_instances", 3)]
+    assert eu.count("create_tags") == 5 and us.count("create_tags") == 3
+    assert eu.calls[-1] == ("describe_instances", 7)
+    assert eu.count("describe_instances") == 4
+
+    # Running it again changes nothing.
+    (changed, again, errors) = provision_all(ec2, p)
+    assert not changed and errors == []
+    assert [r["instances"][0]["instance_id"] for r in again] == [
+        r["instances"][0]["instance_id"] for r in results
+    ]
+    assert eu.count("run_instances") == 3
+
+
+def test_ec2_existing(ec2):
+    eu = ec2("eu-west-1")
+    stopped = eu.add(state="stopping", Tags={"Cluster": "speedy", "Name": "one"})
+    eu.add(Tags={"Cluster": "speedy", "Name": "two", "node": "2", "Owner": "me"})
+    orphan = eu.add(Tags={"Cluster": "speedy", "Owner": "me"})
+    eu.add(Tags={"Cluster": "other", "Name": "three"})
+
+    instances = [instance("one", 1), instance("two", 2), instance("three", 3)]
+    (changed, results, errors) = provision_all(ec2, params(instances))
+
+    assert errors == [] and changed
+    ids = [r["instances"][0]["instance_id"] for r in results]
+    assert ids[0] == stopped["InstanceId"] and ids[2] == orphan["InstanceId"]
+    assert [tags(r)["Name"] for r in results] == ["one", "two", "three"]
+    assert tags(results[0])["node"] == "1"
+    assert eu.count("run_instances") == 0
+    assert eu.count("start_instances") == 1
+
+
+def test_ec2_failure(ec2):
+    eu = ec2("eu-west-1")
+    eu.add(Tags={"Cluster": "speedy", "Name": "one", "node": "1", "Owner": "me"})
+
+    def run_instances(**kwargs):
+        raise ClientError(
+            {"Error": {"Code": "InsufficientInstanceCapacity", "Message": "no"}},
+            "RunInstances",
+        )
+
+    ec2("us-east-1").run_instances = run_instances
+
+    instances = [
+        instance("one", 1),
+        instance("two", 2, "us-east-1", subnet="10.34.0.0/24"),
+    ]
+    (changed, results, errors) = provision_all(ec2, params(instances))
+
+    assert not changed
+    assert [r["item"]["Name"] for r in results] == ["one"]
+    assert len(errors) == 1 and errors[0].startswith("us-east-1: ")
+    assert "InsufficientInstanceCapacity" in errors[0]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+#  © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+import gzip
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from package_cache import (
+    MANIFEST,
+    PackageCache,
+    digest,
+    restore_packages,
+    scan_packages,
+    sha256sum,
+    store_packages,
+    update_manifest,
+)
+
+
+class FakeModule:
+    def run_command(self, args, cwd=None, check_rc=False):
+        p = subprocess.run(args, cwd=cwd, capture_output=True, text=True, check=True)
+        return (p.returncode, p.stdout, p.stderr)
+
+    def fail_json(self, **kwargs):
+        raise AssertionError(kwargs["msg"])
+
+
+def build_deb(directory, name, version):
+    """Builds a minimal .deb and returns its filename."""
+    pkg = os.path.join(directory, "build-%s" % name)
+    os.makedirs(os.path.join(pkg, "DEBIAN"))
+    with open(os.path.join(pkg, "DEBIAN", "control"), "w") as f:
+        f.write(
+            "Package: %s\nVersion: %s\nArchitecture: all\n"
+            "Maintainer: TPA <tpa@example.com>\n"
+            "Description: test package\n a longer description\n" % (name, version)
+        )
+    filename = "%s_%s_all.deb" % (name, version.replace(":", "%3a"))
+    subprocess.run(
+        ["dpkg-deb", "--build", pkg, os.path.join(directory, filename)],
+        capture_output=True,
+        check=True,
+    )
+    shutil.rmtree(pkg)
+    return filename
+
+
+def test_update_manifest(tmp_path):
+    (tmp_path / "a.rpm").write_bytes(b"a")
+    (tmp_path / "repodata").mkdir()
+    (tmp_path / "repodata" / "repomd.xml").write_bytes(b"<repomd/>")
+
+    manifest = update_manifest(str(tmp_path))
+    assert sorted(manifest) == ["a.rpm", "repodata/repomd.xml"]
+    assert manifest["a.rpm"]["sha256"] == sha256sum(str(tmp_path / "a.rpm"))
+    assert json.loads((tmp_path / MANIFEST).read_text()) == manifest
+
+    # A file whose size and mtime are unchanged is not read again.
+    stored = json.loads((tmp_path / MANIFEST).read_text())
+    stored["a.rpm"]["sha256"] = "not-really"
+    (tmp_path / MANIFEST).write_text(json.dumps(stored))
+    assert update_manifest(str(tmp_path))["a.rpm"]["sha256"] == "not-really"
+
+    (tmp_path / "a.rpm").write_bytes(b"aa")
+    assert update_manifest(str(tmp_path))["a.rpm"]["sha256"] == sha256sum(
+        str(tmp_path / "a.rpm")
+    )
+
+
+def test_store_and_restore(tmp_path):
+    one = tmp_path / "one"
+    two = tmp_path / "two"
+    one.mkdir()
+    two.mkdir()
+    (one / "a-1.0.rpm").write_bytes(b"a")
+    (one / "b-1.0.rpm").write_bytes(b"b")
+    (one / "repomd.xml").write_bytes(b"<repomd/>")
+
+    cache = PackageCache(str(tmp_path / "cache"), "RedHat/9")
+    manifest = update_manifest(str(one))
+    assert store_packages(cache, str(one), manifest) == ["a-1.0.rpm", "b-1.0.rpm"]
+    assert store_packages(cache, str(one), manifest) == []
+
+    a = {"filename": "a-1.0.rpm", "sha256": manifest["a-1.0.rpm"]["sha256"]}
+    c = {"filename": "c-1.0.rpm", "sha256": "0" * 64}
+    (restored, missing) = restore_packages(
+        str(two), cache, [a, "b-1.0.rpm", c, "d-1.0.rpm"], update_manifest(str(two))
+    )
+    assert restored == [a, "b-1.0.rpm"]
+    assert missing == [c, "d-1.0.rpm"]
+    assert (two / "a-1.0.rpm").read_bytes() == b"a"
+    assert (two / "b-1.0.rpm").read_bytes() == b"b"
+
+    # Packages that are already present are not restored again.
+    (restored, missing) = restore_packages(
+        str(two), cache, [a, "b-1.0.rpm"], update_manifest(str(two))
+    )
+    assert restored == [] and missing == []
+
+
+def test_restore_by_other_checksums(tmp_path):
+    repo = tmp_path / "repo"
+    target = tmp_path / "target"
+    repo.mkdir()
+    target.mkdir()
+    for name in ("a_1_all.deb", "b_1_all.deb", "c_1_all.deb"):
+        (repo / name).write_bytes(name.encode())
+
+    cache = PackageCache(str(tmp_path / "cache"), "Ubuntu/24")
+    store_packages(cache, str(repo), update_manifest(str(repo)))
+
+    def checksum(name, algorithm):
+        return "%s:%s" % (algorithm, digest(str(repo / name), algorithm))
+
+    a = {"filename": "a_1_all.deb", "checksum": checksum("a_1_all.deb", "sha512")}
+    b = {"filename": "b_1_all.deb", "checksum": checksum("b_1_all.deb", "md5")}
+    c = {"filename": "c_1_all.deb", "checksum": "sha1:" + "0" * 40}
+    d = {"filename": "d_1_all.deb", "checksum": checksum("a_1_all.deb", "sha1")}
+    e = {"filename": "a_1_all.deb"}
+
+    # A file whose checksum doesn't match, and anything without a checksum,
+    # must be downloaded.
+    manifest = update_manifest(str(target))
+    (restored, missing) = restore_packages(
+        str(target), cache, [a, b, c, d, e], manifest
+    )
+    assert restored == [a, b]
+    assert missing == [c, d, e]
+    assert (target / "a_1_all.deb").read_bytes() == b"a_1_all.deb"
+
+    # Files that are present with the right checksum are left alone.
+    manifest = update_manifest(str(target))
+    (restored, missing) = restore_packages(str(target), cache, [a, b], manifest)
+    assert restored == [] and missing == []
+    assert "sha512" in manifest["a_1_all.deb"]
+
+
+@pytest.mark.skipif(
+    not (shutil.which("dpkg-scanpackages") and shutil.which("dpkg-deb")),
+    reason="dpkg-dev is not installed",
+)
+def test_scan_packages(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    build_deb(str(repo), "foo", "1:1.0-1")
+    build_deb(str(repo), "bar", "2.0")
+
+    cache = PackageCache(str(tmp_path / "cache"))
+    manifest = update_manifest(str(repo))
+    assert scan_packages(FakeModule(), cache, str(repo), manifest)
+    assert not scan_packages(FakeModule(), cache, str(repo), manifest)
+
+    expected = subprocess.run(
+        ["dpkg-scanpackages", "--type", "deb", "."],
+        cwd=str(repo),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    with gzip.open(str(repo / "Packages.gz"), "rt") as f:
+        packages = f.read()
+    stanzas = sorted(packages.strip().split("\n\n"))
+    assert stanzas == sorted(expected.strip().split("\n\n"))
+
+    # Adding a package scans only that package; the others come from the
+    # cache, even if they are in another directory.
+    other = tmp_path / "other"
+    other.mkdir()
+    for f in os.listdir(str(repo)):
+        if f.endswith(".deb"):
+            shutil.copy(str(repo / f), str(other / f))
+    build_deb(str(other), "baz", "3.0")
+
+    scanned = []
+
+    class CountingModule(FakeModule):
+        def run_command(self, args, cwd=None, check_rc=False):
+            scanned.extend(os.listdir(cwd))
+            return super().run_command(args, cwd=cwd, check_rc=check_rc)
+
+    manifest = update_manifest(str(other))
+    assert scan_packages(CountingModule(), cache, str(other), manifest)
+    assert sorted(set(scanned)) == ["baz_3.0_all.deb"]
+    with gzip.open(str(other / "Packages.gz"), "rt") as f:
+        assert f.read().count("Package: ") == 3
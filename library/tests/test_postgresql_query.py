@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+#  © Copyright EnterpriseDB UK Limited 2015-2025 - All rights reserved.
+
+from postgresql_query import fetch_results, pipelined
+
+
+class FakeCursor:
+    """Returns the given rows from fetchmany()/fetchone(), and (like a named
+    cursor) has no description until the first fetch."""
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = list(rows)
+        self.description = None
+        self.fetches = []
+
+    def fetchmany(self, n):
+        self.description = [(c,) for c in self.columns]
+        self.fetches.append(n)
+        (batch, self.rows) = (self.rows[:n], self.rows[n:])
+        return batch
+
+    def fetchone(self):
+        batch = self.fetchmany(1)
+        return batch[0] if batch else None
+
+
+def test_fetch_results():
+    cur = FakeCursor(["a", "b"], [(i, str(i)) for i in range(5)])
+    (res, rows, truncated) = fetch_results(cur, fetch_size=2)
+    assert res == [{"a": i, "b": str(i)} for i in range(5)]
+    assert (rows, truncated) == (5, False)
+    assert cur.fetches == [2, 2, 2, 2]
+
+
+def test_fetch_results_columns_only():
+    cur = FakeCursor(["a", "b"], [(i, str(i)) for i in range(5)])
+    (res, rows, truncated) = fetch_results(cur, fetch_size=2, columns_only=True)
+    assert res == {"a": [0, 1, 2, 3, 4], "b": ["0", "1", "2", "3", "4"]}
+
+    cur = FakeCursor(["a", "b"], [])
+    (res, rows, truncated) = fetch_results(cur, columns_only=True)
+    assert (res, rows) == ({"a": [], "b": []}, 0)
+
+
+def test_fetch_results_max_rows():
+    cur = FakeCursor(["a"], [(i,) for i in range(5)])
+    (res, rows, truncated) = fetch_results(cur, fetch_size=2, max_rows=3)
+    assert res == [{"a": 0}, {"a": 1}, {"a": 2}]
+    assert (rows, truncated) == (3, True)
+    assert cur.fetches == [2, 1, 1]
+
+    cur = FakeCursor(["a"], [(i,) for i in range(3)])
+    (res, rows, truncated) = fetch_results(cur, max_rows=3)
+    assert (rows, truncated) == (3, False)
+
+
+def test_pipelined():
+    insert = "insert into x(a) values (%s)"
+    queries = [
+        {"text": insert, "args": [1]},
+        {"text": insert, "args": [2]},
+        "SELECT 1",
+        "SELECT 1",
+        {"text": insert, "args": [3]},
+    ]
+
+    groups = [[args for (_, _, args) in g] for g in pipelined(queries, True)]
+    assert groups == [[[1], [2]], [[]], [[]], [[3]]]
+
+    groups = [[args for (_, _, args) in g] for g in pipelined(queries, False)]
+    assert groups == [[[1]], [[2]], [[]], [[]], [[3]]]